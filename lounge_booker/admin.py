@@ -1,11 +1,39 @@
-from django.contrib import admin
+import datetime
 
-from .models import BusinessHour, Lounge, Setting, Table, Booking
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
+
+from .catalogue import lounge_catalogue
+from .forms import GenerateTablesForm
+from .models import BookingSeries, BusinessHour, Lounge, Occupancy, Setting, Table, Booking, WaitlistEntry
+from .occupancy import hourly_report
+from .pagination import EstimatedCountPaginator
 
 # Register your models here.
+class BusinessHourFormSet(BaseInlineFormSet):
+    # UniqueConstraint is not checked by model forms, so catch a repeated
+    # day here rather than as an IntegrityError on save.
+    def clean(self):
+        super().clean()
+        days = [
+            form.cleaned_data["day"] for form in self.forms
+            if form.cleaned_data.get("day") is not None and not form.cleaned_data.get("DELETE")
+        ]
+        if len(days) != len(set(days)):
+            raise ValidationError("Each day can only have one set of business hours.")
+
+
 class BusinessHourInline(admin.TabularInline):
     model = BusinessHour
+    formset = BusinessHourFormSet
     extra = 1
+    max_num = 7
     show_change_link = True
 
 
@@ -30,9 +58,139 @@ class LoungeAdmin(admin.ModelAdmin):
         "created_at",
         "modified_at",
     )
+    search_fields = ("name", "postcode")
+    readonly_fields = ("table_list",)
     inlines = (BusinessHourInline, TableInline, SettingInline,)
+    actions = ("generate_tables",)
+    # Past this many tables the inline gives way to the paginated Table changelist.
+    inline_table_limit = 50
+
+    def get_object(self, request, object_id, from_field=None):
+        lounge = super().get_object(request, object_id, from_field)
+        if lounge is not None:
+            lounge.table_count = lounge.tables.count()
+        return lounge
+
+    def get_inlines(self, request, obj):
+        inlines = super().get_inlines(request, obj)
+        if obj is not None and obj.table_count > self.inline_table_limit:
+            inlines = tuple(inline for inline in inlines if inline is not TableInline)
+        return inlines
+
+    def table_list(self, obj):
+        if obj is None or obj.pk is None:
+            return "-"
+        url = reverse("admin:lounge_booker_table_changelist")
+        return format_html('<a href="{}?lounge__id__exact={}">{} table(s)</a>', url, obj.pk, obj.table_count)
+    table_list.short_description = "Tables"
+
+    def generate_tables(self, request, queryset):
+        form = GenerateTablesForm(request.POST if "apply" in request.POST else None)
+        if form.is_valid():
+            created = form.save(list(queryset))
+            self.message_user(request, f"Created {created} table(s).", messages.SUCCESS)
+            return None
+        return TemplateResponse(request, "generate_tables.html", {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "Generate tables",
+            "form": form,
+            "lounges": queryset,
+            "action_checkbox_name": admin.helpers.ACTION_CHECKBOX_NAME,
+        })
+    generate_tables.short_description = "Generate tables for the selected lounges"
+
+
+class LoungeIdFilter(admin.ListFilter):
+    """Filters on a lounge id typed in, like a raw id field.
+
+    ``list_filter = ("lounge",)`` reads and links every lounge on each
+    page load; this reads only the chosen one, to show its name.
+    """
+    title = "lounge"
+    parameter_name = "lounge"
+    template = "lounge_filter.html"
+
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.value = params.pop(self.parameter_name, None) or None
+        self.other_params = [
+            (name, value) for name, value in request.GET.items() if name not in (self.parameter_name, "p")
+        ]
+        self.lounge = None
+        if self.value is not None:
+            try:
+                self.lounge = Lounge.objects.only("name").get(pk=self.value)
+            except (Lounge.DoesNotExist, ValueError):
+                raise IncorrectLookupParameters(f"No lounge {self.value!r}.")
+
+    def has_output(self):
+        return True
+
+    def expected_parameters(self):
+        return [self.parameter_name]
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.lounge is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "display": "All",
+        }
+        if self.lounge is not None:
+            yield {
+                "selected": True,
+                "query_string": changelist.get_query_string({self.parameter_name: self.value}),
+                "display": self.lounge.name,
+            }
+
+    def queryset(self, request, queryset):
+        if self.lounge is not None:
+            return queryset.filter(lounge=self.lounge)
+        return queryset
+
+
+@admin.register(Table)
+class TableAdmin(admin.ModelAdmin):
+    list_display = ("name", "lounge", "capacity")
+    list_select_related = ("lounge",)
+    list_filter = (LoungeIdFilter,)
+    list_editable = ("capacity",)
+    search_fields = ("name", "lounge__name")
+    autocomplete_fields = ("lounge",)
 
 
+class BookingDateFilter(admin.SimpleListFilter):
+    """Fixed date ranges, each an index range scan on ``date``.
+
+    Stands in for ``date_hierarchy``, whose year and month links come from
+    a ``SELECT DISTINCT`` over every booking.
+    """
+    title = "date"
+    parameter_name = "when"
+
+    def lookups(self, request, model_admin):
+        return (
+            ("upcoming", "Upcoming"),
+            ("today", "Today"),
+            ("past_7_days", "Past 7 days"),
+            ("past_30_days", "Past 30 days"),
+            ("past", "Past"),
+        )
+
+    def queryset(self, request, queryset):
+        now = timezone.now()
+        today = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time.min))
+        ranges = {
+            "upcoming": {"date__gte": now},
+            "today": {"date__gte": today, "date__lt": today + datetime.timedelta(days=1)},
+            "past_7_days": {"date__gte": now - datetime.timedelta(days=7), "date__lt": now},
+            "past_30_days": {"date__gte": now - datetime.timedelta(days=30), "date__lt": now},
+            "past": {"date__lt": now},
+        }
+        if self.value() in ranges:
+            return queryset.filter(**ranges[self.value()])
+        return queryset
+
 
 @admin.register(Booking)
 class BookingAdmin(admin.ModelAdmin):
@@ -44,4 +202,78 @@ class BookingAdmin(admin.ModelAdmin):
         "created_at",
         "modified_at",
     )
+    list_select_related = ("user", "lounge", "table")
+    list_filter = (BookingDateFilter, LoungeIdFilter)
+    ordering = ("-date",)
+    # Search boxes instead of <select>s holding every user and table.
+    raw_id_fields = ("user", "table")
+    autocomplete_fields = ("lounge",)
+    paginator = EstimatedCountPaginator
+    # The "N total" link is a second COUNT(*) over the whole table.
+    show_full_result_count = False
+
+
+@admin.register(WaitlistEntry)
+class WaitlistEntryAdmin(admin.ModelAdmin):
+    list_display = ("user", "lounge", "date", "total_guests", "fulfilled_at", "created_at")
+    list_select_related = ("user", "lounge", "booking")
+    list_filter = (LoungeIdFilter,)
+    raw_id_fields = ("user", "booking")
+    autocomplete_fields = ("lounge",)
+
+
+@admin.register(BookingSeries)
+class BookingSeriesAdmin(admin.ModelAdmin):
+    list_display = ("user", "lounge", "table", "start", "frequency", "interval", "count")
+    list_select_related = ("user", "lounge", "table")
+    list_filter = (LoungeIdFilter,)
+    raw_id_fields = ("user", "table")
+    autocomplete_fields = ("lounge",)
+
+
+@admin.register(Occupancy)
+class OccupancyAdmin(admin.ModelAdmin):
+    """The changelist is an hourly occupancy report for one lounge and day.
+
+    It reads only the ``Occupancy`` aggregate, so it costs the same however
+    much booking history a lounge has. Rows are maintained automatically
+    and can be recomputed with ``manage.py rebuild_occupancy``.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        lounges = lounge_catalogue()
+        try:
+            day = datetime.date.fromisoformat(request.GET.get("day", ""))
+        except ValueError:
+            day = timezone.localdate()
+        lounge = next((lounge for lounge in lounges if str(lounge.id) == request.GET.get("lounge")), None)
+        if lounge is None and lounges:
+            lounge = lounges[0]
+
+        tables, rows = hourly_report(lounge, day) if lounge else ([], [])
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": f"Occupancy for {lounge}" if lounge else "Occupancy",
+            "lounges": lounges,
+            "lounge": lounge,
+            "day": day,
+            "previous_day": day - datetime.timedelta(days=1),
+            "next_day": day + datetime.timedelta(days=1),
+            "tables": tables,
+            "rows": rows,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, "occupancy_report.html", context)
 
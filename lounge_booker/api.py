@@ -0,0 +1,309 @@
+"""JSON API for the mobile app: lounges, their tables and availability, and
+the signed-in user's bookings.
+
+Clients sign in through ``/login`` and send the session cookie, plus the
+CSRF token in ``X-CSRFToken`` on writes, exactly like the HTML forms.
+
+Reads are conditional. Before a view runs, its probe reads only
+``MAX(modified_at)`` and ``COUNT(*)`` of the rows the response is built
+from, in one query, and hashes them into an ETag. A client whose
+``If-None-Match`` still matches gets a 304 without a row being loaded or
+serialised. Deleted rows leave no ``modified_at`` behind and only show up
+in the counts, so collections carry just the ETag; a single booking also
+carries ``Last-Modified``. Writes honour ``If-Match`` and
+``If-Unmodified-Since`` with a 412 for a client editing a stale copy.
+"""
+import datetime
+import hashlib
+import json
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_http_methods
+
+from .availability import book_table, booking_duration, minimum_guests, resubmitted_booking
+from .forms import BookingForm, lounge_for_booking
+from .models import Booking, BusinessHour, Lounge, Table
+from .pagination import keyset_page
+from .tasks import enqueue
+from .views import availability_payload, availability_range
+from .waitlist import cancel_booking
+
+SAFE_METHODS = ("GET", "HEAD")
+
+
+def endpoint(probe, methods=SAFE_METHODS):
+    """Wrap an API view with sign-in, allowed ``methods`` and conditional requests.
+
+    ``probe(request, **kwargs)`` returns ``(etag, last_modified)``, either of
+    which may be ``None``, or ``None`` when there is nothing to compare, e.g.
+    a missing object the view will answer 404 for. Reads and successful
+    ``PATCH``es carry the validators, the latter probed after the change.
+    """
+    def decorator(view):
+        @require_http_methods(methods)
+        @wraps(view)
+        def wrapper(request, **kwargs):
+            if not request.user.is_authenticated:
+                return JsonResponse({"error": "Please log in."}, status=401)
+
+            conditional = request.method in SAFE_METHODS or any(
+                header in request.META for header in ("HTTP_IF_MATCH", "HTTP_IF_UNMODIFIED_SINCE")
+            )
+            state = probe(request, **kwargs) if conditional else None
+            etag, last_modified = state or (None, None)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is not None:
+                return response
+
+            response = view(request, **kwargs)
+            if response.status_code != 200 or request.method == "POST":
+                return response
+            if request.method not in SAFE_METHODS:
+                # The write changed the resource: send its new validators so
+                # the client's next conditional write does not fail with 412.
+                etag, last_modified = probe(request, **kwargs) or (None, None)
+                timestamp = int(last_modified.timestamp()) if last_modified else None
+            if etag:
+                response["ETag"] = etag
+            if timestamp is not None:
+                response["Last-Modified"] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
+
+
+def fingerprint(*values):
+    """A strong ETag for a probe's result."""
+    return quote_etag(hashlib.sha1(repr(values).encode()).hexdigest())
+
+
+def changes(queryset):
+    """``MAX(modified_at)`` and ``COUNT(*)`` of ``queryset``, filtered on
+    ``lounge=OuterRef("pk")``, as subqueries of a probe on the lounge row."""
+    rows = queryset.order_by().values("lounge")
+    return (
+        Subquery(rows.annotate(changed=Max("modified_at")).values("changed")),
+        Subquery(rows.annotate(rows=Count("pk")).values("rows")),
+    )
+
+
+def lounge_probe(lounge_id, **related):
+    """Fingerprint ``lounge_id``, its setting and the ``related`` querysets in one query."""
+    annotations = {}
+    for name, queryset in related.items():
+        annotations[f"{name}_changed"], annotations[f"{name}_rows"] = changes(queryset)
+    row = (
+        Lounge.objects.filter(pk=lounge_id)
+        .annotate(**annotations)
+        .values_list("modified_at", "setting__modified_at", *annotations)
+        .first()
+    )
+    return None if row is None else (fingerprint(*row), None)
+
+
+def read_body(request):
+    """The request's JSON object, or ``None`` if it is not one."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def invalid_body():
+    return JsonResponse({"error": "Please send a JSON object."}, status=400)
+
+
+def form_data(data, booking=None):
+    """BookingForm data from a JSON body; fields left out keep ``booking``'s values."""
+    date = data.get("date", booking.date if booking else None)
+    if isinstance(date, str):
+        # ISO 8601 with or without an offset; anything else is left for the form to reject.
+        date = parse_datetime(date) or date
+    return {
+        "table": data.get("table", booking.table_id if booking else None),
+        "date": date,
+        "total_guests": data.get("total_guests", booking.total_guests if booking else None),
+        "idempotency_key": data.get("idempotency_key") or "",
+    }
+
+
+def form_errors(form):
+    return JsonResponse({"errors": form.errors.get_json_data()}, status=400)
+
+
+def booking_json(booking):
+    return {
+        "id": booking.id,
+        "lounge": booking.lounge_id,
+        "table": booking.table_id,
+        "date": timezone.localtime(booking.date).isoformat(),
+        "total_guests": booking.total_guests,
+        "series": booking.series_id,
+        "modified_at": booking.modified_at.isoformat(),
+    }
+
+
+def lounges_probe(request):
+    state = Lounge.objects.aggregate(changed=Max("modified_at"), rows=Count("pk"))
+    return fingerprint(state["changed"], state["rows"]), None
+
+
+@endpoint(lounges_probe)
+def lounges(request):
+    rows = Lounge.objects.order_by("id").values("id", "name", "address1", "address2", "postcode")
+    return JsonResponse({"lounges": list(rows)})
+
+
+def lounge_detail_probe(request, lounge_id):
+    return lounge_probe(lounge_id, tables=Table.objects.filter(lounge=OuterRef("pk")))
+
+
+@endpoint(lounge_detail_probe)
+def lounge_detail(request, lounge_id):
+    lounge = get_object_or_404(lounge_for_booking(), pk=lounge_id)
+    return JsonResponse({
+        "id": lounge.id,
+        "name": lounge.name,
+        "address1": lounge.address1,
+        "address2": lounge.address2,
+        "postcode": lounge.postcode,
+        "min_guest": minimum_guests(lounge),
+        "duration": int(booking_duration(lounge).total_seconds() // 60),
+        "tables": [
+            {"id": table.id, "name": table.name, "capacity": table.capacity}
+            for table in sorted(lounge.tables.all(), key=lambda table: table.id)
+        ],
+    })
+
+
+def availability_probe(request, lounge_id):
+    try:
+        first_day, last_day, _ = availability_range(request.GET)
+    except ValueError:
+        return None
+    # Opening hours can run past midnight, and no booking lasts a day, so
+    # a day either side covers every booking that can touch a slot.
+    since = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min)) - datetime.timedelta(days=1)
+    until = timezone.make_aware(datetime.datetime.combine(last_day, datetime.time.min)) + datetime.timedelta(days=2)
+    probe = lounge_probe(
+        lounge_id,
+        tables=Table.objects.filter(lounge=OuterRef("pk")),
+        hours=BusinessHour.objects.filter(lounge=OuterRef("pk")),
+        bookings=Booking.objects.filter(lounge=OuterRef("pk"), date__gte=since, date__lt=until),
+    )
+    if probe is None or first_day > timezone.localdate():
+        return probe
+    # Today's slots drop out as they start.
+    now = timezone.now().replace(second=0, microsecond=0)
+    return fingerprint(probe[0], now), None
+
+
+@endpoint(availability_probe)
+def lounge_availability(request, lounge_id):
+    lounge = get_object_or_404(Lounge.objects.select_related("setting"), id=lounge_id)
+    payload, status = availability_payload(lounge, request.GET)
+    return JsonResponse(payload, status=status)
+
+
+def user_bookings(request):
+    bookings = Booking.objects.filter(user=request.user)
+    if request.GET.get("when") == "past":
+        return bookings.filter(date__lt=timezone.now())
+    return bookings.filter(date__gte=timezone.now())
+
+
+def bookings_probe(request):
+    state = user_bookings(request).aggregate(changed=Max("modified_at"), rows=Count("pk"))
+    return fingerprint(state["changed"], state["rows"]), None
+
+
+@endpoint(bookings_probe, methods=["GET", "HEAD", "POST"])
+def bookings(request):
+    if request.method == "POST":
+        return create_booking(request)
+
+    page, next_cursor = keyset_page(
+        user_bookings(request), request.GET.get("cursor"), descending=request.GET.get("when") == "past",
+    )
+    return JsonResponse({"bookings": [booking_json(booking) for booking in page], "next": next_cursor})
+
+
+def create_booking(request):
+    data = read_body(request)
+    if data is None:
+        return invalid_body()
+    try:
+        lounge = lounge_for_booking().get(pk=data.get("lounge"))
+    except (Lounge.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({"errors": {"lounge": [{"message": "Please choose a lounge.", "code": "invalid"}]}}, status=400)
+
+    form = BookingForm(lounge, form_data(data))
+    if form.is_valid():
+        booking = form.save(commit=False)
+        booking.user = request.user
+        booking.lounge = lounge
+        booking.idempotency_key = form.cleaned_data["idempotency_key"] or None
+        try:
+            with transaction.atomic():
+                saved = book_table(booking, booking_duration(lounge), form.submitted("table") is None)
+                if saved is booking:
+                    enqueue("booking_confirmation", booking=booking.pk, action="booked")
+        except ValidationError as error:
+            form.add_error(None, error)
+        else:
+            return JsonResponse(booking_json(saved), status=201 if saved is booking else 200)
+    else:
+        # A retried request fails validation against its own first booking;
+        # one sent again with other details gets its errors.
+        existing = resubmitted_booking(
+            request.user, form.data.get("idempotency_key"),
+            *(form.submitted(name) for name in ("table", "date", "total_guests")),
+        )
+        if existing is not None:
+            return JsonResponse(booking_json(existing))
+    return form_errors(form)
+
+
+def booking_probe(request, booking_id):
+    changed = Booking.objects.filter(pk=booking_id, user=request.user).values_list("modified_at", flat=True).first()
+    return None if changed is None else (fingerprint(booking_id, changed), changed)
+
+
+@endpoint(booking_probe, methods=["GET", "HEAD", "PATCH", "DELETE"])
+def booking_detail(request, booking_id):
+    booking = get_object_or_404(
+        Booking.objects.select_related("lounge__setting").prefetch_related("lounge__tables"),
+        pk=booking_id, user=request.user,
+    )
+
+    if request.method == "DELETE":
+        cancel_booking(booking)
+        return HttpResponse(status=204)
+
+    if request.method == "PATCH":
+        data = read_body(request)
+        if data is None:
+            return invalid_body()
+        form = BookingForm(booking.lounge, form_data(data, booking), instance=booking)
+        if not form.is_valid():
+            return form_errors(form)
+        try:
+            with transaction.atomic():
+                book_table(form.save(commit=False), booking_duration(booking.lounge))
+                enqueue("booking_confirmation", booking=booking.pk, action="updated")
+        except ValidationError as error:
+            form.add_error(None, error)
+            return form_errors(form)
+
+    return JsonResponse(booking_json(booking))
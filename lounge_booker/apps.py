@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class LoungeBookerConfig(AppConfig):
     name = 'lounge_booker'
+
+    def ready(self):
+        from . import signals  # noqa: F401
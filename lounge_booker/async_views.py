@@ -0,0 +1,64 @@
+"""Async twins of the read-only JSON endpoints, for serving under ASGI.
+
+Django 3.1's ORM is synchronous, so each view does its database work in a
+single ``sync_to_async(thread_sensitive=True)`` call: one hop to the thread
+Django keeps for sync code, with the event loop free to accept and hold
+other connections meanwhile. The hop hands back fully loaded rows, so the
+work that needs no database, such as JSON encoding, stays on the loop.
+
+The booking form page has no twin: its form and template read the
+database lazily while rendering, so none of its work could leave the hop.
+"""
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response
+
+from . import api, views
+from .models import Lounge
+from .pagination import keyset_page
+
+
+@sync_to_async(thread_sensitive=True)
+def _availability(request, lounge_id):
+    if not request.user.is_authenticated:
+        return None
+    lounge = get_object_or_404(Lounge.objects.select_related("setting"), id=lounge_id)
+    return views.availability_payload(lounge, request.GET)
+
+
+async def lounge_availability(request, lounge_id):
+    result = await _availability(request, lounge_id)
+    if result is None:
+        return redirect("lounge_booker:login")
+    payload, status = result
+    return JsonResponse(payload, status=status)
+
+
+@sync_to_async(thread_sensitive=True)
+def _bookings(request):
+    """The probe and, unless the client's copy is current, one page of rows;
+    or the response to send instead."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Please log in."}, status=401)
+    etag, _ = api.bookings_probe(request)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+    page, next_cursor = keyset_page(
+        api.user_bookings(request), request.GET.get("cursor"), descending=request.GET.get("when") == "past",
+    )
+    return etag, page, next_cursor
+
+
+async def bookings(request):
+    """``GET /api/bookings``, ETag and all, without the create."""
+    if request.method not in api.SAFE_METHODS:
+        return HttpResponseNotAllowed(api.SAFE_METHODS)
+    result = await _bookings(request)
+    if isinstance(result, HttpResponse):
+        return result
+    etag, page, next_cursor = result
+    response = JsonResponse({"bookings": [api.booking_json(booking) for booking in page], "next": next_cursor})
+    response["ETag"] = etag
+    return response
@@ -0,0 +1,286 @@
+import bisect
+import datetime
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Booking, BusinessHour, Setting, Table
+
+DEFAULT_BOOKING_DURATION = 120  # minutes
+OPEN_ALL_DAY = ((datetime.time.min, datetime.time.min),)
+SCHEDULE_CACHE_KEY = "lounge_booker:schedule:{}"
+# The BusinessHour signals only clear the cache of the process that saved
+# the change; with a per-process cache the others see it after this long.
+SCHEDULE_TIMEOUT = 60
+TABLE_TAKEN = "This table is already booked at that time, please choose another."
+KEY_REUSED = "This form has already made a booking with other details; submit it again to book these."
+
+_MISSING = object()
+
+
+def booking_duration(lounge):
+    """How long a single booking at ``lounge`` holds its table."""
+    try:
+        minutes = lounge.setting.booking_duration
+    except Setting.DoesNotExist:
+        minutes = DEFAULT_BOOKING_DURATION
+    return datetime.timedelta(minutes=minutes)
+
+
+def minimum_guests(lounge):
+    try:
+        return lounge.setting.min_guest
+    except Setting.DoesNotExist:
+        return 1
+
+
+def overlapping_bookings(table, start, duration, exclude_id=None):
+    """Bookings on ``table`` that overlap ``[start, start + duration)``.
+
+    Every booking at a lounge lasts the same ``duration``, so a clashing
+    booking has to start inside ``(start - duration, start + duration)``.
+    That keeps the lookup a range scan on the ``(table, date)`` index rather
+    than a scan over the table's whole booking history.
+    """
+    bookings = Booking.objects.filter(
+        table=table, date__gt=start - duration, date__lt=start + duration,
+    )
+    if exclude_id is not None:
+        bookings = bookings.exclude(pk=exclude_id)
+    return bookings
+
+
+def is_table_free(table, start, duration, exclude_id=None):
+    return not overlapping_bookings(table, start, duration, exclude_id).exists()
+
+
+def busy_tables(lounge, start, duration, exclude_id=None):
+    """Ids of ``lounge``'s tables that are booked at some point of ``[start, start + duration)``."""
+    bookings = Booking.objects.filter(
+        lounge=lounge, date__gt=start - duration, date__lt=start + duration,
+    )
+    if exclude_id is not None:
+        bookings = bookings.exclude(pk=exclude_id)
+    return set(bookings.values_list("table_id", flat=True))
+
+
+class SeatingPlan:
+    """A lounge's tables sorted by capacity, for best-fit seating.
+
+    A bisect finds the smallest tables that seat a party, and the scan up
+    from there stops at the first one that is not busy.
+    """
+
+    def __init__(self, tables):
+        self.tables = sorted(tables, key=lambda table: (table.capacity, table.id))
+        self.capacities = [table.capacity for table in self.tables]
+
+    def best_fit(self, guests, busy=()):
+        """The smallest table seating ``guests`` whose id is not in ``busy``, or ``None``."""
+        for table in self.tables[bisect.bisect_left(self.capacities, guests):]:
+            if table.id not in busy:
+                return table
+        return None
+
+
+def best_fit_table(lounge, guests, start, duration, exclude_id=None):
+    """The smallest table at ``lounge`` free for a party of ``guests`` at ``start``.
+
+    Uses the lounge's prefetched tables and one ``(lounge, date)`` range
+    query for the bookings in the way.
+    """
+    plan = SeatingPlan(lounge.tables.all())
+    return plan.best_fit(guests, busy_tables(lounge, start, duration, exclude_id))
+
+
+def resubmitted_booking(user, idempotency_key, table, date, total_guests):
+    """The booking ``user`` already made with exactly these details using the
+    form carrying this key, or ``None``.
+
+    ``table`` is ``None`` when the form left the choice of table to us.
+    """
+    if not idempotency_key or date is None:
+        return None
+    bookings = Booking.objects.filter(
+        user=user, idempotency_key=idempotency_key, date=date, total_guests=total_guests,
+    )
+    if table is not None:
+        bookings = bookings.filter(table=table)
+    return bookings.first()
+
+
+def is_resubmission(user, idempotency_key, table, date, total_guests):
+    """Whether ``user`` already booked exactly this with the form carrying this key."""
+    return resubmitted_booking(user, idempotency_key, table, date, total_guests) is not None
+
+
+def earlier_booking(booking, any_table=False):
+    """The booking this user already made with ``booking``'s idempotency key.
+
+    One with other details means the form was sent back changed rather than
+    repeated, and raises a ValidationError. ``any_table`` says the table was
+    picked for the party instead of chosen, so a repeat may have been seated
+    at another one.
+    """
+    existing = Booking.objects.filter(user_id=booking.user_id, idempotency_key=booking.idempotency_key).first()
+    if existing is None:
+        return None
+    if (existing.date, existing.total_guests) != (booking.date, booking.total_guests) or (
+        not any_table and existing.table_id != booking.table_id
+    ):
+        raise ValidationError(KEY_REUSED)
+    return existing
+
+
+def book_table(booking, duration, any_table=False):
+    """Save ``booking`` unless a concurrent request has taken its slot.
+
+    Form validation runs outside any lock, so two requests for the same
+    table can both pass it. Locking the table row here makes them queue up,
+    and the second re-checks for clashes only after the first has committed.
+    A new booking carrying an ``idempotency_key`` that this user has
+    already used is a resubmission: the earlier booking is returned instead,
+    provided it has the same details (see ``earlier_booking``).
+    """
+    key = booking.idempotency_key if booking.pk is None else None
+    try:
+        with transaction.atomic():
+            Table.objects.select_for_update().get(pk=booking.table_id)
+            if key:
+                existing = earlier_booking(booking, any_table)
+                if existing is not None:
+                    return existing
+            if not is_table_free(booking.table_id, booking.date, duration, exclude_id=booking.pk):
+                raise ValidationError({"date": [TABLE_TAKEN]})
+            booking.save()
+    except IntegrityError:
+        # The same submission raced in on another table; the unique
+        # (user, idempotency_key) constraint kept the first one.
+        if not key:
+            raise
+        return earlier_booking(booking, any_table)
+    return booking
+
+
+def compile_schedule(lounge_id):
+    """Opening intervals for each weekday (Monday first) at a lounge.
+
+    Each entry is a tuple of ``(start_time, finish_time)`` pairs; a finish at
+    or before the start runs past midnight. A lounge without any business
+    hours is returned as ``None`` and treated as always open.
+    """
+    hours = BusinessHour.objects.filter(lounge_id=lounge_id).order_by("day", "start_time")
+    schedule = [[] for _ in range(7)]
+    has_hours = False
+    for hour in hours:
+        has_hours = True
+        if not hour.closed:
+            schedule[hour.day].append((hour.start_time, hour.finish_time))
+    if not has_hours:
+        return None
+    return tuple(tuple(intervals) for intervals in schedule)
+
+
+def weekly_schedule(lounge):
+    """The compiled schedule for ``lounge``, kept in the cache.
+
+    The ``BusinessHour`` signals in ``signals.py`` drop an entry whenever a
+    lounge's hours change; ``SCHEDULE_TIMEOUT`` bounds how long any other
+    process can keep serving the old one.
+    """
+    key = SCHEDULE_CACHE_KEY.format(lounge.pk)
+    schedule = cache.get(key, _MISSING)
+    if schedule is _MISSING:
+        schedule = compile_schedule(lounge.pk)
+        cache.set(key, schedule, SCHEDULE_TIMEOUT)
+    return schedule
+
+
+def invalidate_schedule(lounge_id):
+    cache.delete(SCHEDULE_CACHE_KEY.format(lounge_id))
+
+
+def opening_intervals(schedule, day):
+    """Aware ``(opens, closes)`` datetimes for the calendar date ``day``."""
+    intervals = OPEN_ALL_DAY if schedule is None else schedule[day.weekday()]
+    for start_time, finish_time in intervals:
+        opens = timezone.make_aware(datetime.datetime.combine(day, start_time))
+        closes = timezone.make_aware(datetime.datetime.combine(day, finish_time))
+        if closes <= opens:
+            closes += datetime.timedelta(days=1)
+        yield opens, closes
+
+
+def is_open(schedule, start, duration):
+    """Whether ``[start, start + duration)`` fits inside one opening interval."""
+    if schedule is None:
+        return True
+    end = start + duration
+    day = timezone.localtime(start).date()
+    # Intervals from the day before can run past midnight into ``day``.
+    for opening_day in (day - datetime.timedelta(days=1), day):
+        for opens, closes in opening_intervals(schedule, opening_day):
+            if opens <= start and end <= closes:
+                return True
+    return False
+
+
+def candidate_slots(schedule, first_day, last_day, duration):
+    """Every slot start between ``first_day`` and ``last_day`` inclusive."""
+    now = timezone.now()
+    slots = []
+    day = first_day
+    while day <= last_day:
+        for opens, closes in opening_intervals(schedule, day):
+            start = opens
+            while start + duration <= closes:
+                if start >= now:
+                    slots.append(start)
+                start += duration
+        day += datetime.timedelta(days=1)
+    return sorted(set(slots))
+
+
+def free_slots(lounge, first_day, last_day, guests=None):
+    """Free ``(table, start)`` pairs at ``lounge`` between two dates.
+
+    Tables and the bookings that could touch the range are each loaded in a
+    single query. Bookings come back sorted per table and all last the same
+    duration, so one forward sweep per table over the sorted candidate slots
+    finds the gaps without re-querying.
+    """
+    duration = booking_duration(lounge)
+    tables = list(
+        lounge.tables.filter(
+            capacity__gte=max(guests or 0, minimum_guests(lounge))
+        ).order_by("id")
+    )
+    slots = candidate_slots(weekly_schedule(lounge), first_day, last_day, duration)
+    if not tables or not slots:
+        return []
+
+    booked = {table.id: [] for table in tables}
+    bookings = (
+        Booking.objects.filter(
+            table_id__in=booked,
+            date__gt=slots[0] - duration,
+            date__lt=slots[-1] + duration,
+        )
+        .order_by("table_id", "date")
+        .values_list("table_id", "date")
+    )
+    for table_id, date in bookings:
+        booked[table_id].append(date)
+
+    free = []
+    for table in tables:
+        starts = booked[table.id]
+        index = 0
+        for slot in slots:
+            while index < len(starts) and starts[index] + duration <= slot:
+                index += 1
+            if index == len(starts) or starts[index] >= slot + duration:
+                free.append((table, slot))
+    return free
@@ -0,0 +1,449 @@
+"""Seeding and timing helpers behind the ``benchmark`` management command."""
+import asyncio
+import copy
+import datetime
+import itertools
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from project.db.pool import ConnectionPool
+
+from . import occupancy
+from .availability import SeatingPlan
+from .factories import (
+    BookingFactory,
+    BusinessHourFactory,
+    LoungeBookFactory,
+    LoungeFactory,
+    SettingFactory,
+    UserFactory,
+)
+from .models import Booking, BusinessHour, Lounge, Setting, Table
+from .throttle import reset_login_attempts
+
+OPENING_TIME = datetime.time(10, 0)
+CLOSING_TIME = datetime.time(22, 0)
+SLOTS_PER_DAY = 6  # two-hour bookings between opening and closing
+BATCH_SIZE = 5000
+DATE_FORMAT = "%Y-%m-%dT%H:%M"
+
+
+def slot(first_day, index):
+    """The ``index``-th bookable slot counting from opening on ``first_day``."""
+    day = first_day + datetime.timedelta(days=index // SLOTS_PER_DAY)
+    hour = OPENING_TIME.hour + 2 * (index % SLOTS_PER_DAY)
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time(hour)))
+
+
+def bulk_create(model, objects):
+    """Insert ``objects`` (any iterable) in fixed-size batches."""
+    objects = iter(objects)
+    while True:
+        batch = list(itertools.islice(objects, BATCH_SIZE))
+        if not batch:
+            break
+        model.objects.bulk_create(batch)
+
+
+def seed(lounges, tables_per_lounge, bookings, users=20):
+    """Fill an empty database with realistic booking volumes.
+
+    Bookings are spread over the tables so that no two overlap, half of them
+    in the past and half in the future, and every user owns an equal share.
+    Returns what the flows need: a user to act as, the lounge ids and the
+    first day with no seeded bookings on it.
+    """
+    bulk_create(User, (UserFactory.build(username=f"bench-{i}", email=f"bench-{i}@test.com") for i in range(users)))
+    bulk_create(Lounge, (LoungeFactory.build(name=f"Lounge {i}") for i in range(lounges)))
+    all_lounges = list(Lounge.objects.order_by("id"))
+
+    bulk_create(Setting, (SettingFactory.build(lounge=lounge, min_guest=1) for lounge in all_lounges))
+    bulk_create(BusinessHour, (
+        BusinessHourFactory.build(lounge=lounge, day=day, start_time=OPENING_TIME, finish_time=CLOSING_TIME)
+        for lounge in all_lounges
+        for day in range(7)
+    ))
+    bulk_create(Table, (
+        LoungeBookFactory.build(lounge=lounge, name=f"Table {j}", capacity=2 + j % 7)
+        for lounge in all_lounges
+        for j in range(tables_per_lounge)
+    ))
+
+    all_users = list(User.objects.filter(username__startswith="bench-").order_by("id"))
+    all_tables = [
+        (Table(id=table_id, lounge_id=lounge_id), Lounge(id=lounge_id))
+        for table_id, lounge_id in Table.objects.order_by("id").values_list("id", "lounge_id")
+    ]
+    span = math.ceil(bookings / max(len(all_tables), 1) / SLOTS_PER_DAY) + 1
+    first_day = timezone.localdate() - datetime.timedelta(days=span // 2)
+
+    def generate():
+        for k in range(bookings):
+            table, lounge = all_tables[k % len(all_tables)]
+            yield BookingFactory.build(
+                user=all_users[k % len(all_users)],
+                lounge=lounge,
+                table=table,
+                date=slot(first_day, k // len(all_tables)),
+                total_guests=2,
+            )
+
+    bulk_create(Booking, generate())
+    occupancy.rebuild()
+    return {
+        "user": all_users[0],
+        "lounges": [lounge.id for lounge in all_lounges],
+        "free_from": first_day + datetime.timedelta(days=span + 1),
+    }
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples``."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(request, count, expected_status=200):
+    """Call ``request(i)`` for ``i`` in ``range(count)`` and summarise it.
+
+    Latencies are in milliseconds; ``errors`` counts responses that did not
+    come back with ``expected_status``.
+    """
+    timings, queries, errors = [], [], 0
+    for i in range(count):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = request(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        if response.status_code != expected_status:
+            errors += 1
+    return {
+        "requests": count,
+        "p50": percentile(timings, 50),
+        "p95": percentile(timings, 95),
+        "p99": percentile(timings, 99),
+        "queries": sum(queries) / count,
+        "errors": errors,
+    }
+
+
+def summarise(results, seconds, concurrency):
+    """Throughput and latency for ``(milliseconds, status_code)`` results."""
+    timings = [elapsed for elapsed, _ in results]
+    return {
+        "requests": len(results),
+        "concurrency": concurrency,
+        "rps": len(results) / seconds,
+        "p50": percentile(timings, 50),
+        "p99": percentile(timings, 99),
+        "errors": sum(1 for _, status in results if status != 200),
+    }
+
+
+def wsgi_load(user, url, params, concurrency, requests):
+    """``requests`` GETs through the WSGI handler, one thread per connection."""
+    login = Client()
+    login.force_login(user)
+    local = threading.local()
+
+    def call(_):
+        client = getattr(local, "client", None)
+        if client is None:
+            # share one session rather than have every thread log in at once
+            client = local.client = Client()
+            client.cookies = copy.copy(login.cookies)
+        try:
+            started = time.perf_counter()
+            response = client.get(url, params)
+            return (time.perf_counter() - started) * 1000, response.status_code
+        finally:
+            # what request_finished does for a real WSGI request
+            connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(requests)))
+    return summarise(results, time.perf_counter() - started, concurrency)
+
+
+def asgi_load(user, url, params, concurrency, requests):
+    """``requests`` GETs through the ASGI handler, one coroutine per connection."""
+    client = AsyncClient()
+    client.force_login(user)
+    # AsyncClient drops the ``data`` argument of get() in Django 3.1
+    url = f"{url}?{urlencode(params)}"
+
+    async def run():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def call():
+            async with slots:
+                started = time.perf_counter()
+                response = await client.get(url)
+                return (time.perf_counter() - started) * 1000, response.status_code
+
+        return await asyncio.gather(*(call() for _ in range(requests)))
+
+    started = time.perf_counter()
+    results = asyncio.run(run())
+    return summarise(results, time.perf_counter() - started, concurrency)
+
+
+def concurrency_comparison(seeded, concurrency, requests):
+    """The availability and bookings list endpoints under WSGI (sync view)
+    and ASGI (async view), as ``(endpoint, handler, stats)``."""
+    lounge_id = seeded["lounges"][0]
+    free_from = seeded["free_from"]
+    week = {"start": free_from.isoformat(), "end": (free_from + datetime.timedelta(days=6)).isoformat()}
+    endpoints = [
+        ("availability", "lounge-availability", "async-lounge-availability", [lounge_id], week),
+        ("bookings", "api-bookings", "async-api-bookings", [], {}),
+    ]
+    results = []
+    for endpoint, sync_name, async_name, args, params in endpoints:
+        results.append((endpoint, "wsgi", wsgi_load(
+            seeded["user"], reverse(f"lounge_booker:{sync_name}", args=args), params, concurrency, requests,
+        )))
+        results.append((endpoint, "asgi", asgi_load(
+            seeded["user"], reverse(f"lounge_booker:{async_name}", args=args), params, concurrency, requests,
+        )))
+    return results
+
+
+def connection_overhead(count):
+    """Milliseconds per ``SELECT 1`` on a new connection against a pooled one."""
+    params = connection.get_connection_params()
+
+    def connect():
+        return connection.Database.connect(**params)
+
+    def select_one(raw):
+        cursor = raw.cursor()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        cursor.close()
+
+    def fresh():
+        raw = connect()
+        try:
+            select_one(raw)
+        finally:
+            raw.close()
+
+    pool = ConnectionPool(size=1, timeout=1)
+
+    def pooled():
+        raw = pool.get(connect)
+        try:
+            select_one(raw)
+        finally:
+            pool.put(raw)
+
+    results = []
+    for name, call in (("connect", fresh), ("pool", pooled)):
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - started) * 1000)
+        results.append((name, {
+            "requests": count,
+            "p50": percentile(timings, 50),
+            "p99": percentile(timings, 99),
+        }))
+    pool.close_idle()
+    return results
+
+
+def login_cost(count):
+    """CPU milliseconds per login: authenticating twice, as ``login_page`` used
+    to, against once, and the whole login view."""
+    user = UserFactory(username="bench-login")
+    credentials = {"username": user.username, "password": "top-secret"}
+    client = Client()
+
+    def twice():
+        AuthenticationForm(data=credentials).is_valid()
+        authenticate(**credentials)
+
+    def once():
+        form = AuthenticationForm(data=credentials)
+        form.is_valid()
+        form.get_user()
+
+    def view():
+        # every login is measured rather than turned away by the throttle
+        reset_login_attempts()
+        client.post(reverse("lounge_booker:login"), credentials)
+
+    results = []
+    for name, call in (("twice", twice), ("once", once), ("login view", view)):
+        timings = []
+        for _ in range(count):
+            started = time.process_time()
+            call()
+            timings.append((time.process_time() - started) * 1000)
+        results.append((name, {
+            "requests": count,
+            "p50": percentile(timings, 50),
+            "p99": percentile(timings, 99),
+        }))
+    return results
+
+
+def any_fit(rng, tables, guests, busy):
+    """What guests picking from the form do: any free table that seats them."""
+    fitting = [table for table in tables if table.capacity >= guests and table.id not in busy]
+    return rng.choice(fitting) if fitting else None
+
+
+def seating_simulation(tables=100, slots=2000, seed_value=7):
+    """Seat the same random demand with hand-picked and best-fit tables.
+
+    Every slot at a lounge lasts the same time, so each one is simulated on
+    its own: parties of 1-8 (mostly couples and small groups) arrive until
+    they want a fifth more seats than there are, and each is seated or turned
+    away. Returns ``[(policy, stats)]`` with the share of parties seated and
+    of seats filled.
+    """
+    rng = random.Random(seed_value)
+    capacities = [2, 2, 2, 4, 4, 4, 6, 6, 8, 10]
+    lounge_tables = [Table(id=i, capacity=capacities[i % len(capacities)]) for i in range(tables)]
+    seats = sum(table.capacity for table in lounge_tables)
+    sizes, weights = (1, 2, 3, 4, 5, 6, 7, 8), (4, 30, 16, 20, 8, 10, 4, 8)
+    demand = []
+    for _ in range(slots):
+        parties, wanted = [], 0
+        while wanted < seats * 1.2:
+            parties.append(rng.choices(sizes, weights)[0])
+            wanted += parties[-1]
+        demand.append(parties)
+
+    plan = SeatingPlan(lounge_tables)
+    policies = (("any fit", lambda guests, busy: any_fit(rng, lounge_tables, guests, busy)), ("best fit", plan.best_fit))
+    results = []
+    for name, choose in policies:
+        parties = seated = guests = 0
+        for arrivals in demand:
+            busy = set()
+            for party in arrivals:
+                parties += 1
+                table = choose(party, busy)
+                if table is not None:
+                    busy.add(table.id)
+                    seated += 1
+                    guests += party
+        results.append((name, {
+            "parties_seated": 100 * seated / parties,
+            "seats_filled": 100 * guests / (seats * slots),
+        }))
+    return results
+
+
+SESSION_ENGINES = (
+    ("db", "django.contrib.sessions.backends.db"),
+    ("cached_db", "django.contrib.sessions.backends.cached_db"),
+    ("signed", "django.contrib.sessions.backends.signed_cookies"),
+)
+
+
+def session_comparison(seeded, requests):
+    """``home_page`` and ``my_bookings`` as a signed-in user under each session engine.
+
+    Returns ``[(engine, {page: stats})]``; the queries column shows what the
+    session lookup costs every authenticated request.
+    """
+    pages = (("home", reverse("lounge_booker:home")), ("my_bookings", reverse("lounge_booker:my-bookings")))
+    results = []
+    for name, engine in SESSION_ENGINES:
+        with override_settings(SESSION_ENGINE=engine):
+            client = Client()
+            client.force_login(seeded["user"])
+            results.append((name, {
+                page: measure(lambda i, url=url: client.get(url), requests) for page, url in pages
+            }))
+    return results
+
+
+def template_configurations():
+    """``(name, TEMPLATES, CACHES)``: parsing every render as under DEBUG, the
+    production profile's cached loader, and that plus the fragment cache."""
+    development = [{**settings.TEMPLATES[0], "OPTIONS": {**settings.TEMPLATES[0]["OPTIONS"], "debug": True}}]
+    no_fragments = {**settings.CACHES, "templates": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    return (
+        ("development", development, no_fragments),
+        ("cached loader", settings.PRODUCTION_TEMPLATES, no_fragments),
+        ("fragments", settings.PRODUCTION_TEMPLATES, settings.CACHES),
+    )
+
+
+def template_rendering(seeded, requests):
+    """``home_page`` and ``my_bookings`` under each template configuration.
+
+    Returns ``[(configuration, {page: stats})]``.
+    """
+    pages = (("home", reverse("lounge_booker:home")), ("my_bookings", reverse("lounge_booker:my-bookings")))
+    results = []
+    for name, templates, caches in template_configurations():
+        with override_settings(TEMPLATES=templates, CACHES=caches):
+            client = Client()
+            client.force_login(seeded["user"])
+            results.append((name, {
+                page: measure(lambda i, url=url: client.get(url), requests) for page, url in pages
+            }))
+    return results
+
+
+def booking_flows(seeded):
+    """``(name, request, expected_status)`` for each endpoint under test."""
+    client = Client()
+    client.force_login(seeded["user"])
+    free_from = seeded["free_from"]
+
+    book_lounge = Lounge.objects.get(id=seeded["lounges"][0])
+    book_tables = list(book_lounge.tables.values_list("id", flat=True))
+    book_url = reverse("lounge_booker:book-lounge", args=[book_lounge.id])
+
+    update_lounge = Lounge.objects.get(id=seeded["lounges"][-1])
+    update_table = update_lounge.tables.first()
+    booking = Booking.objects.create(
+        user=seeded["user"], lounge=update_lounge, table=update_table, date=slot(free_from, 0), total_guests=2,
+    )
+    update_url = reverse("lounge_booker:update-booking", args=[booking.id])
+
+    def book(i):
+        table = book_tables[i % len(book_tables)]
+        date = slot(free_from, i // len(book_tables))
+        return client.post(book_url, {"table": table, "date": date.strftime(DATE_FORMAT), "total_guests": 2})
+
+    def update(i):
+        date = slot(free_from, i + 1)
+        return client.post(update_url, {"table": update_table.id, "date": date.strftime(DATE_FORMAT), "total_guests": 2})
+
+    week = {"start": free_from.isoformat(), "end": (free_from + datetime.timedelta(days=6)).isoformat()}
+    return [
+        ("home", lambda i: client.get(reverse("lounge_booker:home")), 200),
+        ("book_lounge GET", lambda i: client.get(book_url), 200),
+        ("book_lounge POST", book, 302),
+        ("lounge_availability", lambda i: client.get(reverse("lounge_booker:lounge-availability", args=[book_lounge.id]), week), 200),
+        ("my_bookings", lambda i: client.get(reverse("lounge_booker:my-bookings")), 200),
+        ("my_bookings past", lambda i: client.get(reverse("lounge_booker:my-bookings"), {"when": "past"}), 200),
+        ("update_booking GET", lambda i: client.get(update_url), 200),
+        ("update_booking POST", update, 302),
+    ]
@@ -0,0 +1,36 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Lounge
+
+CATALOGUE_KEY = "lounge_booker:catalogue:{}"
+CATALOGUE_VERSION_KEY = "lounge_booker:catalogue:version"
+CATALOGUE_TIMEOUT = 60 * 60 * 24
+# Lounge signals only bump the version in the cache of the process that
+# saved the change; with a per-process cache the others pick up a new
+# version, and so a fresh list, after this long.
+CATALOGUE_VERSION_TIMEOUT = 60
+
+
+def catalogue_version():
+    """Token naming the current lounge list; changes whenever a lounge does.
+
+    Versions are timestamps rather than a counter so that an evicted version
+    key can never come back as a number an old cached list was stored under.
+    """
+    return cache.get_or_set(CATALOGUE_VERSION_KEY, time.time_ns, CATALOGUE_VERSION_TIMEOUT)
+
+
+def invalidate_catalogue():
+    cache.set(CATALOGUE_VERSION_KEY, time.time_ns(), CATALOGUE_VERSION_TIMEOUT)
+
+
+def lounge_catalogue():
+    """The lounges shown on the home page, served from the cache when warm."""
+    key = CATALOGUE_KEY.format(catalogue_version())
+    lounges = cache.get(key)
+    if lounges is None:
+        lounges = list(Lounge.objects.only("id", "name").order_by("id"))
+        cache.set(key, lounges, CATALOGUE_TIMEOUT)
+    return lounges
@@ -1,11 +1,18 @@
+import uuid
+
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.db.models import Count
+from django.forms.models import ModelChoiceIterator
 from django.utils import timezone
 
 
-from .models import Booking, Table
+from .availability import TABLE_TAKEN, best_fit_table, booking_duration, is_table_free
+from .models import Booking, BookingSeries, Lounge, Table, WaitlistEntry
+from .series import MAX_OCCURRENCES, occurrences, validate_series
+from .validation import validate_booking
 
 class UserForm(UserCreationForm):
     first_name = forms.CharField(required=True)
@@ -32,6 +39,48 @@ class UserForm(UserCreationForm):
 
 
 
+class TableChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for table in self.field.tables:
+            yield self.choice(table)
+
+    def __len__(self):
+        return len(self.field.tables) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.tables)
+
+
+class TableChoiceField(forms.ModelChoiceField):
+    """Offers and resolves tables from a list the form has already loaded.
+
+    A plain ModelChoiceField queries once to render its options and again to
+    look up the submitted pk; the lounge's tables are fetched with the lounge
+    instead, so neither needs the database.
+    """
+    iterator = TableChoiceIterator
+    tables = ()
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        value = str(getattr(value, "pk", value))
+        for table in self.tables:
+            if str(table.pk) == value:
+                return table
+        raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+
+
+NO_TABLE_FITS = "No table for a party of that size is free at that time, please choose another."
+
+
+def lounge_for_booking():
+    """ Lounges with everything BookingForm reads loaded in two queries """
+    return Lounge.objects.select_related("setting").prefetch_related("tables")
+
+
 class BookingForm(forms.ModelForm):
     date = forms.DateTimeField(
         input_formats=["%Y-%m-%dT%H:%M"],
@@ -40,12 +89,23 @@ class BookingForm(forms.ModelForm):
           format="%Y-%m-%dT%H:%M",
         ),
     )
+    idempotency_key = forms.CharField(
+        widget=forms.HiddenInput, required=False, max_length=64
+    )
 
     def __init__(self, lounge, *args, **kwargs):
+        """ ``lounge`` should come with its setting and tables preloaded, see lounge_for_booking() """
         super(BookingForm, self).__init__(*args, **kwargs)
+        # Never evaluated: choices and lookups use the preloaded ``tables``.
         self.fields["table"].queryset = Table.objects.filter(
             lounge_id=lounge.id
         )
+        self.fields["table"].tables = list(lounge.tables.all())
+        # Left empty, the smallest free table that seats the party is chosen.
+        self.fields["table"].required = False
+        self.fields["table"].empty_label = "Any suitable table"
+        # One key per rendered form, so a double-clicked submit books once.
+        self.fields["idempotency_key"].initial = uuid.uuid4().hex
         self.lounge = lounge
 
 
@@ -57,6 +117,25 @@ class BookingForm(forms.ModelForm):
           'date',
           'total_guests'
         )
+        field_classes = {"table": TableChoiceField}
+
+    def renew_key(self):
+        """Give a bound form a fresh key, so sending it back makes a new booking."""
+        self.data = self.data.copy()
+        self.data["idempotency_key"] = uuid.uuid4().hex
+
+    def submitted(self, name):
+        """The value submitted for ``name`` as its field cleans it, even after
+        ``clean()`` has rejected it; ``None`` if the field itself rejects it."""
+        try:
+            return self.fields[name].clean(self[name].data)
+        except ValidationError:
+            return None
+
+    def _get_validation_exclusions(self):
+        # The table was picked from the lounge's preloaded tables, so the
+        # model's foreign key check would only query for what we already have.
+        return super()._get_validation_exclusions() + ["table"]
 
     def clean(self):
         cleaned_data = super().clean()
@@ -64,21 +143,141 @@ class BookingForm(forms.ModelForm):
         date = cleaned_data.get("date")
         total_guests = cleaned_data.get("total_guests") 
         table = cleaned_data.get("table")
-        min_guest = self.lounge.setting.min_guest
 
+        validate_booking(self.lounge, table, date, total_guests)
+
+        if table is None:
+            if date and total_guests:
+                table = best_fit_table(
+                    self.lounge, total_guests, date, booking_duration(self.lounge), exclude_id=self.instance.pk
+                )
+                if table is None:
+                    raise ValidationError({"date": [NO_TABLE_FITS]})
+                cleaned_data["table"] = table
+        elif date and not is_table_free(table, date, booking_duration(self.lounge), exclude_id=self.instance.pk):
+            raise ValidationError({"date": [TABLE_TAKEN]})
 
-        if total_guests is not None:
-            if total_guests > table.capacity:
-                raise ValidationError({"total_guests": [f"The maximum table capacity is {table.capacity}"]})
 
-            if total_guests < 1:
-                raise ValidationError({"total_guests": ["Please choose a valid number of guests for your order."]})
+class BookingSeriesForm(forms.ModelForm):
+    start = forms.DateTimeField(
+        label="First booking",
+        input_formats=["%Y-%m-%dT%H:%M"],
+        widget=forms.DateTimeInput(
+          attrs={"type": "datetime-local", "class": "form-control"},
+          format="%Y-%m-%dT%H:%M",
+        ),
+    )
+    interval = forms.IntegerField(min_value=1, max_value=52, initial=1, help_text="Every how many days or weeks.")
+    count = forms.IntegerField(min_value=2, max_value=MAX_OCCURRENCES, help_text="How many bookings in total.")
+
+    def __init__(self, lounge, *args, **kwargs):
+        """ ``lounge`` should come with its setting and tables preloaded, see lounge_for_booking() """
+        super().__init__(*args, **kwargs)
+        self.fields["table"].queryset = Table.objects.filter(lounge_id=lounge.id)
+        self.fields["table"].tables = list(lounge.tables.all())
+        self.lounge = lounge
+        self.dates = []
 
-            if total_guests < min_guest:
-                raise ValidationError({"total_guests": [f"The minimum guests per booking is: {min_guest}"]})
+    class Meta:
+        model = BookingSeries
+        fields = ("table", "start", "total_guests", "frequency", "interval", "count")
+        field_classes = {"table": TableChoiceField}
 
+    def clean(self):
+        cleaned_data = super().clean()
+        if self.errors:
+            return
 
+        dates = occurrences(
+            cleaned_data["start"], cleaned_data["frequency"], cleaned_data["interval"], cleaned_data["count"]
+        )
+        if self.instance.pk:
+            # Bookings already behind us stay as they were.
+            dates = [date for date in dates if date >= timezone.now()]
+        validate_series(
+            self.lounge, cleaned_data["table"], dates, cleaned_data["total_guests"],
+            booking_duration(self.lounge), exclude_series=self.instance if self.instance.pk else None,
+        )
+        self.dates = dates
 
-        if date:
-            if date < timezone.now():
-                raise ValidationError({"date": ["Please choose a date and time that is in the future, thank you."]})
+
+class LoungeSearchForm(forms.Form):
+    q = forms.CharField(label="Name", required=False, max_length=150)
+    postcode = forms.CharField(required=False, max_length=12)
+    guests = forms.IntegerField(required=False, min_value=1)
+    when = forms.DateTimeField(
+        label="Date and time",
+        required=False,
+        input_formats=["%Y-%m-%dT%H:%M"],
+        widget=forms.DateTimeInput(attrs={"type": "datetime-local"}, format="%Y-%m-%dT%H:%M"),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        guests, when = cleaned_data.get("guests"), cleaned_data.get("when")
+        if (guests is None) != (when is None) and not self.errors:
+            raise ValidationError("Please choose both a number of guests and a time to find a free table.")
+        if when is not None and when < timezone.now():
+            raise ValidationError({"when": ["Please choose a date and time that is in the future, thank you."]})
+        return cleaned_data
+
+
+class WaitlistForm(forms.ModelForm):
+    date = forms.DateTimeField(
+        input_formats=["%Y-%m-%dT%H:%M"],
+        widget=forms.DateTimeInput(
+          attrs={"type": "datetime-local", "class": "form-control"},
+          format="%Y-%m-%dT%H:%M",
+        ),
+    )
+
+    def __init__(self, lounge, *args, **kwargs):
+        """ ``lounge`` should come with its setting and tables preloaded, see lounge_for_booking() """
+        super().__init__(*args, **kwargs)
+        self.lounge = lounge
+
+    class Meta:
+        model = WaitlistEntry
+        fields = ("date", "total_guests")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        total_guests = cleaned_data.get("total_guests")
+
+        validate_booking(self.lounge, None, cleaned_data.get("date"), total_guests)
+
+        largest = max((table.capacity for table in self.lounge.tables.all()), default=0)
+        if total_guests is not None and total_guests > largest:
+            raise ValidationError({"total_guests": [f"The maximum table capacity is {largest}"]})
+
+
+class GenerateTablesForm(forms.Form):
+    """Adds ``count`` identical tables to each of several lounges at once."""
+    count = forms.IntegerField(min_value=1, max_value=1000)
+    name = forms.CharField(
+        max_length=240, initial="Table {n}",
+        help_text="{n} is replaced by the table's number within its lounge.",
+    )
+    capacity = forms.IntegerField(min_value=1)
+
+    def clean_name(self):
+        name = self.cleaned_data["name"]
+        try:
+            name.format(n=1)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            raise ValidationError("Only {n} may appear in braces.")
+        return name
+
+    def save(self, lounges):
+        """Create the tables with a single ``bulk_create``; returns how many."""
+        existing = dict(
+            Table.objects.filter(lounge__in=lounges).values("lounge").annotate(total=Count("id")).values_list("lounge", "total")
+        )
+        count, name, capacity = (self.cleaned_data[field] for field in ("count", "name", "capacity"))
+        tables = [
+            Table(lounge=lounge, name=name.format(n=existing.get(lounge.id, 0) + i), capacity=capacity)
+            for lounge in lounges
+            for i in range(1, count + 1)
+        ]
+        Table.objects.bulk_create(tables)
+        return len(tables)
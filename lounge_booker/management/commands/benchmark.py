@@ -0,0 +1,122 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from lounge_booker.benchmarks import (
+    booking_flows,
+    concurrency_comparison,
+    connection_overhead,
+    login_cost,
+    measure,
+    seating_simulation,
+    seed,
+    session_comparison,
+    template_rendering,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and report p50/p95/p99 latency and "
+        "queries per request for the booking pages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lounges", type=int, default=1000)
+        parser.add_argument("--tables", type=int, default=10, help="Tables per lounge.")
+        parser.add_argument("--bookings", type=int, default=100000)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint.")
+        parser.add_argument(
+            "--scenario", choices=("flows", "concurrency", "connections", "seating", "sessions", "logins", "templates"), default="flows",
+            help="flows: every booking page in turn; concurrency: the availability "
+            "and bookings list endpoints under WSGI threads against ASGI coroutines; connections: "
+            "opening a database connection per query against borrowing one from a pool; "
+            "seating: table utilisation of hand-picked against best-fit seating, simulated without the database; "
+            "sessions: signed-in page views under each session engine; "
+            "logins: CPU time per login, hashing the password once against twice; "
+            "templates: page render times without and with the cached loader and fragment cache.",
+        )
+        parser.add_argument("--concurrency", type=int, default=50, help="Simultaneous connections.")
+
+    def handle(self, *args, **options):
+        if options["scenario"] == "seating":
+            self.report_seating(seating_simulation(options["tables"], options["requests"]))
+            return
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            if options["scenario"] == "connections":
+                self.report_connections(connection_overhead(options["requests"]))
+                return
+            if options["scenario"] == "logins":
+                self.report_logins(login_cost(options["requests"]))
+                return
+            self.stdout.write(
+                f"Seeding {options['lounges']} lounges, {options['lounges'] * options['tables']} "
+                f"tables and {options['bookings']} bookings..."
+            )
+            seeded = seed(options["lounges"], options["tables"], options["bookings"], options["users"])
+            if options["scenario"] == "concurrency":
+                self.report_concurrency(concurrency_comparison(seeded, options["concurrency"], options["requests"]))
+            elif options["scenario"] == "sessions":
+                self.report_sessions(session_comparison(seeded, options["requests"]))
+            elif options["scenario"] == "templates":
+                self.report_templates(template_rendering(seeded, options["requests"]))
+            else:
+                self.report(booking_flows(seeded), options["requests"])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def report(self, flows, requests):
+        self.stdout.write(f"{'endpoint':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'errors':>8}")
+        for name, request, expected_status in flows:
+            stats = measure(request, requests, expected_status)
+            self.stdout.write(
+                f"{name:<22}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['p99']:>9.2f}"
+                f"{stats['queries']:>9.1f}{stats['errors']:>8}"
+            )
+
+    def report_concurrency(self, results):
+        self.stdout.write(
+            f"{'endpoint':<14}{'handler':<10}{'conns':>7}{'req/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for endpoint, name, stats in results:
+            self.stdout.write(
+                f"{endpoint:<14}{name:<10}{stats['concurrency']:>7}{stats['rps']:>10.1f}"
+                f"{stats['p50']:>9.2f}{stats['p99']:>9.2f}{stats['errors']:>8}"
+            )
+
+    def report_connections(self, results):
+        self.stdout.write(f"{'connection':<12}{'queries':>9}{'p50 ms':>9}{'p99 ms':>9}")
+        for name, stats in results:
+            self.stdout.write(f"{name:<12}{stats['requests']:>9}{stats['p50']:>9.3f}{stats['p99']:>9.3f}")
+
+    def report_seating(self, results):
+        self.stdout.write(f"{'policy':<12}{'parties seated %':>18}{'seats filled %':>16}")
+        for name, stats in results:
+            self.stdout.write(f"{name:<12}{stats['parties_seated']:>18.1f}{stats['seats_filled']:>16.1f}")
+
+    def report_sessions(self, results):
+        self.stdout.write(f"{'engine':<11}{'page':<13}{'p50 ms':>9}{'p99 ms':>9}{'queries':>9}")
+        for name, pages in results:
+            for page, stats in pages.items():
+                self.stdout.write(
+                    f"{name:<11}{page:<13}{stats['p50']:>9.2f}{stats['p99']:>9.2f}{stats['queries']:>9.1f}"
+                )
+
+    def report_logins(self, results):
+        self.stdout.write(f"{'authenticate':<14}{'logins':>8}{'cpu p50 ms':>12}{'cpu p99 ms':>12}")
+        for name, stats in results:
+            self.stdout.write(f"{name:<14}{stats['requests']:>8}{stats['p50']:>12.2f}{stats['p99']:>12.2f}")
+
+    def report_templates(self, results):
+        self.stdout.write(f"{'templates':<15}{'page':<13}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+        for name, pages in results:
+            for page, stats in pages.items():
+                self.stdout.write(
+                    f"{name:<15}{page:<13}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['p99']:>9.2f}"
+                )
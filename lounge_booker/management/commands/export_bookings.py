@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from lounge_booker.transfer import FORMATS, export_bookings, guess_format
+
+
+class Command(BaseCommand):
+    help = "Stream every booking out as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to write, or - for stdout.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, else csv.")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or guess_format(options["path"])
+        if options["path"] == "-":
+            count = export_bookings(sys.stdout, fmt, options["chunk_size"])
+        else:
+            with open(options["path"], "w", newline="", encoding="utf-8") as stream:
+                count = export_bookings(stream, fmt, options["chunk_size"])
+        self.stderr.write(f"Exported {count} booking(s).")
@@ -0,0 +1,41 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from lounge_booker.transfer import FORMATS, guess_format, import_bookings, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Import bookings from CSV or JSON Lines (columns: user, lounge, table, "
+        "date, total_guests). Rows are validated like the booking form and "
+        "inserted in batches; invalid rows are reported and skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to read, or - for stdin.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension, else csv.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--allow-past", action="store_true",
+            help="Accept bookings dated in the past, e.g. when migrating history.",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options["format"] or guess_format(options["path"])
+        if options["path"] == "-":
+            created, skipped = self.load(sys.stdin, fmt, options)
+        else:
+            with open(options["path"], newline="", encoding="utf-8") as stream:
+                created, skipped = self.load(stream, fmt, options)
+
+        self.stdout.write(f"Imported {created} booking(s), skipped {skipped}.")
+
+    def load(self, stream, fmt, options):
+        return import_bookings(
+            read_rows(stream, fmt), batch_size=options["batch_size"], allow_past=options["allow_past"],
+            on_error=self.report,
+        )
+
+    def report(self, number, message):
+        self.stderr.write(f"line {number}: {message}")
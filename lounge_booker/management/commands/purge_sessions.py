@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from lounge_booker.sessions import BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired sessions in small batches, so the session table is "
+        "never locked for long. Safe to run while the site is busy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Sessions deleted per transaction.")
+        parser.add_argument("--sleep", type=float, default=0.1, help="Seconds to wait between batches.")
+
+    def handle(self, *args, **options):
+        deleted = purge_expired(options["batch_size"], options["sleep"])
+        self.stdout.write(f"Deleted {deleted} expired session(s).")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from lounge_booker.occupancy import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recompute the hourly occupancy aggregate from the bookings."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lounge", type=int, action="append", dest="lounges",
+            help="Only rebuild this lounge; repeat for several. Defaults to every lounge.",
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild(options["lounges"])
+        self.stdout.write(f"Rebuilt occupancy for {count} lounge(s).")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from lounge_booker.tasks import BATCH_SIZE, work
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background tasks such as booking confirmations. Start as "
+        "many as needed; workers never claim the same task twice."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Tasks claimed at a time.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        succeeded, failed = work(options["batch_size"], options["once"], options["sleep"])
+        self.stdout.write(f"Ran {succeeded} task(s), {failed} failed.")
@@ -0,0 +1,190 @@
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+NUMBER = re.compile(r"\b\d+\b")
+
+_lock = threading.Lock()
+_stats = {}
+# The RenderTimer of the sampled request being handled, if any.
+_render_timer = ContextVar("render_timer", default=None)
+
+
+def fingerprint(sql):
+    """``sql`` with its literals and IN-list lengths folded away.
+
+    Two queries with the same fingerprint differ only in their parameters,
+    so one fingerprint repeating within a request is the mark of an N+1.
+    """
+    return NUMBER.sub("?", IN_LIST.sub("IN (...)", sql))
+
+
+class QueryCollector:
+    """An ``execute_wrapper`` that counts and times every query it sees."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+class RenderTimer:
+    """Time spent rendering templates, counting nested renders once."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.depth = 0
+
+    def time(self, render):
+        self.depth += 1
+        started = time.perf_counter()
+        try:
+            return render()
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.seconds += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timer = _render_timer.get()
+        if timer is None:
+            return super().render(context, request)
+        return timer.time(lambda: super(TimedTemplate, self).render(context, request))
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing renders for ``QueryStatsMiddleware``.
+
+    Outside a sampled request a render costs one context variable lookup
+    more than with the stock backend.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def record(view, seconds, collector, render_seconds=0.0):
+    repeated = {sql: count for sql, count in collector.fingerprints.items() if count > 1}
+    with _lock:
+        stats = _stats.setdefault(view, {
+            "requests": 0,
+            "seconds": 0.0,
+            "queries": 0,
+            "db_seconds": 0.0,
+            "render_seconds": 0.0,
+            "duplicate_queries": 0,
+            "repeated": Counter(),
+        })
+        stats["requests"] += 1
+        stats["seconds"] += seconds
+        stats["queries"] += collector.count
+        stats["db_seconds"] += collector.seconds
+        stats["render_seconds"] += render_seconds
+        stats["duplicate_queries"] += sum(count - 1 for count in repeated.values())
+        stats["repeated"].update(repeated)
+
+
+def snapshot():
+    with _lock:
+        return {view: dict(stats, repeated=Counter(stats["repeated"])) for view, stats in _stats.items()}
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+class QueryStatsMiddleware:
+    """Per-view query counts, DB time, render time and repeated queries for a
+    sample of requests.
+
+    ``QUERY_STATS_SAMPLE_RATE`` is the fraction of requests measured. At 0
+    the middleware removes itself from the stack when it is loaded, so an
+    unsampled deployment pays nothing for it. Render time is only seen with
+    the ``TimedDjangoTemplates`` backend.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "QUERY_STATS_SAMPLE_RATE", 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        collector = QueryCollector()
+        timer = RenderTimer()
+        token = _render_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(collector):
+                response = self.get_response(request)
+        finally:
+            _render_timer.reset(token)
+        seconds = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        record(match.view_name if match else "unresolved", seconds, collector, timer.seconds)
+        return response
+
+
+METRICS = (
+    ("requests", "lounge_booker_requests_total", "counter", "Sampled requests."),
+    ("seconds", "lounge_booker_request_seconds_total", "counter", "Wall time spent in the view stack."),
+    ("queries", "lounge_booker_db_queries_total", "counter", "SQL queries run."),
+    ("db_seconds", "lounge_booker_db_seconds_total", "counter", "Time spent waiting on SQL queries."),
+    ("render_seconds", "lounge_booker_render_seconds_total", "counter", "Time spent rendering templates."),
+    ("duplicate_queries", "lounge_booker_duplicate_queries_total", "counter", "Queries repeating an earlier fingerprint in the same request."),
+)
+
+
+def _label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def prometheus_text(top_repeated=5):
+    """The sampled stats in the Prometheus text exposition format."""
+    stats = snapshot()
+    lines = []
+    for key, name, kind, help_text in METRICS:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for view, view_stats in sorted(stats.items()):
+            lines.append(f'{name}{{view="{_label(view)}"}} {view_stats[key]}')
+
+    name = "lounge_booker_repeated_query_total"
+    lines.append(f"# HELP {name} Most repeated query fingerprints per view, likely N+1s.")
+    lines.append(f"# TYPE {name} counter")
+    for view, view_stats in sorted(stats.items()):
+        for sql, count in view_stats["repeated"].most_common(top_repeated):
+            lines.append(f'{name}{{view="{_label(view)}",query="{_label(sql[:200])}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,22 @@
+# Generated by Django 3.0.8 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0007_auto_20210619_1353'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='setting',
+            name='booking_duration',
+            field=models.IntegerField(default=120),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['table', 'date'], name='booking_table_date_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.0.8 on 2026-10-18 07:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0008_auto_20261018_0752'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'date'], name='booking_user_date_idx'),
+        ),
+    ]
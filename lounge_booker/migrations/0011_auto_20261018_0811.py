@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0010_auto_20261018_0755'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('bookings', models.IntegerField(default=0)),
+                ('guest_minutes', models.IntegerField(default=0)),
+                ('lounge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lounge_booker.lounge')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lounge_booker.table')),
+            ],
+            options={
+                'verbose_name_plural': 'occupancy',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='occupancy',
+            index=models.Index(fields=['lounge', 'hour'], name='occupancy_lounge_hour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='occupancy',
+            constraint=models.UniqueConstraint(fields=('table', 'hour'), name='occupancy_table_hour'),
+        ),
+    ]
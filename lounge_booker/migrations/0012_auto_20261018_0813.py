@@ -0,0 +1,17 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0011_auto_20261018_0811'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['date'], name='booking_date_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def check_duplicate_hours(apps, schema_editor):
+    BusinessHour = apps.get_model("lounge_booker", "BusinessHour")
+    duplicates = list(
+        BusinessHour.objects.values("lounge_id", "day").annotate(rows=models.Count("id")).filter(rows__gt=1)
+    )
+    if duplicates:
+        raise RuntimeError(
+            "Lounges have more than one business hour for the same day; merge these before migrating: "
+            + ", ".join(f"lounge {row['lounge_id']} day {row['day']}" for row in duplicates)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lounge_booker', '0012_auto_20261018_0813'),
+    ]
+
+    operations = [
+        # New indexes first, so the foreign keys' own indexes are only
+        # dropped once something else serves their lookups.
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['lounge', 'date'], name='booking_lounge_date_idx'),
+        ),
+        migrations.RunPython(check_duplicate_hours, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='businesshour',
+            constraint=models.UniqueConstraint(fields=('lounge', 'day'), name='businesshour_lounge_day'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='lounge',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.lounge'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='table',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.table'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='businesshour',
+            name='lounge',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.lounge'),
+        ),
+        migrations.AlterField(
+            model_name='occupancy',
+            name='lounge',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lounge_booker.lounge'),
+        ),
+        migrations.AlterField(
+            model_name='occupancy',
+            name='table',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lounge_booker.table'),
+        ),
+    ]
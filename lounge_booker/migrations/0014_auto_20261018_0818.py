@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lounge_booker', '0013_auto_20261018_0815'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WaitlistEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('total_guests', models.IntegerField()),
+                ('fulfilled_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('booking', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='waitlist_entry', to='lounge_booker.booking')),
+                ('lounge', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.lounge')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'waitlist',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='waitlistentry',
+            index=models.Index(condition=models.Q(fulfilled_at__isnull=True), fields=['lounge', 'date'], name='waitlist_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:22
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0015_auto_20261018_0820'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='table',
+            index=models.Index(fields=['lounge', 'capacity'], name='table_lounge_capacity_idx'),
+        ),
+        migrations.AlterField(
+            model_name='table',
+            name='lounge',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tables', to='lounge_booker.lounge'),
+        ),
+    ]
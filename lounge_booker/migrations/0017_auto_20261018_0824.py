@@ -0,0 +1,40 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:24
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('lounge_booker', '0016_auto_20261018_0822'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingSeries',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('count', models.PositiveSmallIntegerField()),
+                ('total_guests', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('lounge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.lounge')),
+                ('table', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='lounge_booker.table')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'booking series',
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='lounge_booker.bookingseries'),
+        ),
+    ]
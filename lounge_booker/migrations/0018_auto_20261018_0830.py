@@ -0,0 +1,60 @@
+# Generated by Django 3.1.14 on 2026-10-18 08:30
+
+from django.db import migrations, models
+
+
+def outward_code(postcode):
+    # A copy of models.outward_code as it was when this migration was written.
+    code = "".join(postcode.split()).upper()
+    if len(code) > 4 and code[-3].isdigit() and code[-2:].isalpha():
+        return code[:-3]
+    return code[:4]
+
+
+def fill_outward_codes(apps, schema_editor):
+    Lounge = apps.get_model("lounge_booker", "Lounge")
+    lounges = list(Lounge.objects.only("id", "postcode"))
+    for lounge in lounges:
+        lounge.outward_code = outward_code(lounge.postcode)
+    Lounge.objects.bulk_update(lounges, ["outward_code"], batch_size=500)
+
+
+# Serves the name search's ``name__icontains``, which PostgreSQL runs as
+# ``UPPER(name::text) LIKE UPPER(%s)``. Other databases scan instead.
+TRIGRAM_INDEX = (
+    'CREATE INDEX IF NOT EXISTS "lounge_name_trgm_idx" ON "lounge_booker_lounge" '
+    'USING gin ((UPPER("name"::text)) gin_trgm_ops)'
+)
+
+
+def add_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    schema_editor.execute(TRIGRAM_INDEX)
+
+
+def drop_name_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute('DROP INDEX IF EXISTS "lounge_name_trgm_idx"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lounge_booker', '0017_auto_20261018_0824'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lounge',
+            name='outward_code',
+            field=models.CharField(blank=True, editable=False, max_length=4),
+        ),
+        migrations.RunPython(fill_outward_codes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lounge',
+            index=models.Index(fields=['outward_code'], name='lounge_outward_code_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.RunPython(add_name_trigram_index, drop_name_trigram_index),
+    ]
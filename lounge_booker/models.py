@@ -1,37 +1,113 @@
 from django.db import models
+from django.utils import timezone
 
 from django.contrib.auth.models import User
 
+def outward_code(postcode):
+    """The part of a UK postcode before the space, e.g. ``"SW1A"`` for ``"sw1a 1aa"``.
+
+    Anything too short to end in an inward code (digit, two letters) is
+    taken to be an outward code, or the start of one, already.
+    """
+    code = "".join(postcode.split()).upper()
+    if len(code) > 4 and code[-3].isdigit() and code[-2:].isalpha():
+        return code[:-3]
+    return code[:4]
+
+
 class Lounge(models.Model):
     name = models.CharField(max_length=150)
     address1 = models.CharField(max_length=250)
     address2 = models.CharField(max_length=250)
     postcode = models.CharField(max_length=12)
+    # Kept from postcode on save, for the prefix lookups in search.py.
+    outward_code = models.CharField(max_length=4, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Pattern ops let PostgreSQL serve ``LIKE 'SW1%'`` from the index
+            # whatever the database collation. The name search's trigram
+            # index is PostgreSQL-only and lives in migration 0018.
+            models.Index(fields=["outward_code"], opclasses=["varchar_pattern_ops"], name="lounge_outward_code_idx"),
+        ]
+
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.outward_code = outward_code(self.postcode)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "postcode" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "outward_code"}
+        super().save(*args, **kwargs)
+
 class Table(models.Model):
-    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, related_name="tables")
+    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, related_name="tables", db_index=False)
     name = models.CharField(max_length=250)
     capacity = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A lounge's tables in seating order; also serves lookups by lounge.
+            models.Index(fields=["lounge", "capacity"], name="table_lounge_capacity_idx"),
+        ]
+
     def __str__(self):
         return f"{self.name} | capacity: {self.capacity} individual(s)" 
 
 class Booking(models.Model):
+    # Each foreign key leads one of the composite indexes below, which
+    # serve its lookups, so none needs an index of its own.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, db_index=False)
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, db_index=False)
+    date = models.DateTimeField()
+    total_guests = models.IntegerField(null=True)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    series = models.ForeignKey(
+        "BookingSeries", on_delete=models.SET_NULL, null=True, blank=True, related_name="bookings"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["table", "date"], name="booking_table_date_idx"),
+            models.Index(fields=["user", "date"], name="booking_user_date_idx"),
+            models.Index(fields=["lounge", "date"], name="booking_lounge_date_idx"),
+            models.Index(fields=["date"], name="booking_date_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "idempotency_key"], name="booking_user_idempotency_key"
+            ),
+        ]
+
+
+class BookingSeries(models.Model):
+    """The same table booked ``count`` times, every ``interval`` days or weeks from ``start``."""
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    FREQUENCIES = ((DAILY, "Daily"), (WEEKLY, "Weekly"))
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE)
     table = models.ForeignKey(Table, on_delete=models.CASCADE)
-    date = models.DateTimeField()
-    total_guests = models.IntegerField(null=True)
+    start = models.DateTimeField()
+    frequency = models.CharField(max_length=10, choices=FREQUENCIES, default=WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1)
+    count = models.PositiveSmallIntegerField()
+    total_guests = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        verbose_name_plural = "booking series"
+
 
 DAYS_OF_WEEK = (
     (0, "Monday"),
@@ -45,7 +121,7 @@ DAYS_OF_WEEK = (
 
 
 class BusinessHour(models.Model):
-    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE)
+    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, db_index=False)
     day = models.IntegerField(choices=DAYS_OF_WEEK)
     start_time = models.TimeField()
     finish_time = models.TimeField()
@@ -53,12 +129,88 @@ class BusinessHour(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["lounge", "day"], name="businesshour_lounge_day"),
+        ]
+
 
 class Setting(models.Model):
     lounge = models.OneToOneField(Lounge, on_delete=models.CASCADE, related_name="setting")
     min_guest = models.IntegerField()
+    booking_duration = models.IntegerField(default=120)  # minutes
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
 
+class Occupancy(models.Model):
+    """Guest-minutes booked per table and hour.
+
+    Maintained from ``Booking`` saves and deletes by ``occupancy.py`` (and
+    rebuilt by the ``rebuild_occupancy`` command) so that reports never
+    have to scan the booking history.
+    """
+    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, related_name="+", db_index=False)
+    table = models.ForeignKey(Table, on_delete=models.CASCADE, related_name="+", db_index=False)
+    hour = models.DateTimeField()
+    bookings = models.IntegerField(default=0)
+    guest_minutes = models.IntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "occupancy"
+        indexes = [
+            models.Index(fields=["lounge", "hour"], name="occupancy_lounge_hour_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["table", "hour"], name="occupancy_table_hour"),
+        ]
+
+
+class WaitlistEntry(models.Model):
+    """A party waiting for a table at ``date``.
 
+    ``fulfilled_at`` is set, and ``booking`` pointed at their new booking,
+    once a cancellation frees a table for them.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    lounge = models.ForeignKey(Lounge, on_delete=models.CASCADE, db_index=False)
+    date = models.DateTimeField()
+    total_guests = models.IntegerField()
+    booking = models.OneToOneField(
+        Booking, on_delete=models.SET_NULL, null=True, blank=True, related_name="waitlist_entry"
+    )
+    fulfilled_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "waitlist"
+        indexes = [
+            # Only parties still waiting are ever matched against a free slot.
+            models.Index(
+                fields=["lounge", "date"], condition=models.Q(fulfilled_at__isnull=True), name="waitlist_pending_idx",
+            ),
+        ]
+
+
+class Task(models.Model):
+    """Work queued for the ``run_tasks`` worker; see tasks.py.
+
+    Rows are deleted once their handler succeeds. ``failed_at`` marks ones
+    that ran out of attempts and are kept for inspection.
+    """
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    failed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["run_at"], condition=models.Q(failed_at__isnull=True), name="task_due_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk}"
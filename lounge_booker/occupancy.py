@@ -0,0 +1,229 @@
+"""Incremental upkeep of the ``Occupancy`` aggregate.
+
+Every booking adds its guests to each hour its table is held for, weighted
+by the minutes of that hour it covers. Saves and deletes queue an
+``occupancy`` task, and the worker ``recount``s the hours they touched from
+the bookings themselves, off the request path. Bulk imports, which skip
+signals, call ``add_bookings`` directly. ``rebuild`` recomputes a lounge
+from scratch. All of them hold ``book_table``'s table locks while they
+write, so they never interleave with each other.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from .availability import booking_duration
+from .models import Booking, Lounge, Occupancy, Table
+
+HOUR = datetime.timedelta(hours=1)
+# Cells per UPDATE; keeps the CASE and WHERE clauses inside SQLite's
+# expression depth limit.
+CELLS_PER_QUERY = 200
+
+
+def start_of_hour(moment):
+    return timezone.localtime(moment).replace(minute=0, second=0, microsecond=0)
+
+
+def hourly_minutes(start, duration):
+    """``{hour: minutes}`` of each local hour that ``[start, start + duration)`` covers."""
+    end = start + duration
+    minutes = {}
+    hour = start_of_hour(start)
+    while hour < end:
+        covered = min(end, hour + HOUR) - max(start, hour)
+        minutes[hour] = int(covered.total_seconds() // 60)
+        hour += HOUR
+    return minutes
+
+
+def as_datetime(date):
+    """``date`` the way DateTimeField stores plain dates and naive datetimes."""
+    if not isinstance(date, datetime.datetime):
+        date = datetime.datetime.combine(date, datetime.time.min)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+def contribution(lounge_id, table_id, date, total_guests, duration):
+    """``{(lounge_id, table_id, hour): (bookings, guest_minutes)}`` for one booking."""
+    guests = total_guests or 0
+    return {
+        (lounge_id, table_id, hour): (1, guests * minutes)
+        for hour, minutes in hourly_minutes(as_datetime(date), duration).items()
+    }
+
+
+def merge(contributions, sign=1):
+    """Sum an iterable of contributions cell by cell, negated when ``sign`` is -1.
+
+    Each one is added as it is produced, so a generator over a whole
+    lounge's bookings is never held in memory at once.
+    """
+    totals = defaultdict(lambda: [0, 0])
+    for cells in contributions:
+        for key, (bookings, guest_minutes) in cells.items():
+            totals[key][0] += sign * bookings
+            totals[key][1] += sign * guest_minutes
+    return totals
+
+
+def apply(deltas, replace=False):
+    """Add ``{(lounge_id, table_id, hour): (bookings, guest_minutes)}`` to the
+    aggregate, or with ``replace`` set those cells to them."""
+    deltas = [(key, delta) for key, delta in deltas.items() if replace or any(delta)]
+    for i in range(0, len(deltas), CELLS_PER_QUERY):
+        chunk = deltas[i:i + CELLS_PER_QUERY]
+        # Only a cell that gains bookings can be missing.
+        Occupancy.objects.bulk_create(
+            [
+                Occupancy(lounge_id=lounge_id, table_id=table_id, hour=hour)
+                for (lounge_id, table_id, hour), (booking_delta, _) in chunk
+                if booking_delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+        cells = Q()
+        bookings, guest_minutes = [], []
+        for (_, table_id, hour), (booking_delta, minutes_delta) in chunk:
+            cell = Q(table_id=table_id, hour=hour)
+            cells |= cell
+            bookings.append(When(cell, then=Value(booking_delta)))
+            guest_minutes.append(When(cell, then=Value(minutes_delta)))
+        if replace:
+            Occupancy.objects.filter(cells).update(
+                bookings=Case(*bookings, default=F("bookings"), output_field=IntegerField()),
+                guest_minutes=Case(*guest_minutes, default=F("guest_minutes"), output_field=IntegerField()),
+            )
+        else:
+            Occupancy.objects.filter(cells).update(
+                bookings=F("bookings") + Case(*bookings, default=Value(0), output_field=IntegerField()),
+                guest_minutes=F("guest_minutes") + Case(*guest_minutes, default=Value(0), output_field=IntegerField()),
+            )
+
+
+def add_bookings(bookings, durations):
+    """Count bookings that were inserted without signals, e.g. by ``bulk_create``.
+
+    ``durations`` maps their lounge ids to booking durations. The caller
+    holds the locks on the bookings' tables.
+    """
+    apply(merge(
+        contribution(
+            booking.lounge_id, booking.table_id, booking.date, booking.total_guests, durations[booking.lounge_id],
+        )
+        for booking in bookings
+    ))
+
+
+def recount(slots):
+    """Recompute, from the bookings themselves, every hour ``slots`` cover.
+
+    ``slots`` are ``(lounge_id, table_id, date)`` where bookings were saved,
+    moved from or deleted; each covers the hours its lounge's booking
+    duration spans from ``date``. The cells are overwritten rather than
+    adjusted, so recounting a slot twice, or after a later change, gives the
+    same result. Each lounge is recounted in its own transaction holding the
+    same table locks as ``book_table``.
+    """
+    by_lounge = defaultdict(set)
+    for lounge_id, table_id, date in slots:
+        by_lounge[lounge_id].add((table_id, as_datetime(date)))
+    lounges = Lounge.objects.select_related("setting").in_bulk(by_lounge)
+
+    for lounge_id, lounge_slots in by_lounge.items():
+        lounge = lounges.get(lounge_id)
+        if lounge is None:
+            continue  # deleted, along with its bookings and cells
+        duration = booking_duration(lounge)
+        lounge_slots = sorted(lounge_slots)
+        with transaction.atomic():
+            list(Table.objects.select_for_update().filter(lounge=lounge).order_by("id").values_list("id"))
+            found = {}
+            for i in range(0, len(lounge_slots), CELLS_PER_QUERY):
+                # Bookings overlapping any hour a slot covers.
+                windows = Q()
+                for table_id, date in lounge_slots[i:i + CELLS_PER_QUERY]:
+                    windows |= Q(
+                        table_id=table_id,
+                        date__gt=start_of_hour(date) - duration,
+                        date__lt=start_of_hour(date + duration) + HOUR,
+                    )
+                found.update(
+                    (pk, row) for pk, *row in Booking.objects.filter(windows)
+                    .values_list("pk", "table_id", "date", "total_guests")
+                )
+            counted = merge(contribution(lounge_id, *row, duration) for row in found.values())
+            apply({
+                (lounge_id, table_id, hour): tuple(counted.get((lounge_id, table_id, hour), (0, 0)))
+                for table_id, date in lounge_slots
+                for hour in hourly_minutes(date, duration)
+            }, replace=True)
+
+
+def rebuild(lounge_ids=None):
+    """Recompute the aggregate for ``lounge_ids`` (every lounge by default).
+
+    Each lounge is rebuilt in its own transaction holding the same table
+    locks as ``book_table``, so bookings made meanwhile are neither lost nor
+    counted twice. Returns the number of lounges rebuilt.
+    """
+    lounges = Lounge.objects.select_related("setting").order_by("id")
+    if lounge_ids is not None:
+        lounges = lounges.filter(id__in=lounge_ids)
+
+    rebuilt = 0
+    for lounge in lounges.iterator():
+        duration = booking_duration(lounge)
+        with transaction.atomic():
+            list(Table.objects.select_for_update().filter(lounge=lounge).order_by("id").values_list("id"))
+            Occupancy.objects.filter(lounge=lounge).delete()
+            totals = merge(
+                contribution(lounge.id, table_id, date, total_guests, duration)
+                for table_id, date, total_guests in Booking.objects.filter(lounge=lounge)
+                .values_list("table_id", "date", "total_guests").iterator()
+            )
+            Occupancy.objects.bulk_create(
+                Occupancy(lounge_id=lounge_id, table_id=table_id, hour=hour, bookings=bookings, guest_minutes=minutes)
+                for (lounge_id, table_id, hour), (bookings, minutes) in totals.items()
+            )
+        rebuilt += 1
+    return rebuilt
+
+
+def hourly_report(lounge, day):
+    """Occupancy of each of ``lounge``'s tables for every hour of ``day``.
+
+    Reads only the aggregate: one indexed range scan on ``(lounge, hour)``
+    covering at most 24 rows per table, however long the booking history is.
+    Returns ``(tables, rows)`` where each row is ``(hour, [percent per
+    table], lounge percent)`` and percentages are of the seats available.
+    """
+    tables = list(Table.objects.filter(lounge=lounge).order_by("id"))
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    cells = {
+        (table_id, timezone.localtime(hour)): guest_minutes
+        for table_id, hour, guest_minutes in Occupancy.objects.filter(
+            lounge=lounge, hour__gte=start, hour__lt=start + datetime.timedelta(days=1),
+        ).values_list("table_id", "hour", "guest_minutes")
+    }
+    seat_minutes = sum(table.capacity for table in tables) * 60
+
+    rows = []
+    for offset in range(24):
+        hour = timezone.localtime(start + offset * HOUR)
+        minutes = [cells.get((table.id, hour), 0) for table in tables]
+        rows.append((
+            hour,
+            [percent(used, table.capacity * 60) for used, table in zip(minutes, tables)],
+            percent(sum(minutes), seat_minutes),
+        ))
+    return tables, rows
+
+
+def percent(part, whole):
+    return round(100 * part / whole) if whole else 0
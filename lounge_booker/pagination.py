@@ -0,0 +1,87 @@
+import datetime
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+PAGE_SIZE = 20
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def encode_cursor(booking):
+    """An opaque, URL-safe position for ``booking`` in a date-ordered list."""
+    micros = (booking.date - EPOCH) // datetime.timedelta(microseconds=1)
+    return f"{micros}-{booking.pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split("-")
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, descending=False, size=PAGE_SIZE):
+    """One page of ``queryset`` ordered by ``(date, pk)``, starting after ``cursor``.
+
+    Seeking past the last row seen, instead of using OFFSET, keeps every page
+    an index range scan however deep the user pages. Returns the rows and the
+    cursor for the next page, or ``None`` on the last page.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    if descending:
+        queryset = queryset.order_by("-date", "-pk")
+        if position:
+            date, pk = position
+            queryset = queryset.filter(Q(date__lt=date) | Q(date=date, pk__lt=pk))
+    else:
+        queryset = queryset.order_by("date", "pk")
+        if position:
+            date, pk = position
+            queryset = queryset.filter(Q(date__gt=date) | Q(date=date, pk__gt=pk))
+
+    rows = list(queryset[: size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+def estimated_rows(model, using="default"):
+    """The planner's row estimate for ``model``'s table, or ``None``.
+
+    Reading ``pg_class.reltuples`` is free where ``COUNT(*)`` has to visit
+    every row. The figure is as fresh as the last ``ANALYZE``. Only
+    PostgreSQL keeps one; other databases return ``None``.
+    """
+    connection = connections[using]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # reltuples is -1 (or 0 on older servers) until the table is analyzed
+    return row[0] if row and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for admin changelists over tables too big to ``COUNT(*)``.
+
+    An unfiltered list reports the planner's estimate instead of an exact
+    count. A filtered list counts exactly but stops at ``count_limit`` rows,
+    so a broad filter costs a bounded scan and its last pages are simply out
+    of reach. Small tables are always counted exactly.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                return estimate
+        return queryset[:self.count_limit].count()
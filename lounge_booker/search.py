@@ -0,0 +1,114 @@
+"""Finding lounges by name, postcode and a free table.
+
+``search_lounges`` filters, ranks and cuts to the top ``limit`` rows in the
+database, so only the lounges shown are ever loaded:
+
+* ``postcode`` keeps the same postcode area (``SW`` for ``SW1A 1AA``) with a
+  prefix lookup on the indexed ``outward_code``, nearest first: the same
+  outward code, then the same district (``SW1X`` for ``SW1A``), then ones
+  starting with what was typed, then the rest of the area.
+* ``q`` matches anywhere in the name. PostgreSQL serves it from the
+  trigram index that migration 0018 adds.
+* ``guests`` and ``when`` keep lounges with a table that seats the party,
+  is free at that time and is inside opening hours. These are ``EXISTS``
+  subqueries following ``validate_booking`` and ``is_table_free``.
+"""
+import datetime
+
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from .availability import DEFAULT_BOOKING_DURATION
+from .models import Booking, BusinessHour, Lounge, Setting, Table, outward_code
+
+SEARCH_LIMIT = 20
+
+
+def search_lounges(q="", postcode="", guests=None, when=None, limit=SEARCH_LIMIT):
+    """The best ``limit`` lounges matching everything given, as a list.
+
+    Runs one query, plus one for the lounges' booking durations when
+    filtering on ``when``.
+    """
+    lounges = Lounge.objects.only("id", "name", "postcode")
+    ranking = []
+
+    if postcode:
+        code = outward_code(postcode)
+        area = postcode_area(code)
+        district = area + code[len(area):].rstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+        lounges = lounges.filter(outward_code__startswith=area)
+        ranking += [
+            Case(
+                When(outward_code=code, then=Value(0)),
+                # SW1X is next to SW1A; SW19 is not.
+                When(Q(outward_code=district) | Q(outward_code__startswith=district, outward_code__regex=r"[A-Z]$"),
+                     then=Value(1)),
+                When(outward_code__startswith=code, then=Value(2)),
+                default=Value(3),
+                output_field=IntegerField(),
+            ),
+            "outward_code",
+        ]
+
+    q = q.strip()
+    if q:
+        lounges = lounges.filter(name__icontains=q)
+        ranking.append(Case(When(name__istartswith=q, then=Value(0)), default=Value(1), output_field=IntegerField()))
+
+    if guests is not None and when is not None:
+        lounges = lounges.filter(bookable(guests, when))
+
+    return list(lounges.order_by(*ranking, "name", "id")[:limit])
+
+
+def postcode_area(code):
+    """The letters an outward code starts with: ``"SW"`` for ``"SW1A"``."""
+    letters = len(code) - len(code.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    return code[:letters] or code
+
+
+def bookable(guests, start):
+    """Q for lounges where ``guests`` can book a table at ``start``.
+
+    Bookings last as long as their lounge's setting says, so each booking
+    duration in use gets its own clash window and opening check.
+    """
+    condition = Q(setting__isnull=True) | Q(setting__min_guest__lte=guests)
+
+    durations = set(Setting.objects.values_list("booking_duration", flat=True).distinct())
+    by_duration = Q(pk__in=[])
+    for minutes in sorted(durations | {DEFAULT_BOOKING_DURATION}):
+        duration = datetime.timedelta(minutes=minutes)
+        same_duration = Q(setting__booking_duration=minutes)
+        if minutes == DEFAULT_BOOKING_DURATION:
+            same_duration |= Q(setting__isnull=True)
+        by_duration |= same_duration & open_between(start, start + duration) & free_table(guests, start, duration)
+    return condition & by_duration
+
+
+def free_table(guests, start, duration):
+    """Q for lounges with a table seating ``guests`` and free for ``[start, start + duration)``."""
+    clashes = Booking.objects.filter(table=OuterRef("pk"), date__gt=start - duration, date__lt=start + duration)
+    return Q(Exists(Table.objects.filter(lounge=OuterRef("pk"), capacity__gte=guests).filter(~Exists(clashes))))
+
+
+def open_between(start, end):
+    """Q for lounges open for all of ``[start, end)``, as ``is_open`` decides it.
+
+    Lounges without business hours are always open. An interval finishing
+    at or before its start runs past midnight.
+    """
+    start, end = timezone.localtime(start), timezone.localtime(end)
+    weekday = start.weekday()
+    hours = BusinessHour.objects.filter(lounge=OuterRef("pk"), closed=False)
+    overnight = Q(finish_time__lte=F("start_time"))
+    opened_today = hours.filter(day=weekday, start_time__lte=start.time())
+
+    if end.date() == start.date():
+        fits = opened_today.filter(overnight | Q(finish_time__gte=end.time()))
+        from_yesterday = hours.filter(overnight, day=(weekday - 1) % 7, finish_time__gte=end.time())
+        open_now = Q(Exists(fits)) | Q(Exists(from_yesterday))
+    else:
+        open_now = Q(Exists(opened_today.filter(overnight, finish_time__gte=end.time())))
+    return Q(~Exists(BusinessHour.objects.filter(lounge=OuterRef("pk")))) | open_now
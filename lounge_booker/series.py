@@ -0,0 +1,135 @@
+"""Recurring bookings: every occurrence of a ``BookingSeries`` is checked
+and written as a set instead of one booking form at a time."""
+import bisect
+import datetime
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .availability import booking_duration
+from .models import Booking, BookingSeries, Table
+from .tasks import recount_occupancy
+from .validation import validate_booking
+from .waitlist import refill
+
+MAX_OCCURRENCES = 52
+
+
+def occurrences(start, frequency, interval, count):
+    """Start times of each occurrence, keeping the local wall-clock time across DST changes."""
+    step = datetime.timedelta(days=interval) if frequency == BookingSeries.DAILY else datetime.timedelta(weeks=interval)
+    wall = timezone.localtime(start).replace(tzinfo=None)
+    return [timezone.make_aware(wall + step * i) for i in range(count)]
+
+
+def clashing_dates(table, dates, duration, exclude_series=None):
+    """The ``dates`` at which ``table`` is already booked, in one query.
+
+    Each occurrence contributes a ``(date - duration, date + duration)``
+    window to a single OR'd range lookup on the ``(table, date)`` index, so
+    only bookings near an occurrence are read, however long the series.
+    """
+    if not dates:
+        return []
+    windows = Q()
+    for date in dates:
+        windows |= Q(date__gt=date - duration, date__lt=date + duration)
+    bookings = Booking.objects.filter(windows, table=table)
+    if exclude_series is not None:
+        bookings = bookings.exclude(series=exclude_series)
+    taken = sorted(bookings.values_list("date", flat=True))
+
+    clashes = []
+    for date in dates:
+        index = bisect.bisect_right(taken, date - duration)
+        if index < len(taken) and taken[index] < date + duration:
+            clashes.append(date)
+    return clashes
+
+
+def validate_series(lounge, table, dates, total_guests, duration, exclude_series=None):
+    """Check every occurrence, raising one ValidationError that lists each problem."""
+    if any(later - earlier < duration for earlier, later in zip(dates, dates[1:])):
+        raise ValidationError("Each booking would still be running when the next one starts.")
+    errors = []
+    for date in dates:
+        try:
+            validate_booking(lounge, table, date, total_guests)
+        except ValidationError as error:
+            errors.extend(f"{when(date)}: {message}" for message in error.messages)
+    errors.extend(
+        f"{when(date)}: this table is already booked."
+        for date in clashing_dates(table, dates, duration, exclude_series)
+    )
+    if errors:
+        raise ValidationError(errors)
+
+
+def when(date):
+    return timezone.localtime(date).strftime("%a %d %b %Y %H:%M")
+
+
+def save_series(series, dates, duration):
+    """Save ``series`` and book ``dates`` for it with one ``bulk_create``.
+
+    An existing series has its upcoming bookings replaced by ``dates``; past
+    ones stay as they were. The clash check is repeated under the table lock
+    ``book_table`` takes, so concurrent single bookings cannot slip in.
+    Times the series gives up are offered to the waitlist.
+    """
+    with transaction.atomic():
+        table_ids = {series.table_id}
+        if series.pk:
+            # The edit may move the series; its old table is freed and needs the lock too.
+            table_ids.update(BookingSeries.objects.filter(pk=series.pk).values_list("table_id", flat=True))
+        tables = lock_tables(table_ids)
+        exclude = series if series.pk else None
+        clashes = clashing_dates(series.table_id, dates, duration, exclude)
+        if clashes:
+            raise ValidationError([f"{when(date)}: this table is already booked." for date in clashes])
+
+        freed = []
+        if series.pk:
+            freed = release_upcoming(series)
+        series.save()
+        bookings = [
+            Booking(
+                user_id=series.user_id, lounge_id=series.lounge_id, table_id=series.table_id,
+                date=date, total_guests=series.total_guests, series=series,
+            )
+            for date in dates
+        ]
+        Booking.objects.bulk_create(bookings)
+        # bulk_create sends no post_save
+        recount_occupancy((series.lounge_id, series.table_id, date) for date in dates)
+        for table_id, date in freed:
+            if table_id != series.table_id or all(abs(date - booked) >= duration for booked in dates):
+                refill(series.lounge, tables[table_id], date, duration)
+    return bookings
+
+
+def delete_series(series):
+    """Cancel the upcoming bookings of ``series``, offering their times to the
+    waitlist; past ones are kept and detached."""
+    duration = booking_duration(series.lounge)
+    with transaction.atomic():
+        tables = lock_tables({series.table_id})
+        freed = release_upcoming(series)
+        series.delete()
+        for table_id, date in freed:
+            refill(series.lounge, tables[table_id], date, duration)
+
+
+def lock_tables(table_ids):
+    """Lock ``table_ids`` in id order, as ``book_table`` would one at a time; returns them by id."""
+    return {table.pk: table for table in Table.objects.select_for_update().filter(pk__in=table_ids).order_by("pk")}
+
+
+def release_upcoming(series):
+    """Delete the upcoming bookings of ``series``; returns their ``(table_id, date)`` pairs."""
+    upcoming = series.bookings.filter(date__gte=timezone.now())
+    freed = list(upcoming.values_list("table_id", "date"))
+    upcoming.delete()
+    return freed
@@ -0,0 +1,42 @@
+"""Clearing out expired sessions without holding long locks.
+
+Django's ``clearsessions`` deletes every expired row in one statement,
+which on a busy ``django_session`` table can lock it for as long as the
+delete takes. ``purge_expired`` removes them a batch at a time instead,
+each batch its own short transaction found through the ``expire_date``
+index, with an optional pause between batches for other writers.
+"""
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.utils import timezone
+
+BATCH_SIZE = 1000
+
+
+def purge_expired(batch_size=BATCH_SIZE, pause=0.0):
+    """Delete expired sessions ``batch_size`` at a time; returns how many went.
+
+    Only database-backed engines (``db`` and ``cached_db``) are batched;
+    other engines clear up however they do it themselves.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    if not issubclass(store, DatabaseSessionStore):
+        store.clear_expired()
+        return 0
+
+    sessions = store.get_model_class().objects
+    now = timezone.now()
+    deleted = 0
+    while True:
+        keys = list(sessions.filter(expire_date__lt=now).values_list("session_key", flat=True)[:batch_size])
+        if not keys:
+            break
+        # Re-checked in case a session was renewed since it was read.
+        deleted += sessions.filter(session_key__in=keys, expire_date__lt=now).delete()[0]
+        if len(keys) < batch_size:
+            break
+        time.sleep(pause)
+    return deleted
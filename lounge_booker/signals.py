@@ -0,0 +1,65 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import occupancy
+from .availability import DEFAULT_BOOKING_DURATION, invalidate_schedule
+from .catalogue import invalidate_catalogue
+from .models import Booking, BusinessHour, Lounge, Setting
+from .tasks import recount_occupancy
+
+
+@receiver([post_save, post_delete], sender=BusinessHour)
+def business_hours_changed(sender, instance, **kwargs):
+    invalidate_schedule(instance.lounge_id)
+
+
+@receiver(post_save, sender=Lounge)
+def lounge_saved(sender, instance, created, **kwargs):
+    invalidate_catalogue()
+    # A new lounge has no hours yet; drop anything cached under a reused id.
+    if created:
+        invalidate_schedule(instance.pk)
+
+
+@receiver(post_delete, sender=Lounge)
+def lounge_deleted(sender, instance, **kwargs):
+    invalidate_catalogue()
+    invalidate_schedule(instance.pk)
+
+
+@receiver(pre_save, sender=Booking)
+def booking_saving(sender, instance, **kwargs):
+    instance._slot_before = None
+    if instance.pk is not None:
+        instance._slot_before = Booking.objects.filter(pk=instance.pk).values_list(
+            "lounge_id", "table_id", "date"
+        ).first()
+
+
+@receiver(post_save, sender=Booking)
+def booking_saved(sender, instance, raw, **kwargs):
+    if raw:
+        return
+    slots = {(instance.lounge_id, instance.table_id, occupancy.as_datetime(instance.date))}
+    before = getattr(instance, "_slot_before", None)
+    if before is not None:
+        slots.add(before)
+    recount_occupancy(slots)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    recount_occupancy([(instance.lounge_id, instance.table_id, instance.date)])
+
+
+@receiver(pre_save, sender=Setting)
+def setting_saving(sender, instance, **kwargs):
+    previous = Setting.objects.filter(pk=instance.pk).values_list("booking_duration", flat=True).first() if instance.pk else None
+    instance._duration_before = previous or DEFAULT_BOOKING_DURATION
+
+
+@receiver(post_save, sender=Setting)
+def setting_saved(sender, instance, raw, **kwargs):
+    # Every booking's hours depend on the lounge's booking duration.
+    if not raw and instance.booking_duration != getattr(instance, "_duration_before", None):
+        occupancy.rebuild([instance.lounge_id])
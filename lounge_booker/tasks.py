@@ -0,0 +1,218 @@
+"""A small database-backed task queue for work that can leave the request.
+
+Handlers are registered with ``@task`` and queued with ``enqueue``, which
+inserts a ``Task`` row in the caller's transaction: a task exists exactly
+when the change that asked for it was committed, with no broker involved.
+``python manage.py run_tasks`` claims due tasks and runs them.
+
+A handler receives a list of payloads, so related tasks queued close
+together are handled in one go (one query for all their bookings, one
+SMTP connection for all their emails). It returns ``{index: error}`` for
+the payloads that failed, and only their tasks are retried. A handler that
+raises has not said which payloads went through, so its batch is run again
+a payload at a time; handlers with side effects that cannot be repeated,
+like sending email, report per payload instead of raising.
+"""
+import datetime
+import logging
+import time
+import traceback
+
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import occupancy
+from .availability import booking_duration
+from .models import Booking, Task
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_DELAY = datetime.timedelta(seconds=30)  # doubled after every failure
+# How long a claimed task stays invisible to other workers. A worker that
+# dies mid-batch leaves its tasks to be picked up again after this.
+LEASE = datetime.timedelta(minutes=5)
+
+
+def task(name):
+    """Register ``handler(payloads)`` under ``name``."""
+    def register(handler):
+        HANDLERS[name] = handler
+        return handler
+    return register
+
+
+def enqueue(name, delay=None, **payload):
+    if name not in HANDLERS:
+        raise ValueError(f"Unknown task {name!r}.")
+    run_at = timezone.now() + delay if delay else timezone.now()
+    return Task.objects.create(name=name, payload=payload, run_at=run_at)
+
+
+def claim(batch_size=BATCH_SIZE):
+    """Lease up to ``batch_size`` due tasks to this worker, oldest first."""
+    now = timezone.now()
+    with transaction.atomic():
+        tasks = list(
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(failed_at__isnull=True, run_at__lte=now)
+            .order_by("run_at")[:batch_size]
+        )
+        Task.objects.filter(pk__in=[t.pk for t in tasks]).update(run_at=now + LEASE)
+    return tasks
+
+
+def run_batch(tasks):
+    """Run claimed tasks grouped by handler; returns ``(succeeded, failed)``."""
+    by_name = {}
+    for claimed in tasks:
+        by_name.setdefault(claimed.name, []).append(claimed)
+
+    succeeded = failed = 0
+    for name, group in by_name.items():
+        errors = run_handler(name, group)
+        if errors:
+            retry([(group[index], error) for index, error in errors.items()])
+            failed += len(errors)
+        done = [claimed.pk for index, claimed in enumerate(group) if index not in errors]
+        Task.objects.filter(pk__in=done).delete()
+        succeeded += len(done)
+    return succeeded, failed
+
+
+def run_handler(name, group):
+    """``{index: error}`` for the tasks of ``group`` whose payloads failed."""
+    try:
+        return dict(HANDLERS[name]([claimed.payload for claimed in group]) or {})
+    except Exception:
+        logger.exception("Task %s failed for %d payload(s)", name, len(group))
+        if len(group) == 1:
+            return {0: traceback.format_exc()}
+    errors = {}
+    for index, claimed in enumerate(group):
+        for error in run_handler(name, [claimed]).values():
+            errors[index] = error
+    return errors
+
+
+def retry(failures):
+    """Schedule ``(task, error)`` pairs to run again, or give up on them."""
+    now = timezone.now()
+    for failed, error in failures:
+        failed.attempts += 1
+        failed.last_error = error
+        if failed.attempts >= MAX_ATTEMPTS:
+            failed.failed_at = now
+        else:
+            failed.run_at = now + RETRY_DELAY * 2 ** (failed.attempts - 1)
+    Task.objects.bulk_update([failed for failed, _ in failures], ["attempts", "last_error", "failed_at", "run_at"])
+
+
+def work(batch_size=BATCH_SIZE, once=False, idle_sleep=1.0):
+    """Claim and run tasks until the queue is empty (``once``) or forever."""
+    succeeded = failed = 0
+    while True:
+        tasks = claim(batch_size)
+        if tasks:
+            done, broken = run_batch(tasks)
+            succeeded += done
+            failed += broken
+        elif once:
+            return succeeded, failed
+        else:
+            time.sleep(idle_sleep)
+
+
+def calendar_invite(booking):
+    """An iCalendar event for ``booking``."""
+    stamp = "%Y%m%dT%H%M%SZ"
+    start = booking.date.astimezone(datetime.timezone.utc)
+    end = start + booking_duration(booking.lounge)
+    return "\r\n".join([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Lounge Booker//EN",
+        "METHOD:REQUEST",
+        "BEGIN:VEVENT",
+        f"UID:booking-{booking.pk}@lounge-booker",
+        f"DTSTAMP:{timezone.now().astimezone(datetime.timezone.utc).strftime(stamp)}",
+        f"DTSTART:{start.strftime(stamp)}",
+        f"DTEND:{end.strftime(stamp)}",
+        f"SUMMARY:{booking.lounge.name} - {booking.table.name}",
+        f"LOCATION:{booking.lounge.address1}\\, {booking.lounge.address2}\\, {booking.lounge.postcode}",
+        "END:VEVENT",
+        "END:VCALENDAR",
+        "",
+    ])
+
+
+@task("booking_confirmation")
+def send_booking_confirmations(payloads):
+    """Email each booking's owner a confirmation with a calendar invite.
+
+    Payloads are ``{"booking": id, "action": "booked" | "updated"}``.
+    Bookings cancelled since are skipped.
+    """
+    bookings = Booking.objects.select_related("user", "lounge__setting", "table").in_bulk(
+        {payload["booking"] for payload in payloads}
+    )
+    messages = []
+    for index, payload in enumerate(payloads):
+        booking = bookings.get(payload["booking"])
+        if booking is None or not booking.user.email:
+            continue
+        when = timezone.localtime(booking.date).strftime("%A %d %B %Y at %H:%M")
+        message = EmailMessage(
+            subject=f"Your booking at {booking.lounge.name}",
+            body=(
+                f"Hi {booking.user.first_name or booking.user.username},\n\n"
+                f"You have {payload.get('action', 'booked')} {booking.table.name} at {booking.lounge.name} "
+                f"for {booking.total_guests} guest(s) on {when}.\n\nEnjoy!\n"
+            ),
+            to=[booking.user.email],
+        )
+        message.attach("booking.ics", calendar_invite(booking), "text/calendar")
+        messages.append((index, message))
+
+    # One at a time over one connection, so a rejected message is retried
+    # without sending the others again.
+    errors = {}
+    if messages:
+        with get_connection() as connection:
+            for index, message in messages:
+                try:
+                    connection.send_messages([message])
+                except Exception:
+                    logger.exception("Could not send booking confirmation %s", payloads[index])
+                    errors[index] = traceback.format_exc()
+    return errors
+
+
+def recount_occupancy(slots):
+    """Queue a recount of the occupancy hours at ``slots``.
+
+    ``slots`` are ``(lounge_id, table_id, date)`` where bookings were saved,
+    moved from or deleted. One task is queued per lounge.
+    """
+    by_lounge = {}
+    for lounge_id, table_id, date in slots:
+        by_lounge.setdefault(lounge_id, []).append([table_id, occupancy.as_datetime(date).isoformat()])
+    for lounge_id, lounge_slots in by_lounge.items():
+        enqueue("occupancy", lounge=lounge_id, slots=lounge_slots)
+
+
+@task("occupancy")
+def update_occupancy(payloads):
+    """Recount the hours bookings were saved into or removed from.
+
+    Payloads are ``{"lounge": id, "slots": [[table id, ISO date], ...]}``.
+    Recounting is idempotent, so a retried batch does no harm.
+    """
+    occupancy.recount(
+        (payload["lounge"], table_id, datetime.datetime.fromisoformat(date))
+        for payload in payloads
+        for table_id, date in payload["slots"]
+    )
@@ -2,14 +2,59 @@ from django.http import response
 from django.test import TestCase
 
 import datetime
-
-from django.core.exceptions import ValidationError
-from django.test import TestCase
-
-from .factories import LoungeFactory, LoungeBookFactory, UserFactory, BookingFactory, SettingFactory
-from .forms import BookingForm, UserForm
-from .models import Lounge, Table, Booking
+import io
+import json
+import os
+import runpy
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from importlib.util import find_spec
+from unittest import mock, skipUnless
+
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core import mail
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from project.db.pool import ConnectionPool, PoolTimeout
+
+from . import middleware as query_stats, tasks
+from .availability import SCHEDULE_TIMEOUT, book_table, booking_duration, overlapping_bookings, weekly_schedule
+from .benchmarks import (
+    booking_flows, connection_overhead, login_cost, measure, percentile, seating_simulation, seed, session_comparison,
+    template_rendering,
+)
+from .catalogue import CATALOGUE_VERSION_TIMEOUT
+from .factories import LoungeFactory, LoungeBookFactory, UserFactory, BookingFactory, SettingFactory, BusinessHourFactory
+from .forms import NO_TABLE_FITS, BookingForm, GenerateTablesForm, UserForm, lounge_for_booking
+from .models import BookingSeries, BusinessHour, Lounge, outward_code, Occupancy, Table, Task, Booking, WaitlistEntry
+from .pagination import PAGE_SIZE, EstimatedCountPaginator
+from .search import search_lounges
+from .series import clashing_dates, occurrences
+from .sessions import purge_expired
+from .throttle import TokenBucket, login_attempts, reset_login_attempts
+from .transfer import export_bookings, import_bookings, read_rows
+from .waitlist import cancel_booking
 from django.contrib.auth.forms import AuthenticationForm
+from django.template import engines
+from django.template.loaders.cached import Loader as CachedLoader
 
 
 class HomePageTests(TestCase):
@@ -38,9 +83,49 @@ class HomePageTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, "home.html")
 
+    def test_catalogue_cached(self):
+        self.client.force_login(self.user)
+        self.client.get("/")
+
+        # session and user only; the lounges come from the cache
+        with self.assertNumQueries(2):
+            self.client.get("/")
+
+    def test_catalogue_refreshed_on_change(self):
+        self.client.force_login(self.user)
+        self.client.get("/")
+        new_lounge = LoungeFactory(name="Second Lounge")
+
+        response = self.client.get("/")
+        self.assertIn(new_lounge, response.context["lounges"])
+
+        new_lounge_id = new_lounge.id
+        new_lounge.delete()
+        response = self.client.get("/")
+        self.assertNotIn(new_lounge_id, [lounge.id for lounge in response.context["lounges"]])
+
+    def test_catalogue_expires_when_changed_elsewhere(self):
+        self.client.force_login(self.user)
+        self.client.get("/")
+        # no signal here, as when another process saves the lounge
+        Lounge.objects.bulk_create([Lounge(name="Second Lounge", postcode="E17 8BL")])
+
+        with mock.patch("time.time", return_value=time.time() + CATALOGUE_VERSION_TIMEOUT + 1):
+            response = self.client.get("/")
+
+        self.assertIn("Second Lounge", [lounge.name for lounge in response.context["lounges"]])
+
 
-class LoginPageTests(TestCase):
+class LoginTestCase(TestCase):
+    """Posts to /login and /signup: each test starts with full login buckets."""
+
+    def setUp(self):
+        reset_login_attempts()
+
+
+class LoginPageTests(LoginTestCase):
     def setUp(self):
+        super().setUp()
         self.user = UserFactory()
         self.url = "/login"
         self.response = self.client.get(self.url)
@@ -81,8 +166,9 @@ class LoginPageTests(TestCase):
         self.assertTrue("Invalid username or password, please try again." in message.message)
 
 
-class SignUpPageTests(TestCase):
+class SignUpPageTests(LoginTestCase):
     def setUp(self):
+        super().setUp()
         self.url = "/signup"
         self.response = self.client.get(self.url)
 
@@ -188,6 +274,90 @@ class BookingLoungeTests(TestCase):
         self.assertTrue(f"You have succesfully booked with {self.lounge}. Enjoy!" in message.message)
         self.assertRedirects(response, "/", status_code=302)
 
+    def test_double_submit_books_once(self):
+        self.client.force_login(self.user)
+        data = {
+            "table": self.table.id,
+            "total_guests": 2,
+            "date": book_date(),
+            "idempotency_key": "7f1d0c5e",
+        }
+
+        first = self.client.post(self.url, data)
+        second = self.client.post(self.url, data)
+
+        self.assertRedirects(first, "/", status_code=302)
+        self.assertRedirects(second, "/", status_code=302)
+        self.assertEqual(Booking.objects.filter(table=self.table).count(), 1)
+
+    def test_changed_resubmission_shows_errors(self):
+        self.client.force_login(self.user)
+        data = {"table": self.table.id, "total_guests": 2, "date": book_date(), "idempotency_key": "7f1d0c5e"}
+        self.client.post(self.url, data)
+
+        response = self.client.post(self.url, {**data, "total_guests": 9})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["booking_form"].errors)
+        self.assertEqual(Booking.objects.get().total_guests, 2)
+
+    def test_changed_valid_resubmission_shows_errors(self):
+        self.client.force_login(self.user)
+        data = {"table": self.table.id, "total_guests": 2, "date": book_date(), "idempotency_key": "7f1d0c5e"}
+        self.client.post(self.url, data)
+        changed = {**data, "date": book_date(days=4)}
+
+        response = self.client.post(self.url, changed)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["booking_form"].errors)
+        self.assertEqual(Booking.objects.get().date, aware(data["date"]))
+        key = response.context["booking_form"]["idempotency_key"].value()
+        self.assertNotEqual(key, data["idempotency_key"])
+        self.assertRedirects(self.client.post(self.url, {**changed, "idempotency_key": key}), "/", status_code=302)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_double_submit_for_any_table_books_once(self):
+        LoungeBookFactory(lounge=self.lounge)
+        self.client.force_login(self.user)
+        data = {"table": "", "total_guests": 2, "date": book_date(), "idempotency_key": "7f1d0c5e"}
+
+        first = self.client.post(self.url, data)
+        second = self.client.post(self.url, data)
+
+        self.assertRedirects(first, "/", status_code=302)
+        self.assertRedirects(second, "/", status_code=302)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_slot_taken_before_save(self):
+        date = aware(book_date())
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=date)
+        booking = Booking(user=self.user, lounge=self.lounge, table=self.table, date=date, total_guests=2)
+
+        with self.assertRaises(ValidationError):
+            book_table(booking, booking_duration(self.lounge))
+
+    def test_post_query_budget(self):
+        LoungeBookFactory(lounge=self.lounge, name="Window Table")
+        weekly_schedule(self.lounge)
+        self.client.force_login(self.user)
+        data = {"table": self.table.id, "total_guests": 2, "date": book_date()}
+
+        # session, user, lounge + setting, tables, clash check, then
+        # savepoints, table lock, clash re-check, insert, queued occupancy
+        # recount and confirmation, releases
+        with self.assertNumQueries(14):
+            self.client.post(self.url, data)
+
+    def test_other_lounges_table_rejected(self):
+        other = LoungeBookFactory()
+        form = BookingForm(lounge_for_booking().get(pk=self.lounge.pk), {
+            "table": other.id, "total_guests": 2, "date": book_date(),
+        })
+
+        self.assertFalse(form.is_valid())
+        self.assertIn("table", form.errors)
+
     def test_table_queryset(self):
         LoungeBookFactory()
 
@@ -208,6 +378,175 @@ class BookingLoungeTests(TestCase):
         self.assertEqual(context_lounge, self.lounge)
 
 
+class LoungeAvailabilityTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        self.day = timezone.localdate() + datetime.timedelta(days=3)
+        BusinessHourFactory(
+            lounge=self.lounge,
+            day=self.day.weekday(),
+            start_time=datetime.time(10, 0),
+            finish_time=datetime.time(14, 0),
+        )
+        self.url = f"/lounge-availability/{self.lounge.id}"
+        self.params = {"start": self.day.isoformat(), "end": self.day.isoformat()}
+
+    def slot(self, hour):
+        return timezone.make_aware(datetime.datetime.combine(self.day, datetime.time(hour)))
+
+    def test_authentication(self):
+        response = self.client.get(self.url)
+        self.assertRedirects(response, "/login", status_code=302)
+
+    def test_free_slots(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, self.params)
+        starts = [slot["start"] for slot in response.json()["slots"]]
+
+        self.assertEqual(starts, [self.slot(10).isoformat(), self.slot(12).isoformat()])
+
+    def test_booked_slot_is_not_free(self):
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.slot(10))
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, self.params)
+        starts = [slot["start"] for slot in response.json()["slots"]]
+
+        self.assertEqual(starts, [self.slot(12).isoformat()])
+
+    def test_closed_day_has_no_slots(self):
+        self.client.force_login(self.user)
+        next_day = (self.day + datetime.timedelta(days=1)).isoformat()
+        response = self.client.get(self.url, {"start": next_day, "end": next_day})
+
+        self.assertEqual(response.json()["slots"], [])
+
+    def test_tables_too_small_are_skipped(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, dict(self.params, guests=5))
+
+        self.assertEqual(response.json()["slots"], [])
+
+    def test_below_min_guest(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, dict(self.params, guests=1))
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_range(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url, {"start": self.day.isoformat(), "end": "2000-01-01"})
+
+        self.assertEqual(response.status_code, 400)
+
+
+@skipUnlessDBFeature("has_select_for_update")
+class BookingConcurrencyTests(TransactionTestCase):
+    """ hammer book_table() from many threads at once; needs a real database """
+    writers = 100
+    # Postgres allows 100 connections out of the box, so the writers share a
+    # smaller pool of threads; the barrier still releases them together.
+    threads = 50
+
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=1)
+        self.table = LoungeBookFactory(lounge=self.lounge)
+        self.duration = booking_duration(self.lounge)
+        self.start = timezone.now() + datetime.timedelta(days=1)
+
+    def run_writers(self, make_booking):
+        barrier = threading.Barrier(self.threads)
+
+        def write(index):
+            try:
+                if index < self.threads:
+                    barrier.wait()
+                return book_table(make_booking(index), self.duration)
+            except ValidationError:
+                return None
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            return list(pool.map(write, range(self.writers)))
+
+    def test_no_overlapping_bookings(self):
+        def make_booking(index):
+            # ten competing start times, thirty minutes apart
+            date = self.start + datetime.timedelta(minutes=30 * (index % 10))
+            return Booking(user=self.user, lounge=self.lounge, table=self.table, date=date, total_guests=1)
+
+        self.run_writers(make_booking)
+        dates = list(Booking.objects.filter(table=self.table).order_by("date").values_list("date", flat=True))
+
+        self.assertTrue(dates)
+        for earlier, later in zip(dates, dates[1:]):
+            self.assertGreaterEqual(later - earlier, self.duration)
+
+    def test_resubmissions_book_once(self):
+        def make_booking(index):
+            return Booking(user=self.user, lounge=self.lounge, table=self.table, date=self.start, total_guests=1, idempotency_key="same-form")
+
+        results = self.run_writers(make_booking)
+
+        self.assertEqual(Booking.objects.filter(table=self.table).count(), 1)
+        self.assertEqual({booking.pk for booking in results}, {Booking.objects.get().pk})
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge)
+        self.async_client.force_login(self.user)
+        self.client.force_login(self.user)
+
+    async def test_availability_matches_sync_view(self):
+        day = (timezone.localdate() + datetime.timedelta(days=2)).isoformat()
+        params = {"start": day, "end": day}
+        response = await self.async_client.get(f"/async/lounge-availability/{self.lounge.id}?{urlencode(params)}")
+        expected = await sync_to_async(self.client.get)(f"/lounge-availability/{self.lounge.id}", params)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+
+    async def test_availability_authentication(self):
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get(f"/async/lounge-availability/{self.lounge.id}")
+
+        self.assertEqual(response.status_code, 302)
+
+    async def test_bookings_match_sync_view(self):
+        await sync_to_async(BookingFactory)(user=self.user, lounge=self.lounge, table=self.table, date=aware(book_date()))
+        response = await self.async_client.get("/async/api/bookings")
+        expected = await sync_to_async(self.client.get)("/api/bookings")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), expected.json())
+        self.assertEqual(len(response.json()["bookings"]), 1)
+        self.assertEqual(response["ETag"], expected["ETag"])
+
+        # Django 3.1's AsyncClient sends extra keys as raw header names
+        unchanged = await self.async_client.get("/async/api/bookings", **{"If-None-Match": response["ETag"]})
+        self.assertEqual(unchanged.status_code, 304)
+
+    async def test_bookings_read_only(self):
+        response = await self.async_client.post("/async/api/bookings")
+
+        self.assertEqual(response.status_code, 405)
+
+    async def test_bookings_authentication(self):
+        await sync_to_async(self.async_client.logout)()
+        response = await self.async_client.get("/async/api/bookings")
+
+        self.assertEqual(response.status_code, 401)
+
+
 class MyBookingsTests(TestCase):
     def setUp(self):
         self.user1 = UserFactory(username="Jane")
@@ -237,6 +576,41 @@ class MyBookingsTests(TestCase):
         context = response.context["bookings"]
         self.assertEqual(list(context), [self.booking2])
 
+    def test_past_bookings(self):
+        past = BookingFactory(user=self.user1, lounge=self.booking1.lounge, table=self.booking1.table, date=timezone.now() - datetime.timedelta(days=1))
+        self.client.force_login(self.user1)
+
+        upcoming = self.client.get(self.url).context["bookings"]
+        previous = self.client.get(self.url, {"when": "past"}).context["bookings"]
+
+        self.assertEqual(list(upcoming), [self.booking1])
+        self.assertEqual(list(previous), [past])
+
+    def test_keyset_pagination(self):
+        start = timezone.now() + datetime.timedelta(days=2)
+        for hours in range(PAGE_SIZE + 4):
+            BookingFactory(user=self.user1, lounge=self.booking1.lounge, table=self.booking1.table, date=start + datetime.timedelta(hours=hours))
+        self.client.force_login(self.user1)
+
+        first = self.client.get(self.url)
+        second = self.client.get(self.url, {"cursor": first.context["next_cursor"]})
+
+        self.assertEqual(len(first.context["bookings"]), PAGE_SIZE)
+        self.assertEqual(len(second.context["bookings"]), 5)
+        self.assertIsNone(second.context["next_cursor"])
+        self.assertEqual(first.context["bookings"][0], self.booking1)
+
+    def test_constant_query_count(self):
+        self.client.force_login(self.user1)
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
+        start = timezone.now() + datetime.timedelta(days=2)
+        for hours in range(PAGE_SIZE):
+            BookingFactory(user=self.user1, lounge=LoungeFactory(), table=LoungeBookFactory(), date=start + datetime.timedelta(hours=hours))
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+
 
 class DeleteMyBookingsTests(TestCase):
     def setUp(self):
@@ -401,16 +775,1578 @@ class BookingFormTest(TestCase):
         self.assertEquals(form.errors["date"], ["Please choose a date and time that is in the future, thank you."])
         self.assertFalse(form.is_valid())
 
+    def test_table_already_booked(self):
+        BookingFactory(lounge=self.lounge, table=self.table, date=aware(self.date))
+        self.data["total_guests"] = self.min_guest
+        form = BookingForm(self.lounge, self.data)
 
+        self.assertFalse(form.is_valid())
+        self.assertEqual(
+            form.errors["date"],
+            ["This table is already booked at that time, please choose another."],
+        )
 
+    def test_overlapping_booking(self):
+        earlier = aware(self.date) - datetime.timedelta(minutes=self.setting.booking_duration - 1)
+        BookingFactory(lounge=self.lounge, table=self.table, date=earlier)
+        self.data["total_guests"] = self.min_guest
+        form = BookingForm(self.lounge, self.data)
 
+        self.assertFalse(form.is_valid())
 
+    def test_back_to_back_booking(self):
+        earlier = aware(self.date) - datetime.timedelta(minutes=self.setting.booking_duration)
+        BookingFactory(lounge=self.lounge, table=self.table, date=earlier)
+        self.data["total_guests"] = self.min_guest
+        form = BookingForm(self.lounge, self.data)
 
+        self.assertTrue(form.is_valid())
 
-def book_date(days=3, hours=1, minutes=30, past=False):
-    today = datetime.datetime.today()
-    delta = datetime.timedelta(days, hours, minutes)
-    date = today - delta if past else today + delta
+    def test_update_keeps_own_slot(self):
+        booking = BookingFactory(lounge=self.lounge, table=self.table, date=aware(self.date))
+        self.data["total_guests"] = self.min_guest
+        form = BookingForm(self.lounge, self.data, instance=booking)
+
+        self.assertTrue(form.is_valid())
+
+
+
+
+
+
+
+class BusinessHourValidationTests(TestCase):
+    def setUp(self):
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=1)
+        self.table = LoungeBookFactory(lounge=self.lounge)
+        self.day = timezone.localdate() + datetime.timedelta(days=3)
+        self.hours = BusinessHourFactory(
+            lounge=self.lounge,
+            day=self.day.weekday(),
+            start_time=datetime.time(10, 0),
+            finish_time=datetime.time(14, 0),
+        )
+
+    def form(self, hour, minute=0):
+        date = datetime.datetime.combine(self.day, datetime.time(hour, minute))
+        data = {"table": self.table.id, "date": date.strftime("%Y-%m-%dT%H:%M"), "total_guests": 2}
+        return BookingForm(self.lounge, data)
+
+    def test_booking_within_opening_hours(self):
+        self.assertTrue(self.form(12).is_valid())
+
+    def test_booking_running_past_closing(self):
+        form = self.form(12, 30)
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["date"], ["The lounge is closed at that time, please choose another."])
+
+    def test_booking_on_closed_day(self):
+        self.hours.closed = True
+        self.hours.save()
+
+        self.assertFalse(self.form(11).is_valid())
+
+    def test_schedule_is_cached(self):
+        weekly_schedule(self.lounge)
+
+        with self.assertNumQueries(0):
+            weekly_schedule(self.lounge)
+
+    def test_schedule_refreshed_when_hours_change(self):
+        self.assertFalse(self.form(15).is_valid())
+
+        self.hours.finish_time = datetime.time(18, 0)
+        self.hours.save()
+
+        self.assertTrue(self.form(15).is_valid())
+
+    def test_schedule_expires_when_changed_elsewhere(self):
+        self.assertFalse(self.form(15).is_valid())
+
+        # no signal here, as when another process saves the hours
+        BusinessHour.objects.filter(pk=self.hours.pk).update(finish_time=datetime.time(18, 0))
+        self.assertFalse(self.form(15).is_valid())
+
+        with mock.patch("time.time", return_value=time.time() + SCHEDULE_TIMEOUT + 1):
+            self.assertTrue(self.form(15).is_valid())
+
+
+class BookingTransferTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        self.date = aware(book_date())
+
+    def row(self, **overrides):
+        row = {
+            "user": self.user.username,
+            "lounge": self.lounge.id,
+            "table": self.table.id,
+            "date": self.date.isoformat(),
+            "total_guests": 2,
+        }
+        row.update(overrides)
+        return row
+
+    def test_import_skips_invalid_rows(self):
+        later = (self.date + datetime.timedelta(hours=3)).isoformat()
+        rows = enumerate([
+            self.row(),
+            self.row(user="nobody", date=later),
+            self.row(total_guests=9, date=later),
+            self.row(table=LoungeBookFactory().id, date=later),
+            self.row(date=(self.date + datetime.timedelta(minutes=30)).isoformat()),
+            self.row(date=later),
+        ], start=1)
+
+        errors = []
+        created, skipped = import_bookings(
+            rows, batch_size=4, on_error=lambda number, message: errors.append((number, message)),
+        )
+
+        self.assertEqual((created, skipped), (2, 4))
+        self.assertEqual([number for number, _ in errors], [2, 3, 4, 5])
+        self.assertEqual(errors[3][1], "This table is already booked at that time, please choose another.")
+
+    def test_import_reports_errors_per_batch(self):
+        read = []
+
+        def rows():
+            for number in range(1, 7):
+                read.append(number)
+                yield number, self.row(user="nobody")
+
+        reported = []
+        import_bookings(rows(), batch_size=2, on_error=lambda number, message: reported.append((number, len(read))))
+
+        # each batch's errors come out before the next batch is read
+        self.assertEqual(reported, [(1, 2), (2, 2), (3, 4), (4, 4), (5, 6), (6, 6)])
+
+    def test_import_rejects_clash_with_existing_booking(self):
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.date)
+
+        self.assertEqual(import_bookings([(1, self.row())]), (0, 1))
+
+    def test_import_history_with_allow_past(self):
+        past = (self.date - datetime.timedelta(days=30)).isoformat()
+
+        self.assertEqual(import_bookings([(1, self.row(date=past))])[0], 0)
+        self.assertEqual(import_bookings([(1, self.row(date=past))], allow_past=True)[0], 1)
+
+    def test_csv_round_trip(self):
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.date)
+        stream = io.StringIO()
+
+        self.assertEqual(export_bookings(stream, "csv"), 1)
+        Booking.objects.all().delete()
+        stream.seek(0)
+        self.assertEqual(import_bookings(read_rows(stream, "csv")), (1, 0))
+        self.assertEqual(Booking.objects.get().date, self.date)
+
+    def test_jsonl_commands(self):
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.date)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bookings.jsonl")
+            call_command("export_bookings", path, stderr=io.StringIO())
+            Booking.objects.all().delete()
+            out = io.StringIO()
+            call_command("import_bookings", path, stdout=out, stderr=io.StringIO())
+
+        self.assertIn("Imported 1 booking(s), skipped 0.", out.getvalue())
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_malformed_jsonl_line_skipped(self):
+        later = self.row(date=(self.date + datetime.timedelta(hours=3)).isoformat())
+        stream = io.StringIO(f"{json.dumps(self.row())}\n{{\"user\": \n{json.dumps(later)}\n")
+
+        errors = []
+        created, skipped = import_bookings(
+            read_rows(stream, "jsonl"), on_error=lambda number, message: errors.append((number, message)),
+        )
+
+        self.assertEqual((created, skipped), (2, 1))
+        self.assertEqual(errors[0][0], 2)
+        self.assertTrue(errors[0][1].startswith("Could not read row:"))
+
+
+class SeatingTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.tables = {
+            capacity: LoungeBookFactory(lounge=self.lounge, name=f"{capacity} seater", capacity=capacity)
+            for capacity in (8, 2, 6, 4)
+        }
+        self.date = book_date()
+
+    def form(self, guests, table=""):
+        lounge = lounge_for_booking().get(pk=self.lounge.pk)
+        return BookingForm(lounge, {"table": table, "date": self.date, "total_guests": guests})
+
+    def test_smallest_free_table_is_chosen(self):
+        form = self.form(3)
+
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["table"], self.tables[4])
+
+    def test_busy_tables_are_skipped(self):
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.tables[4], date=aware(self.date))
+
+        form = self.form(3)
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.save(commit=False).table, self.tables[6])
+
+    def test_no_table_big_enough(self):
+        form = self.form(9)
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors["date"], [NO_TABLE_FITS])
+
+    def test_needs_guests_to_choose(self):
+        form = self.form("")
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ["total_guests"])
+
+    def test_chosen_table_still_respected(self):
+        form = self.form(2, table=self.tables[8].id)
+
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data["table"], self.tables[8])
+
+    def test_simulation_shows_best_fit_fills_more_seats(self):
+        results = dict(seating_simulation(tables=20, slots=50))
+
+        self.assertGreater(results["best fit"]["seats_filled"], results["any fit"]["seats_filled"])
+
+
+class WaitlistTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=6)
+        self.date = aware(book_date())
+        self.booking = BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.date)
+
+    def wait(self, username, guests, date=None):
+        return WaitlistEntry.objects.create(
+            user=UserFactory(username=username), lounge=self.lounge, date=date or self.date, total_guests=guests,
+        )
+
+    def cancel(self):
+        return cancel_booking(Booking.objects.select_related("lounge__setting").get(pk=self.booking.pk))
+
+    def test_largest_party_that_fits_gets_the_table(self):
+        self.wait("small", 3)
+        best = self.wait("family", 5)
+        self.wait("too-big", 8)
+        self.wait("too-small", 1)
+        self.wait("later-family", 5)
+
+        replacement = self.cancel()
+
+        self.assertEqual(replacement.user, best.user)
+        self.assertEqual((replacement.table, replacement.date, replacement.total_guests), (self.table, self.date, 5))
+        best.refresh_from_db()
+        self.assertEqual(best.booking, replacement)
+        self.assertFalse(Booking.objects.filter(pk=self.booking.pk).exists())
+
+    def test_nobody_waiting(self):
+        self.wait("elsewhere", 3, date=self.date + datetime.timedelta(days=1))
+
+        self.assertIsNone(self.cancel())
+        self.assertEqual(Booking.objects.count(), 0)
+
+    def test_nearby_time_only_if_free(self):
+        later = self.date + datetime.timedelta(hours=1)
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=self.date + datetime.timedelta(hours=2))
+        self.wait("clashes", 6, date=later)
+        fits = self.wait("fits", 2, date=self.date - datetime.timedelta(hours=1))
+
+        replacement = self.cancel()
+
+        self.assertEqual(replacement.user, fits.user)
+
+    def test_matched_entry_is_not_reused(self):
+        self.wait("family", 4)
+        self.booking = self.cancel()
+
+        self.assertIsNone(self.cancel())
+
+    def test_delete_view_fills_slot(self):
+        entry = self.wait("family", 4)
+        self.client.force_login(self.user)
+
+        self.client.post(f"/delete-booking/{self.booking.id}")
+
+        self.assertTrue(Booking.objects.filter(user=entry.user, table=self.table, date=self.date).exists())
+
+    def test_join_waitlist(self):
+        self.client.force_login(self.user)
+        url = f"/waitlist/{self.lounge.id}"
+
+        response = self.client.post(url, {"date": book_date(), "total_guests": 7})
+        self.assertEqual(response.context["waitlist_form"].errors["total_guests"], ["The maximum table capacity is 6"])
+
+        response = self.client.post(url, {"date": book_date(), "total_guests": 4})
+        self.assertRedirects(response, "/", status_code=302)
+        self.assertEqual(WaitlistEntry.objects.get().user, self.user)
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.failures = 0
+        tasks.HANDLERS["record"] = self.record
+
+    def tearDown(self):
+        del tasks.HANDLERS["record"]
+
+    def record(self, payloads):
+        if self.failures or any(payload.get("bad") for payload in payloads):
+            self.failures = max(self.failures - 1, 0)
+            raise RuntimeError("temporarily broken")
+        self.calls.append(payloads)
+
+    def test_tasks_run_in_batches(self):
+        for n in range(3):
+            tasks.enqueue("record", n=n)
+
+        self.assertEqual(tasks.work(once=True), (3, 0))
+        self.assertEqual(self.calls, [[{"n": 0}, {"n": 1}, {"n": 2}]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_delayed_task_waits(self):
+        tasks.enqueue("record", delay=datetime.timedelta(minutes=5))
+
+        self.assertEqual(tasks.work(once=True), (0, 0))
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_task_retried_with_backoff(self):
+        self.failures = 1
+        queued = tasks.enqueue("record", n=1)
+
+        self.assertEqual(tasks.work(once=True), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn("temporarily broken", queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now())
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.work(once=True), (1, 0))
+
+    def test_gives_up_after_max_attempts(self):
+        self.failures = tasks.MAX_ATTEMPTS
+        queued = tasks.enqueue("record")
+        for _ in range(tasks.MAX_ATTEMPTS):
+            Task.objects.filter(failed_at__isnull=True).update(run_at=timezone.now())
+            tasks.work(once=True)
+
+        queued.refresh_from_db()
+        self.assertIsNotNone(queued.failed_at)
+        self.assertEqual(self.calls, [])
+
+    def test_only_failed_payloads_retried(self):
+        tasks.enqueue("record", n=0)
+        bad = tasks.enqueue("record", n=1, bad=True)
+        tasks.enqueue("record", n=2)
+
+        self.assertEqual(tasks.work(once=True), (2, 1))
+        self.assertEqual(self.calls, [[{"n": 0}], [{"n": 2}]])
+        self.assertEqual(list(Task.objects.all()), [bad])
+        self.assertEqual(Task.objects.get().attempts, 1)
+
+    def test_rejected_confirmation_retried_alone(self):
+        user = UserFactory()
+        bookings = [BookingFactory(user=user, date=timezone.now() + datetime.timedelta(days=days)) for days in (1, 2)]
+        for booking in bookings:
+            tasks.enqueue("booking_confirmation", booking=booking.pk, action="booked")
+        Task.objects.exclude(name="booking_confirmation").delete()
+        send = mail.get_connection().send_messages
+
+        def reject_second(messages):
+            if f"booking-{bookings[1].pk}@" in messages[0].attachments[0][1]:
+                raise ConnectionError("rejected")
+            return send(messages)
+
+        with mock.patch("django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=reject_second):
+            self.assertEqual(tasks.work(once=True), (1, 1))
+        self.assertEqual(len(mail.outbox), 1)
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(tasks.work(once=True), (1, 0))
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_booking_confirmation_sent_by_worker(self):
+        user = UserFactory()
+        lounge = LoungeFactory()
+        table = LoungeBookFactory(lounge=lounge)
+        self.client.force_login(user)
+
+        self.client.post(f"/book-lounge/{lounge.id}", {"table": table.id, "total_guests": 2, "date": book_date()})
+        self.assertEqual(mail.outbox, [])
+
+        out = io.StringIO()
+        call_command("run_tasks", once=True, stdout=out)
+
+        self.assertIn("Ran 2 task(s), 0 failed.", out.getvalue())
+        self.assertEqual(mail.outbox[0].to, [user.email])
+        self.assertIn("Corner Table", mail.outbox[0].body)
+        filename, invite, mimetype = mail.outbox[0].attachments[0]
+        self.assertEqual(mimetype, "text/calendar")
+        self.assertIn(f"UID:booking-{Booking.objects.get().pk}@lounge-booker", invite)
+
+
+class IndexUsageTests(TestCase):
+    """The planner picks the intended index for each hot query once the
+    tables hold a realistic number of rows and have been analyzed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seeded = seed(lounges=30, tables_per_lounge=5, bookings=6000, users=20)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.table = Table.objects.order_by("id").first()
+
+    def assertUsesIndex(self, queryset, *names):
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in names), plan)
+
+    def test_my_bookings_uses_user_date(self):
+        bookings = Booking.objects.filter(user=self.seeded["user"], date__gte=timezone.now()).order_by("date", "pk")
+
+        self.assertUsesIndex(bookings, "booking_user_date_idx")
+
+    def test_clash_check_uses_table_date(self):
+        start = timezone.now()
+
+        self.assertUsesIndex(
+            overlapping_bookings(self.table, start, datetime.timedelta(hours=2)), "booking_table_date_idx"
+        )
+
+    def test_lounge_listing_uses_lounge_date(self):
+        bookings = Booking.objects.filter(
+            lounge_id=self.seeded["lounges"][0], date__gte=timezone.now(),
+        ).order_by("date")
+
+        self.assertUsesIndex(bookings, "booking_lounge_date_idx")
+
+    def test_schedule_uses_lounge_day(self):
+        hours = BusinessHour.objects.filter(lounge_id=self.seeded["lounges"][0]).order_by("day", "start_time")
+
+        # SQLite names the index behind a unique constraint itself
+        self.assertUsesIndex(hours, "businesshour_lounge_day", "sqlite_autoindex_lounge_booker_businesshour")
+
+
+class BookingAdminTests(TestCase):
+    def setUp(self):
+        self.admin = UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+        self.lounge = LoungeFactory()
+        self.table = LoungeBookFactory(lounge=self.lounge)
+        self.url = reverse("admin:lounge_booker_booking_changelist")
+
+    def book(self, days):
+        return BookingFactory(
+            user=self.admin, lounge=self.lounge, table=self.table,
+            date=timezone.now() + datetime.timedelta(days=days),
+        )
+
+    def test_changelist_query_count_is_flat(self):
+        self.book(1)
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+
+        for days in range(2, 30):
+            self.book(days)
+        with self.assertNumQueries(len(first)):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["cl"].result_count, 29)
+
+    def test_date_filter(self):
+        upcoming = self.book(2)
+        self.book(-2)
+
+        response = self.client.get(self.url, {"when": "upcoming"})
+
+        self.assertEqual(list(response.context["cl"].result_list), [upcoming])
+
+    def test_lounge_filter_reads_only_the_chosen_lounge(self):
+        booking = self.book(1)
+        BookingFactory(user=self.admin, table=LoungeBookFactory(lounge=LoungeFactory(name="Elsewhere")),
+                       date=timezone.now() + datetime.timedelta(days=1))
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(self.url)
+
+        for n in range(5):
+            LoungeFactory(name=f"Venue {n}")
+        with self.assertNumQueries(len(first)):
+            response = self.client.get(self.url)
+        self.assertNotContains(response, "Venue 0")
+
+        response = self.client.get(self.url, {"lounge": self.lounge.id})
+        self.assertEqual(list(response.context["cl"].result_list), [booking])
+        self.assertContains(response, self.lounge.name)
+
+    def test_change_form_uses_raw_id_widgets(self):
+        booking = self.book(1)
+
+        response = self.client.get(reverse("admin:lounge_booker_booking_change", args=[booking.id]))
+
+        self.assertContains(response, "vForeignKeyRawIdAdminField", count=2)
+        self.assertContains(response, "admin-autocomplete")
+
+    def test_paginator_caps_filtered_count(self):
+        for days in range(5):
+            self.book(days + 1)
+
+        paginator = EstimatedCountPaginator(Booking.objects.filter(lounge=self.lounge).order_by("id"), 2)
+        paginator.count_limit = 3
+
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.num_pages, 2)
+
+
+class LoungeAdminTests(TestCase):
+    def setUp(self):
+        self.admin = UserFactory(is_staff=True, is_superuser=True)
+        self.client.force_login(self.admin)
+        self.lounge = LoungeFactory()
+        self.url = reverse("admin:lounge_booker_lounge_change", args=[self.lounge.id])
+
+    def add_tables(self, count):
+        Table.objects.bulk_create(
+            LoungeBookFactory.build(lounge=self.lounge, name=f"Table {i}") for i in range(count)
+        )
+
+    def test_small_lounge_edits_tables_inline(self):
+        self.add_tables(3)
+
+        response = self.client.get(self.url)
+
+        self.assertContains(response, 'name="tables-TOTAL_FORMS"')
+
+    def test_big_lounge_links_to_table_list(self):
+        self.add_tables(60)
+        self.client.get(self.url)  # warm the content type cache
+        with CaptureQueriesContext(connection) as first:
+            response = self.client.get(self.url)
+
+        self.assertNotContains(response, 'name="tables-TOTAL_FORMS"')
+        self.assertContains(response, f"?lounge__id__exact={self.lounge.id}")
+        self.add_tables(300)
+        with self.assertNumQueries(len(first)):
+            self.client.get(self.url)
+
+    def test_generate_tables_action(self):
+        self.add_tables(2)
+        other = LoungeFactory(name="Other Lounge")
+        data = {
+            "action": "generate_tables",
+            "_selected_action": [self.lounge.id, other.id],
+            "count": 3,
+            "name": "Booth {n}",
+            "capacity": 4,
+        }
+        changelist = reverse("admin:lounge_booker_lounge_changelist")
+
+        form_page = self.client.post(changelist, data)
+        self.assertEqual(form_page.status_code, 200)
+        self.assertEqual(Table.objects.count(), 2)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(changelist, {**data, "apply": 1})
+        inserts = [query for query in queries if query["sql"].startswith("INSERT")]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            list(other.tables.order_by("id").values_list("name", flat=True)), ["Booth 1", "Booth 2", "Booth 3"],
+        )
+        self.assertEqual(self.lounge.tables.filter(name="Booth 3").count(), 1)
+        self.assertEqual(Table.objects.count(), 8)
+
+    def test_generate_tables_rejects_other_fields(self):
+        for name in ("Booth {x}", "Booth {n.real.foo}", "Booth {n[0]}", "Booth {"):
+            form = GenerateTablesForm({"count": 1, "name": name, "capacity": 4})
+
+            self.assertFalse(form.is_valid(), name)
+            self.assertEqual(form.errors["name"], ["Only {n} may appear in braces."])
+
+
+class OccupancyTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=1)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        self.start = timezone.make_aware(datetime.datetime.combine(
+            timezone.localdate() + datetime.timedelta(days=2), datetime.time(10, 30)
+        ))
+
+    def book(self, **kwargs):
+        kwargs.setdefault("date", self.start)
+        return BookingFactory(user=self.user, lounge=self.lounge, table=self.table, total_guests=3, **kwargs)
+
+    def cells(self):
+        tasks.work(once=True)
+        return {
+            timezone.localtime(hour).hour: (bookings, guest_minutes)
+            for hour, bookings, guest_minutes in Occupancy.objects.filter(table=self.table)
+            .exclude(bookings=0).values_list("hour", "bookings", "guest_minutes")
+        }
+
+    def test_save_adds_minutes_per_hour(self):
+        self.book()
+
+        self.assertEqual(self.cells(), {10: (1, 90), 11: (1, 180), 12: (1, 90)})
+
+    def test_update_moves_occupancy(self):
+        booking = self.book()
+        booking.date = self.start + datetime.timedelta(hours=3, minutes=30)
+        booking.total_guests = 4
+        booking.save()
+
+        self.assertEqual(self.cells(), {14: (1, 240), 15: (1, 240)})
+
+    def test_counted_by_worker(self):
+        booking = self.book()
+        self.assertFalse(Occupancy.objects.exists())
+
+        queued = list(Task.objects.filter(name="occupancy").values_list("payload", flat=True))
+        tasks.work(once=True)
+        # recounting the same hours again changes nothing
+        tasks.update_occupancy(queued)
+        self.assertEqual(self.cells(), {10: (1, 90), 11: (1, 180), 12: (1, 90)})
+
+        booking.delete()
+        tasks.update_occupancy(queued)
+        self.assertEqual(self.cells(), {})
+
+    def test_delete_removes_occupancy(self):
+        self.book().delete()
+
+        self.assertEqual(self.cells(), {})
+
+    def test_import_counts_bulk_inserts(self):
+        row = {"user": self.user.username, "lounge": self.lounge.id, "table": self.table.id,
+               "date": self.start.isoformat(), "total_guests": 2}
+        import_bookings([(1, row)])
+
+        self.assertEqual(self.cells(), {10: (1, 60), 11: (1, 120), 12: (1, 60)})
+
+    def test_rebuild_matches_incremental(self):
+        self.book()
+        self.book(date=self.start + datetime.timedelta(hours=2))
+        incremental = self.cells()
+        Occupancy.objects.all().delete()
+
+        out = io.StringIO()
+        call_command("rebuild_occupancy", lounge=[self.lounge.id], stdout=out)
+
+        self.assertEqual(self.cells(), incremental)
+        self.assertIn("1 lounge(s)", out.getvalue())
+
+    def test_duration_change_rebuilds_lounge(self):
+        self.book()
+        self.setting.booking_duration = 60
+        self.setting.save()
+
+        self.assertEqual(self.cells(), {10: (1, 90), 11: (1, 90)})
+
+    def test_report_reads_only_the_aggregate(self):
+        admin = UserFactory(username="admin", is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        url = reverse("admin:lounge_booker_occupancy_changelist")
+        params = {"lounge": self.lounge.id, "day": self.start.date().isoformat()}
+        self.book()
+        tasks.work(once=True)
+
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["rows"][11][1], [75])
+        with CaptureQueriesContext(connection) as first:
+            self.client.get(url, params)
+
+        for days in range(1, 20):
+            self.book(date=self.start - datetime.timedelta(days=days))
+        with self.assertNumQueries(len(first)):
+            self.client.get(url, params)
+
+    def test_report_needs_view_permission(self):
+        staff = UserFactory(username="staff", is_staff=True)
+        self.client.force_login(staff)
+        url = reverse("admin:lounge_booker_occupancy_changelist")
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename="view_occupancy"))
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(QUERY_STATS_SAMPLE_RATE=1)
+class QueryStatsTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory(is_staff=True)
+        self.client.force_login(self.user)
+        query_stats.reset()
+
+    def test_requests_recorded_per_view(self):
+        self.client.get("/")
+        self.client.get("/")
+
+        home = query_stats.snapshot()["lounge_booker:home"]
+        self.assertEqual(home["requests"], 2)
+        self.assertGreater(home["queries"], 0)
+
+    def test_render_time_recorded(self):
+        self.client.get("/")
+
+        home = query_stats.snapshot()["lounge_booker:home"]
+        self.assertGreater(home["render_seconds"], 0)
+        self.assertLess(home["render_seconds"], home["seconds"])
+        self.assertIn('lounge_booker_render_seconds_total{view="lounge_booker:home"}', query_stats.prometheus_text())
+
+    def test_fingerprint_folds_parameters(self):
+        self.assertEqual(
+            query_stats.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s, %s) LIMIT 21'),
+            query_stats.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s) LIMIT 1'),
+        )
+
+    def test_repeated_queries_counted(self):
+        collector = query_stats.QueryCollector()
+        collector.fingerprints.update(["SELECT a", "SELECT a", "SELECT a", "SELECT b"])
+        query_stats.record("view", 0.1, collector)
+
+        stats = query_stats.snapshot()["view"]
+        self.assertEqual(stats["duplicate_queries"], 2)
+        self.assertEqual(stats["repeated"], {"SELECT a": 3})
+
+    def test_metrics_endpoint(self):
+        self.client.get("/")
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('lounge_booker_requests_total{view="lounge_booker:home"} 1', response.content.decode())
+
+    def test_metrics_staff_only(self):
+        self.client.force_login(UserFactory(username="guest"))
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(QUERY_STATS_SAMPLE_RATE=0)
+    def test_sampling_off(self):
+        self.client.get("/")
+
+        self.assertEqual(query_stats.snapshot(), {})
+
+
+class SeriesTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        self.start = aware(book_date())
+        self.client.force_login(self.user)
+
+    def post(self, url, **data):
+        return self.client.post(url, {
+            "table": self.table.id, "start": timezone.localtime(self.start).strftime("%Y-%m-%dT%H:%M"),
+            "total_guests": 2, "frequency": BookingSeries.WEEKLY, "interval": 1, "count": 4, **data,
+        })
+
+    def test_weekly_occurrences(self):
+        dates = occurrences(self.start, BookingSeries.WEEKLY, 2, 3)
+
+        self.assertEqual(dates, [self.start + datetime.timedelta(weeks=2 * i) for i in range(3)])
+
+    @override_settings(TIME_ZONE="Europe/London")
+    def test_occurrences_keep_wall_clock_time_across_dst(self):
+        start = timezone.make_aware(datetime.datetime(2026, 3, 22, 19, 0))
+
+        dates = occurrences(start, BookingSeries.WEEKLY, 1, 2)
+
+        self.assertEqual([timezone.localtime(d).hour for d in dates], [19, 19])
+        self.assertEqual(dates[1] - dates[0], datetime.timedelta(days=7, hours=-1))
+
+    def test_books_every_occurrence_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(f"/book-series/{self.lounge.id}")
+
+        self.assertRedirects(response, "/my-bookings", fetch_redirect_response=False)
+        series = BookingSeries.objects.get()
+        self.assertEqual(
+            list(series.bookings.order_by("date").values_list("date", flat=True)),
+            [self.start + datetime.timedelta(weeks=i) for i in range(4)],
+        )
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "lounge_booker_booking"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertFalse(Occupancy.objects.exists())
+        tasks.work(once=True)
+        self.assertTrue(Occupancy.objects.filter(table=self.table, bookings=1).exists())
+
+    def test_clash_books_nothing(self):
+        BookingFactory(user=UserFactory(username="other"), lounge=self.lounge, table=self.table,
+                       date=self.start + datetime.timedelta(weeks=2, minutes=30))
+
+        response = self.post(f"/book-series/{self.lounge.id}")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "this table is already booked")
+        self.assertFalse(BookingSeries.objects.exists())
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_clash_check_is_one_query(self):
+        dates = occurrences(self.start, BookingSeries.DAILY, 1, 30)
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table, date=dates[10])
+
+        with self.assertNumQueries(1):
+            clashes = clashing_dates(self.table, dates, datetime.timedelta(hours=2))
+
+        self.assertEqual(clashes, [dates[10]])
+
+    def test_update_replaces_upcoming_bookings(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        series = BookingSeries.objects.get()
+        past = Booking.objects.create(user=self.user, lounge=self.lounge, table=self.table, series=series,
+                                      date=timezone.now() - datetime.timedelta(days=7), total_guests=2)
+
+        response = self.post(f"/update-series/{series.id}", count=2, total_guests=3)
+
+        self.assertRedirects(response, "/my-bookings", fetch_redirect_response=False)
+        upcoming = series.bookings.exclude(pk=past.pk)
+        self.assertEqual(upcoming.count(), 2)
+        self.assertEqual(set(upcoming.values_list("total_guests", flat=True)), {3})
+        self.assertTrue(Booking.objects.filter(pk=past.pk).exists())
+
+    def test_delete_keeps_past_bookings(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        series = BookingSeries.objects.get()
+        past = Booking.objects.create(user=self.user, lounge=self.lounge, table=self.table, series=series,
+                                      date=timezone.now() - datetime.timedelta(days=7), total_guests=2)
+
+        self.client.post(f"/delete-series/{series.id}")
+
+        self.assertFalse(BookingSeries.objects.exists())
+        self.assertEqual(list(Booking.objects.all()), [past])
+        past.refresh_from_db()
+        self.assertIsNone(past.series)
+
+    def wait(self, weeks):
+        return WaitlistEntry.objects.create(
+            user=UserFactory(username=f"waiting-{weeks}"), lounge=self.lounge,
+            date=self.start + datetime.timedelta(weeks=weeks), total_guests=3,
+        )
+
+    def test_delete_offers_times_to_waitlist(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        entry = self.wait(2)
+
+        self.client.post(f"/delete-series/{BookingSeries.objects.get().id}")
+
+        entry.refresh_from_db()
+        self.assertEqual(list(Booking.objects.all()), [entry.booking])
+        self.assertEqual(entry.booking.date, entry.date)
+
+    def test_update_offers_dropped_times_to_waitlist(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        kept, dropped = self.wait(1), self.wait(3)
+
+        self.post(f"/update-series/{BookingSeries.objects.get().id}", count=2)
+
+        kept.refresh_from_db()
+        dropped.refresh_from_db()
+        self.assertIsNone(kept.booking)
+        self.assertEqual(dropped.booking.date, dropped.date)
+
+    def test_update_to_another_table_offers_times_on_the_old_one(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        other = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        taken = BookingFactory(user=UserFactory(username="other"), lounge=self.lounge, table=other,
+                               date=self.start + datetime.timedelta(weeks=3))
+        entry = self.wait(3)
+
+        response = self.post(f"/update-series/{BookingSeries.objects.get().id}", table=other.id, count=2)
+
+        self.assertRedirects(response, "/my-bookings", fetch_redirect_response=False)
+        entry.refresh_from_db()
+        self.assertEqual(entry.booking.table, self.table)
+        self.assertEqual(list(Booking.objects.filter(table=other, date=taken.date)), [taken])
+
+    def test_overlapping_occurrences_rejected(self):
+        self.setting.booking_duration = 60 * 30
+        self.setting.save()
+
+        response = self.post(f"/book-series/{self.lounge.id}", frequency=BookingSeries.DAILY)
+
+        self.assertContains(response, "Each booking would still be running when the next one starts.")
+        self.assertFalse(Booking.objects.exists())
+
+    def test_other_users_series_not_found(self):
+        self.post(f"/book-series/{self.lounge.id}")
+        series = BookingSeries.objects.get()
+        self.client.force_login(UserFactory(username="stranger"))
+
+        self.assertEqual(self.client.post(f"/delete-series/{series.id}").status_code, 404)
+        self.assertEqual(series.bookings.count(), 4)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.setting = SettingFactory(lounge=self.lounge, min_guest=2)
+        self.table = LoungeBookFactory(lounge=self.lounge, capacity=4)
+        self.date = aware(book_date())
+        self.client.force_login(self.user)
+
+    def send(self, method, url, data, **headers):
+        return getattr(self.client, method)(url, json.dumps(data), content_type="application/json", **headers)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_requires_login(self):
+        self.client.logout()
+
+        self.assertEqual(self.client.get("/api/bookings").status_code, 401)
+
+    def test_unchanged_lounges_are_not_modified(self):
+        first = self.client.get("/api/lounges")
+        self.assertEqual(first.json()["lounges"][0]["name"], self.lounge.name)
+
+        with self.assertNumQueries(3):  # session, user, probe
+            again = self.revalidate("/api/lounges", first)
+
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+
+    def test_changed_lounge_gets_a_new_etag(self):
+        first = self.client.get(f"/api/lounges/{self.lounge.id}")
+        self.assertEqual(first.json()["tables"], [{"id": self.table.id, "name": self.table.name, "capacity": 4}])
+
+        self.table.delete()
+
+        again = self.revalidate(f"/api/lounges/{self.lounge.id}", first)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()["tables"], [])
+        self.assertNotEqual(again["ETag"], first["ETag"])
+
+    def test_availability_changes_when_a_booking_is_made(self):
+        day = self.date.date() + datetime.timedelta(days=1)
+        url = f"/api/lounges/{self.lounge.id}/availability?start={day}&end={day}"
+        BusinessHourFactory(
+            lounge=self.lounge, day=day.weekday(), start_time=datetime.time(10, 0), finish_time=datetime.time(14, 0),
+        )
+        first = self.client.get(url)
+        self.assertEqual(len(first.json()["slots"]), 2)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        BookingFactory(user=self.user, lounge=self.lounge, table=self.table,
+                       date=timezone.make_aware(datetime.datetime.combine(day, datetime.time(10, 0))))
+
+        again = self.revalidate(url, first)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(len(again.json()["slots"]), 1)
+
+    def test_booking_crud(self):
+        created = self.send("post", "/api/bookings", {
+            "lounge": self.lounge.id, "table": self.table.id, "date": self.date.isoformat(), "total_guests": 2,
+        })
+        self.assertEqual(created.status_code, 201, created.content)
+        url = f"/api/bookings/{created.json()['id']}"
+
+        listed = self.client.get("/api/bookings")
+        self.assertEqual([b["id"] for b in listed.json()["bookings"]], [created.json()["id"]])
+        self.assertEqual(self.revalidate("/api/bookings", listed).status_code, 304)
+
+        fetched = self.client.get(url)
+        self.assertTrue(fetched.has_header("Last-Modified"))
+        updated = self.send("patch", url, {"total_guests": 3}, HTTP_IF_MATCH=fetched["ETag"])
+        self.assertEqual(updated.json()["total_guests"], 3)
+
+        stale = self.send("patch", url, {"total_guests": 4}, HTTP_IF_MATCH=fetched["ETag"])
+        self.assertEqual(stale.status_code, 412)
+        again = self.send("patch", url, {"total_guests": 4}, HTTP_IF_MATCH=updated["ETag"])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(self.revalidate(url, again).status_code, 304)
+
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.revalidate("/api/bookings", listed).status_code, 200)
+
+    def test_invalid_booking(self):
+        response = self.send("post", "/api/bookings", {
+            "lounge": self.lounge.id, "table": self.table.id, "date": self.date.isoformat(), "total_guests": 9,
+        })
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("total_guests", response.json()["errors"])
+        self.assertFalse(Booking.objects.exists())
+
+    def test_retried_create_returns_the_first_booking(self):
+        body = {"lounge": self.lounge.id, "date": self.date.isoformat(), "total_guests": 2, "idempotency_key": "k1"}
+
+        first = self.send("post", "/api/bookings", body)
+        retry = self.send("post", "/api/bookings", body)
+
+        self.assertEqual((first.status_code, retry.status_code), (201, 200))
+        self.assertEqual(retry.json()["id"], first.json()["id"])
+
+    def test_retried_create_with_other_details_gets_errors(self):
+        body = {"lounge": self.lounge.id, "date": self.date.isoformat(), "total_guests": 2, "idempotency_key": "k1"}
+        self.send("post", "/api/bookings", body)
+        later = (self.date + datetime.timedelta(days=1)).isoformat()
+
+        moved = self.send("post", "/api/bookings", {**body, "date": later})
+        crowded = self.send("post", "/api/bookings", {**body, "total_guests": 99})
+
+        self.assertEqual((moved.status_code, crowded.status_code), (400, 400))
+        self.assertEqual(Booking.objects.get().date, self.date)
+
+    def test_other_users_booking_not_found(self):
+        booking = BookingFactory(user=UserFactory(username="other"), lounge=self.lounge, table=self.table, date=self.date)
+
+        self.assertEqual(self.client.get(f"/api/bookings/{booking.id}").status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/bookings/{booking.id}").status_code, 404)
+        self.assertTrue(Booking.objects.filter(pk=booking.pk).exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory()
+        self.when = aware(book_date())
+
+    def lounge(self, name, postcode="E17 8BL", capacity=4, **setting):
+        lounge = LoungeFactory(name=name, postcode=postcode)
+        LoungeBookFactory(lounge=lounge, capacity=capacity)
+        if setting:
+            SettingFactory(lounge=lounge, **setting)
+        return lounge
+
+    def names(self, **search):
+        return [lounge.name for lounge in search_lounges(**search)]
+
+    def test_outward_code(self):
+        self.assertEqual(outward_code("sw1a 1aa"), "SW1A")
+        self.assertEqual(outward_code("E178BL"), "E17")
+        self.assertEqual(outward_code("sw1"), "SW1")
+        self.assertEqual(LoungeFactory(postcode="n1 9gu").outward_code, "N1")
+
+    def test_nearest_postcodes_first(self):
+        self.lounge("Wimbledon", "SW19 2AB")
+        self.lounge("Belgravia", "SW1X 7LY")
+        self.lounge("Westminster", "SW1A 1AA")
+        self.lounge("Islington", "N1 9GU")
+
+        self.assertEqual(self.names(postcode="SW1A 2BB"), ["Westminster", "Belgravia", "Wimbledon"])
+        self.assertEqual(self.names(postcode="sw1"), ["Westminster", "Belgravia", "Wimbledon"])
+
+    def test_name_matches_anywhere_prefix_first(self):
+        self.lounge("The Blue Lounge")
+        self.lounge("Blue Bar")
+        self.lounge("Red Room")
+
+        self.assertEqual(self.names(q="blue"), ["Blue Bar", "The Blue Lounge"])
+
+    def test_only_lounges_with_a_free_table(self):
+        free = self.lounge("Free")
+        taken = self.lounge("Taken")
+        BookingFactory(user=self.user, lounge=taken, table=taken.tables.get(),
+                       date=self.when + datetime.timedelta(minutes=90))
+        self.lounge("Too Small", capacity=2)
+        self.lounge("Minimum Six", capacity=8, min_guest=6)
+        closed = self.lounge("Closed")
+        BusinessHourFactory(lounge=closed, day=timezone.localtime(self.when).weekday(),
+                            start_time=datetime.time(0, 0), finish_time=datetime.time(0, 1))
+        short = self.lounge("Short Visits", min_guest=1, booking_duration=60)
+        BookingFactory(user=self.user, lounge=short, table=short.tables.get(),
+                       date=self.when + datetime.timedelta(minutes=90))
+
+        with self.assertNumQueries(2):
+            found = self.names(guests=4, when=self.when)
+
+        self.assertEqual(found, ["Free", "Short Visits"])
+        self.assertFalse(BookingForm(lounge_for_booking().get(pk=free.pk), {
+            "date": self.when.strftime("%Y-%m-%dT%H:%M"), "total_guests": 4,
+        }).errors)
+
+    def test_search_is_one_query_and_limited(self):
+        for i in range(5):
+            self.lounge(f"Lounge {i}", "SW1A 1AA")
+
+        with self.assertNumQueries(1):
+            found = self.names(q="lounge", postcode="SW1A", limit=3)
+
+        self.assertEqual(found, ["Lounge 0", "Lounge 1", "Lounge 2"])
+
+    def test_home_page_search(self):
+        self.lounge("Westminster", "SW1A 1AA")
+        self.lounge("Islington", "N1 9GU")
+        self.client.force_login(self.user)
+
+        response = self.client.get("/", {"postcode": "SW1A"})
+
+        self.assertEqual([lounge.name for lounge in response.context["lounges"]], ["Westminster"])
+
+    def test_time_needs_guests(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get("/", {"when": self.when.strftime("%Y-%m-%dT%H:%M")})
+
+        self.assertContains(response, "Please choose both a number of guests and a time")
+
+
+class SessionEngineTests(TestCase):
+    def store(self, cache, session_key=None):
+        """The session as one process sees it, with that process's own local-memory cache."""
+        session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        if hasattr(session, "_cache"):
+            session._cache = cache
+        return session
+
+    def test_logout_seen_by_every_process(self):
+        first, second = LocMemCache("worker-1", {}), LocMemCache("worker-2", {})
+        session = self.store(first)
+        session["_auth_user_id"] = "1"
+        session.save()
+        self.assertEqual(self.store(second, session.session_key).load(), {"_auth_user_id": "1"})
+
+        self.store(first, session.session_key).flush()
+
+        self.assertEqual(self.store(second, session.session_key).load(), {})
+
+    def settings_with(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            for name in {"CACHE_BACKEND", "SESSION_ENGINE"} - set(environ):
+                os.environ.pop(name, None)
+            return runpy.run_module("project.settings")
+
+    def test_cached_sessions_need_a_shared_cache(self):
+        cached_db = "django.contrib.sessions.backends.cached_db"
+        memcached = "django.core.cache.backends.memcached.MemcachedCache"
+
+        self.assertEqual(self.settings_with()["SESSION_ENGINE"], "django.contrib.sessions.backends.db")
+        self.assertEqual(self.settings_with(CACHE_BACKEND=memcached)["SESSION_ENGINE"], cached_db)
+        with self.assertRaises(ImproperlyConfigured):
+            self.settings_with(SESSION_ENGINE=cached_db)
+
+
+class SessionPurgeTests(TestCase):
+    def session(self, key, expires_in):
+        return Session.objects.create(
+            session_key=key, session_data="", expire_date=timezone.now() + datetime.timedelta(days=expires_in),
+        )
+
+    def test_deletes_expired_in_batches(self):
+        for i in range(3):
+            self.session(f"old{i}", -1)
+        current = self.session("current", 1)
+
+        # a lookup and a delete per batch
+        with self.assertNumQueries(4):
+            self.assertEqual(purge_expired(batch_size=2), 3)
+
+        self.assertEqual(list(Session.objects.all()), [current])
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_nothing_stored_with_signed_cookies(self):
+        self.session("old", -1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(purge_expired(), 0)
+
+    def test_command(self):
+        self.session("old", -1)
+        out = io.StringIO()
+
+        call_command("purge_sessions", "--sleep", "0", stdout=out)
+
+        self.assertIn("Deleted 1 expired session(s).", out.getvalue())
+        self.assertFalse(Session.objects.exists())
+
+
+class LoginCostTests(LoginTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = UserFactory()
+        self.data = {"username": self.user.username, "password": "top-secret"}
+
+    def test_password_checked_once(self):
+        with mock.patch("django.contrib.auth.base_user.check_password", wraps=check_password) as checked:
+            response = self.client.post("/login", self.data)
+
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+        self.assertEqual(checked.call_count, 1)
+
+    def test_weaker_hash_upgraded_on_login(self):
+        with self.settings(PASSWORD_HASH_ITERATIONS=1000):
+            self.user.set_password("top-secret")
+            self.user.save()
+
+        self.client.post("/login", self.data)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith(f"pbkdf2_sha256${settings.PASSWORD_HASH_ITERATIONS}$"))
+
+    def test_other_hasher_upgraded_on_login(self):
+        self.user.password = make_password("top-secret", hasher="pbkdf2_sha1")
+        self.user.save()
+
+        self.client.post("/login", self.data)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+    @override_settings(LOGIN_BURST=2)
+    def test_throttled_per_address(self):
+        for username in ("a", "b"):
+            self.assertEqual(self.client.post("/login", {"username": username, "password": "x"}).status_code, 200)
+        throttled = self.client.post("/login", self.data)
+
+        self.assertEqual(throttled.status_code, 429)
+        self.assertContains(throttled, "Too many attempts", status_code=429)
+        self.assertNotIn("_auth_user_id", self.client.session)
+
+    @override_settings(LOGIN_USERNAME_BURST=2)
+    def test_throttled_per_username(self):
+        for address in ("10.0.0.1", "10.0.0.2"):
+            self.client.post("/login", {**self.data, "password": "x"}, REMOTE_ADDR=address)
+        throttled = self.client.post("/login", self.data, REMOTE_ADDR="10.0.0.3")
+
+        self.assertEqual(throttled.status_code, 429)
+
+    @override_settings(LOGIN_BURST=2, LOGIN_USERNAME_BURST=4)
+    def test_throttled_client_cannot_lock_out_account(self):
+        for _ in range(5):
+            self.client.post("/login", {**self.data, "password": "x"}, REMOTE_ADDR="10.0.0.1")
+
+        response = self.client.post("/login", self.data, REMOTE_ADDR="10.0.0.2")
+
+        self.assertRedirects(response, "/", fetch_redirect_response=False)
+
+    @override_settings(LOGIN_BURST=1, TRUSTED_PROXY_COUNT=1)
+    def test_throttled_per_forwarded_address(self):
+        def attempt(forwarded_for):
+            return self.client.post(
+                "/login", {"username": forwarded_for, "password": "x"},
+                REMOTE_ADDR="10.0.0.254", HTTP_X_FORWARDED_FOR=forwarded_for,
+            ).status_code
+
+        self.assertEqual(attempt("203.0.113.1"), 200)
+        self.assertEqual(attempt("203.0.113.2"), 200)
+        # entries left of the proxy's own are the client's to choose
+        self.assertEqual(attempt("198.51.100.7, 203.0.113.1"), 429)
+
+    def test_settings_read_when_changed(self):
+        with self.settings(LOGIN_BURST=3):
+            self.assertEqual(login_attempts("address").capacity, 3)
+        self.assertEqual(login_attempts("address").capacity, settings.LOGIN_BURST)
+
+    def test_login_cost_benchmark(self):
+        results = dict(login_cost(1))
+
+        self.assertEqual(set(results), {"twice", "once", "login view"})
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.bucket = TokenBucket(capacity=2, rate=0.5, clock=lambda: self.now, max_keys=2)
+
+    def test_refills_over_time(self):
+        self.assertEqual([self.bucket.take("a") for _ in range(3)], [True, True, False])
+
+        self.now = 1.0
+        self.assertFalse(self.bucket.take("a"))
+        self.now = 2.0
+        self.assertTrue(self.bucket.take("a"))
+        self.assertTrue(self.bucket.take("b"))
+
+    def test_forgets_only_full_buckets(self):
+        self.bucket.take("a")
+        self.bucket.take("a")
+        self.bucket.take("b")
+        self.now = 2.0  # b is full again, a has one token
+        self.bucket.take("c")
+
+        self.assertEqual(set(self.bucket._buckets), {"a", "c"})
+        self.assertTrue(self.bucket.take("a"))
+        self.assertFalse(self.bucket.take("a"))
+
+
+@override_settings(TEMPLATES=settings.PRODUCTION_TEMPLATES)
+class TemplateCacheTests(TestCase):
+    def setUp(self):
+        caches["templates"].clear()
+        self.user = UserFactory()
+        self.lounge = LoungeFactory()
+        self.table = LoungeBookFactory(lounge=self.lounge, name="Window Table")
+        self.booking = BookingFactory(
+            user=self.user, lounge=self.lounge, table=self.table, date=timezone.now() + datetime.timedelta(days=1),
+        )
+        self.client.force_login(self.user)
+
+    def test_production_needs_secret_key(self):
+        with mock.patch.dict(os.environ, {"SECRET_KEY": ""}):
+            with self.assertRaises(ImproperlyConfigured):
+                runpy.run_module("project.settings_production")
+
+    def test_shared_cache_holds_fragments(self):
+        environ = {"CACHE_BACKEND": "django.core.cache.backends.memcached.MemcachedCache", "CACHE_LOCATION": "10.0.0.5:11211"}
+        with mock.patch.dict(os.environ, environ):
+            os.environ.pop("TEMPLATE_CACHE_LOCATION", None)
+            cache_settings = runpy.run_module("project.settings")["CACHES"]
+
+        self.assertEqual(cache_settings["templates"]["LOCATION"], "10.0.0.5:11211")
+
+    def test_production_templates_compiled_once(self):
+        self.assertIsInstance(engines["django"].engine.template_loaders[0], CachedLoader)
+        self.assertContains(self.client.get("/"), self.lounge.name)
+
+    def test_lounge_list_rendered_from_cache(self):
+        self.client.get("/")
+
+        with mock.patch("lounge_booker.views.lounge_catalogue") as catalogue:
+            response = self.client.get("/")
+
+        catalogue.assert_not_called()
+        self.assertContains(response, self.lounge.name)
+
+    def test_lounge_list_refreshed_on_change(self):
+        self.client.get("/")
+        self.lounge.name = "Renamed Lounge"
+        self.lounge.save()
+
+        self.assertContains(self.client.get("/"), "Renamed Lounge")
+
+    def test_booking_rows_refreshed_on_change(self):
+        self.assertContains(self.client.get("/my-bookings"), "Window Table")
+
+        self.table.name = "Garden Table"
+        self.table.save()
+
+        self.assertContains(self.client.get("/my-bookings"), "Garden Table")
+
+    def test_booking_rows_refreshed_when_series_detached(self):
+        series = BookingSeries.objects.create(
+            user=self.user, lounge=self.lounge, table=self.table, start=self.booking.date, count=2, total_guests=2,
+        )
+        Booking.objects.filter(pk=self.booking.pk).update(series=series)
+        self.assertContains(self.client.get("/my-bookings"), "Cancel Series")
+
+        series.delete()
+
+        self.assertNotContains(self.client.get("/my-bookings"), "Cancel Series")
+
+
+class BenchmarkTests(TestCase):
+    def test_percentile(self):
+        samples = list(range(1, 101))
+
+        self.assertEqual(percentile(samples, 50), 50)
+        self.assertEqual(percentile(samples, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+
+    def test_seeded_flows_succeed(self):
+        seeded = seed(lounges=2, tables_per_lounge=2, bookings=30, users=2)
+
+        self.assertEqual(Booking.objects.count(), 30)
+        for name, request, expected_status in booking_flows(seeded):
+            stats = measure(request, 2, expected_status)
+            self.assertEqual(stats["errors"], 0, name)
+
+    def test_session_comparison(self):
+        seeded = seed(lounges=1, tables_per_lounge=1, bookings=5, users=1)
+
+        results = dict(session_comparison(seeded, 2))
+
+        self.assertEqual(results["db"]["home"]["queries"], results["cached_db"]["home"]["queries"] + 1)
+        self.assertEqual(results["signed"]["my_bookings"]["queries"], results["cached_db"]["my_bookings"]["queries"])
+        self.assertEqual(results["db"]["my_bookings"]["errors"], 0)
+
+    def test_template_rendering(self):
+        seeded = seed(lounges=1, tables_per_lounge=1, bookings=5, users=1)
+
+        results = dict(template_rendering(seeded, 2))
+
+        self.assertEqual(set(results), {"development", "cached loader", "fragments"})
+        self.assertEqual(results["fragments"]["home"]["errors"], 0)
+
+    def test_connection_overhead(self):
+        results = dict(connection_overhead(3))
+
+        self.assertEqual(set(results), {"connect", "pool"})
+        self.assertEqual(results["pool"]["requests"], 3)
+
+
+class FakeConnection:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        self.opened.append(FakeConnection())
+        return self.opened[-1]
+
+    def test_reuses_returned_connection(self):
+        pool = ConnectionPool(size=2, timeout=0.1)
+        first = pool.get(self.connect)
+        pool.put(first)
+
+        self.assertIs(pool.get(self.connect), first)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool(size=2, timeout=0.05)
+        pool.get(self.connect)
+        pool.get(self.connect)
+
+        with self.assertRaises(PoolTimeout):
+            pool.get(self.connect)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_waits_for_connection_from_other_thread(self):
+        pool = ConnectionPool(size=1, timeout=5)
+        held = pool.get(self.connect)
+        threading.Timer(0.05, pool.put, [held]).start()
+
+        self.assertIs(pool.get(self.connect), held)
+
+    def test_discard_closes_and_frees_slot(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+        broken = pool.get(self.connect)
+        pool.discard(broken)
+
+        self.assertTrue(broken.closed)
+        self.assertIsNot(pool.get(self.connect), broken)
+
+    def test_failed_connect_frees_slot(self):
+        pool = ConnectionPool(size=1, timeout=0.05)
+
+        def refuse():
+            raise OSError("connection refused")
+
+        with self.assertRaises(OSError):
+            pool.get(refuse)
+        self.assertIsInstance(pool.get(self.connect), FakeConnection)
+
+    def test_pooling_defaults_conn_max_age_to_zero(self):
+        with mock.patch.dict(os.environ, {"DATABASE_POOL_SIZE": "4"}):
+            os.environ.pop("DATABASE_CONN_MAX_AGE", None)
+            database = runpy.run_module("project.settings")["DATABASES"]["default"]
+
+        self.assertEqual(database["CONN_MAX_AGE"], 0)
+
+
+def fake_psycopg2():
+    """ stand-ins for psycopg2 and the submodules Django's postgres backend imports """
+    errors = {"Error": type("Error", (Exception,), {}), "Warning": type("Warning", (Exception,), {})}
+    errors["InterfaceError"] = type("InterfaceError", (errors["Error"],), {})
+    errors["DatabaseError"] = type("DatabaseError", (errors["Error"],), {})
+    for name in ("DataError", "OperationalError", "IntegrityError", "InternalError", "ProgrammingError", "NotSupportedError"):
+        errors[name] = type(name, (errors["DatabaseError"],), {})
+    extensions = mock.MagicMock(TRANSACTION_STATUS_IDLE=0)
+    extras = mock.MagicMock()
+    psycopg2 = mock.MagicMock(__version__="2.8.6 (dt dec pq3 ext)", extensions=extensions, extras=extras, **errors)
+    return {"psycopg2": psycopg2, "psycopg2.extensions": extensions, "psycopg2.extras": extras}
+
+
+class PostgresBackendTests(SimpleTestCase):
+    """ the project's postgres backend, loaded against a fake psycopg2 """
+
+    def setUp(self):
+        modules = fake_psycopg2()
+        self.Database = modules["psycopg2"]
+        self.Database.connect.side_effect = self.connect
+        self.opened = []
+        # The backend modules are imported afresh against the fakes, then
+        # dropped again with them when the patch ends.
+        with mock.patch.dict(sys.modules, modules):
+            for name in [name for name in sys.modules if name.startswith(("django.db.backends.postgresql", "project.db.postgresql"))]:
+                del sys.modules[name]
+            self.backend = import_module("project.db.postgresql.base")
+
+    def connect(self, **params):
+        self.opened.append(mock.MagicMock(closed=0, isolation_level=1))
+        self.opened[-1].get_parameter_status.return_value = "UTC"
+        self.opened[-1].get_transaction_status.return_value = 0
+        return self.opened[-1]
+
+    def go_stale(self, connection):
+        connection.cursor.return_value.__enter__.return_value.execute.side_effect = self.Database.OperationalError
+
+    def wrapper(self, conn_max_age=0, **options):
+        return self.backend.DatabaseWrapper({
+            "ENGINE": "project.db.postgresql", "NAME": "lounge", "USER": "", "PASSWORD": "", "HOST": "", "PORT": "",
+            "ATOMIC_REQUESTS": False, "AUTOCOMMIT": True, "CONN_MAX_AGE": conn_max_age, "TIME_ZONE": None,
+            "OPTIONS": {"HEALTH_CHECKS": True, "POOL_SIZE": 2, **options},
+        })
+
+    def test_refuses_persistent_pooled_connections(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(conn_max_age=60)
+
+    def test_pooled_connection_returned_after_each_request(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        lent = first.connection
+
+        first.close_if_unusable_or_obsolete()
+        second = self.wrapper()
+        second.ensure_connection()
+
+        self.assertIsNone(first.connection)
+        self.assertIs(second.connection, lent)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_stale_pooled_connection_replaced_before_first_query(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        stale = first.connection
+        first.close()
+        self.go_stale(stale)
+
+        second = self.wrapper()
+        second.ensure_connection()
+
+        self.assertIsNot(second.connection, stale)
+        self.assertTrue(stale.close.called)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_stale_persistent_connection_replaced_at_next_request(self):
+        wrapper = self.wrapper(conn_max_age=60, POOL_SIZE=0)
+        wrapper.ensure_connection()
+        stale = wrapper.connection
+        self.go_stale(stale)
+
+        wrapper.close_if_unusable_or_obsolete()
+        wrapper.ensure_connection()
+
+        self.assertIsNot(wrapper.connection, stale)
+        self.assertEqual(len(self.opened), 2)
+
+
+def book_date(days=3, hours=1, minutes=30, past=False):
+    today = datetime.datetime.today()
+    delta = datetime.timedelta(days, hours, minutes)
+    date = today - delta if past else today + delta
+
+    return date.strftime("%Y-%m-%dT%H:%M")
 
-    return date.strftime("%Y-%m-%dT%H:%M")
 
+def aware(date):
+    """ turn a book_date() string into the datetime the form would clean it to """
+    return timezone.make_aware(datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M"))
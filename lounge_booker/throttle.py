@@ -0,0 +1,109 @@
+"""Token buckets for throttling login and signup attempts.
+
+Each process keeps its buckets in memory: there is nothing to run and no
+round trip per attempt, at the price of the limit applying per worker
+rather than across the site.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+MAX_KEYS = 10000
+
+
+class TokenBucket:
+    """Up to ``capacity`` tokens per key, refilled at ``rate`` tokens a second."""
+
+    def __init__(self, capacity, rate, clock=time.monotonic, max_keys=MAX_KEYS):
+        self.capacity = capacity
+        self.rate = rate
+        self.clock = clock
+        self.max_keys = max_keys
+        self._buckets = {}  # key: (tokens, last refilled)
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Take one of ``key``'s tokens; ``False`` if it has none left."""
+        now = self.clock()
+        with self._lock:
+            tokens = self._tokens(key, now)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._forget_full(now)
+        return allowed
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def _tokens(self, key, now):
+        tokens, refilled = self._buckets.get(key, (self.capacity, now))
+        return min(self.capacity, tokens + (now - refilled) * self.rate)
+
+    def _forget_full(self, now):
+        # A full bucket behaves exactly like one never seen, so dropping
+        # those bounds memory without letting anyone off early.
+        for key in [key for key in self._buckets if self._tokens(key, now) >= self.capacity]:
+            del self._buckets[key]
+
+
+_login_attempts = {}
+_login_attempts_lock = threading.Lock()
+
+
+def login_attempts(scope="address"):
+    """The bucket counting login and signup attempts per client ``"address"``
+    or per ``"username"``, built from the settings on first use."""
+    with _login_attempts_lock:
+        if scope not in _login_attempts:
+            if scope == "address":
+                burst, rate = settings.LOGIN_BURST, settings.LOGIN_RATE
+            else:
+                burst, rate = settings.LOGIN_USERNAME_BURST, settings.LOGIN_USERNAME_RATE
+            _login_attempts[scope] = TokenBucket(burst, rate / 60)
+        return _login_attempts[scope]
+
+
+def reset_login_attempts():
+    """Forget every attempt; the buckets are rebuilt from the settings."""
+    with _login_attempts_lock:
+        _login_attempts.clear()
+
+
+@receiver(setting_changed)
+def login_settings_changed(setting, **kwargs):
+    if setting.startswith("LOGIN_"):
+        reset_login_attempts()
+
+
+def client_address(request):
+    """The address a request's attempts are counted against.
+
+    Behind ``TRUSTED_PROXY_COUNT`` reverse proxies, each appending the
+    address it saw to ``X-Forwarded-For``, that is the entry the outermost
+    proxy added; anything further left came from the client itself.
+    """
+    proxies = settings.TRUSTED_PROXY_COUNT
+    if proxies:
+        forwarded = [address.strip() for address in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",")]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def allow_attempt(request, username=""):
+    """Take a token for the client's address and then for ``username``.
+
+    A client cannot spread its guesses across usernames, nor many clients
+    gang up on one account. The username is only charged once the address
+    has had its token, and its bucket outlasts any single address's, so one
+    client on its own can never drain it and lock the owner out.
+    """
+    if not login_attempts("address").take(client_address(request)):
+        return False
+    return not username or login_attempts("username").take(username.lower())
@@ -0,0 +1,188 @@
+"""Streaming booking import and export used by the ``import_bookings`` and
+``export_bookings`` management commands."""
+import bisect
+import csv
+import datetime
+import itertools
+import json
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from . import occupancy
+from .availability import TABLE_TAKEN, booking_duration
+from .models import Booking, Table
+from .validation import validate_booking
+
+IMPORT_FIELDS = ("user", "lounge", "table", "date", "total_guests")
+EXPORT_FIELDS = ("id",) + IMPORT_FIELDS
+FORMATS = ("csv", "jsonl")
+
+
+def guess_format(path):
+    return "jsonl" if str(path).endswith((".jsonl", ".ndjson")) else "csv"
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, row)`` from a CSV or JSON Lines stream.
+
+    A JSON line that does not decode is yielded as a ``ValidationError``,
+    which ``parse_row`` raises so the line is reported and skipped like any
+    other unreadable row.
+    """
+    if fmt == "jsonl":
+        for number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as error:
+                    yield number, ValidationError(f"Could not read row: {error}")
+    else:
+        # line 1 is the header
+        for number, row in enumerate(csv.DictReader(stream), start=2):
+            yield number, row
+
+
+def parse_row(row):
+    """Turn a raw row into ``(username, lounge_id, table_id, date, total_guests)``."""
+    if isinstance(row, ValidationError):
+        raise row
+    try:
+        date = datetime.datetime.fromisoformat(str(row["date"]))
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        guests = row.get("total_guests")
+        return (
+            str(row["user"]),
+            int(row["lounge"]),
+            int(row["table"]),
+            date,
+            int(guests) if guests not in (None, "") else None,
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValidationError(f"Could not read row: {error}")
+
+
+def import_bookings(rows, batch_size=1000, allow_past=False, on_error=None):
+    """Validate and insert ``(line_number, row)`` pairs in batches.
+
+    Each batch costs a handful of queries rather than a few per row: one for its
+    users, one for its tables (with lounge and setting), the table lock, one
+    for the existing bookings those tables hold across the batch's dates,
+    the ``bulk_create``, and two for every ``occupancy.CELLS_PER_QUERY``
+    hours of occupancy it adds. Clashes are checked against those bookings
+    and against earlier rows of the same import. Rows that are skipped are
+    passed to ``on_error(line_number, message)`` as each batch finishes, so
+    memory stays constant however many there are. Returns the number of
+    bookings created and the number of rows skipped.
+    """
+    created = skipped = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            return created, skipped
+        batch_created, batch_errors = _import_batch(batch, allow_past)
+        created += batch_created
+        skipped += len(batch_errors)
+        if on_error is not None:
+            for number, message in batch_errors:
+                on_error(number, message)
+
+
+def _import_batch(batch, allow_past):
+    errors, parsed = [], []
+    for number, row in batch:
+        try:
+            parsed.append((number, parse_row(row)))
+        except ValidationError as error:
+            errors.append((number, " ".join(error.messages)))
+    if not parsed:
+        return 0, errors
+
+    usernames = {values[0] for _, values in parsed}
+    users = dict(User.objects.filter(username__in=usernames).values_list("username", "id"))
+    tables = Table.objects.select_related("lounge__setting").in_bulk({values[2] for _, values in parsed})
+
+    checked = []
+    for number, (username, lounge_id, table_id, date, total_guests) in parsed:
+        table = tables.get(table_id)
+        try:
+            if username not in users:
+                raise ValidationError(f"Unknown user {username!r}.")
+            if table is None or table.lounge_id != lounge_id:
+                raise ValidationError(f"Lounge {lounge_id} has no table {table_id}.")
+            validate_booking(table.lounge, table, date, total_guests, allow_past=allow_past)
+        except ValidationError as error:
+            errors.append((number, " ".join(error.messages)))
+            continue
+        checked.append((number, Booking(
+            user_id=users[username], lounge_id=lounge_id, table=table, date=date, total_guests=total_guests,
+        )))
+    if not checked:
+        return 0, errors
+
+    durations = {booking.table.lounge_id: booking_duration(booking.table.lounge) for _, booking in checked}
+    longest = max(durations.values())
+    booked = {booking.table_id: [] for _, booking in checked}
+
+    with transaction.atomic():
+        # Same lock book_table() takes, so live bookings cannot slip in
+        # between the clash check and the insert.
+        list(Table.objects.select_for_update().filter(id__in=booked).order_by("id").values_list("id"))
+        existing = Booking.objects.filter(
+            table_id__in=booked,
+            date__gt=min(booking.date for _, booking in checked) - longest,
+            date__lt=max(booking.date for _, booking in checked) + longest,
+        ).values_list("table_id", "date")
+        for table_id, date in existing:
+            booked[table_id].append(date)
+        for dates in booked.values():
+            dates.sort()
+
+        accepted = []
+        for number, booking in checked:
+            dates = booked[booking.table_id]
+            duration = durations[booking.table.lounge_id]
+            index = bisect.bisect_left(dates, booking.date)
+            clashes_after = index < len(dates) and dates[index] < booking.date + duration
+            clashes_before = index > 0 and dates[index - 1] + duration > booking.date
+            if clashes_after or clashes_before:
+                errors.append((number, TABLE_TAKEN))
+                continue
+            dates.insert(index, booking.date)
+            accepted.append(booking)
+
+        Booking.objects.bulk_create(accepted)
+        # bulk_create sends no post_save
+        occupancy.add_bookings(accepted, durations)
+    return len(accepted), errors
+
+
+def export_bookings(stream, fmt, chunk_size=2000):
+    """Write every booking to ``stream``, oldest first, in constant memory.
+
+    ``iterator()`` streams rows through a server-side cursor where the
+    database supports one, so the result set is never held in full.
+    """
+    rows = (
+        Booking.objects.order_by("id")
+        .values_list("id", "user__username", "lounge_id", "table_id", "date", "total_guests")
+        .iterator(chunk_size=chunk_size)
+    )
+    count = 0
+    if fmt == "jsonl":
+        for values in rows:
+            record = dict(zip(EXPORT_FIELDS, values))
+            record["date"] = record["date"].isoformat()
+            stream.write(json.dumps(record) + "\n")
+            count += 1
+    else:
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_FIELDS)
+        for values in rows:
+            writer.writerow(values[:4] + (values[4].isoformat(), values[5]))
+            count += 1
+    return count
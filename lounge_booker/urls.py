@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views 
+from . import api, async_views, views 
 
 app_name = "lounge_booker"
 
@@ -10,8 +10,21 @@ urlpatterns = [
     path("logout", views.logout_page, name="logout"),
     path("signup", views.signup_page, name="signup"),
     path("book-lounge/<int:lounge_id>", views.book_lounge, name="book-lounge"),
+    path("book-series/<int:lounge_id>", views.book_series, name="book-series"),
+    path("update-series/<int:series_id>", views.update_series, name="update-series"),
+    path("delete-series/<int:series_id>", views.cancel_series, name="delete-series"),
+    path("waitlist/<int:lounge_id>", views.join_waitlist, name="join-waitlist"),
+    path("lounge-availability/<int:lounge_id>", views.lounge_availability, name="lounge-availability"),
     path("my-bookings", views.my_bookings, name="my-bookings"),
     path("delete-booking/<int:booking_id>", views.delete_booking, name="delete-booking"),
     path("update-booking/<int:booking_id>", views.update_booking, name="update-booking"),
+    path("metrics", views.query_metrics, name="metrics"),
+    path("api/lounges", api.lounges, name="api-lounges"),
+    path("api/lounges/<int:lounge_id>", api.lounge_detail, name="api-lounge"),
+    path("api/lounges/<int:lounge_id>/availability", api.lounge_availability, name="api-lounge-availability"),
+    path("api/bookings", api.bookings, name="api-bookings"),
+    path("api/bookings/<int:booking_id>", api.booking_detail, name="api-booking"),
+    path("async/lounge-availability/<int:lounge_id>", async_views.lounge_availability, name="async-lounge-availability"),
+    path("async/api/bookings", async_views.bookings, name="async-api-bookings"),
 
 ]
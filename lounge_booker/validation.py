@@ -0,0 +1,30 @@
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .availability import booking_duration, is_open, minimum_guests, weekly_schedule
+
+
+def validate_booking(lounge, table, date, total_guests, allow_past=False):
+    """Check a booking against the lounge's rules, raising ValidationError.
+
+    Covers everything except clashes with other bookings, which callers
+    check in whatever way suits them: one query per form, one per batch for
+    an import. ``allow_past`` lets historical bookings through.
+    """
+    if total_guests is not None:
+        if table is not None and total_guests > table.capacity:
+            raise ValidationError({"total_guests": [f"The maximum table capacity is {table.capacity}"]})
+
+        if total_guests < 1:
+            raise ValidationError({"total_guests": ["Please choose a valid number of guests for your order."]})
+
+        min_guest = minimum_guests(lounge)
+        if total_guests < min_guest:
+            raise ValidationError({"total_guests": [f"The minimum guests per booking is: {min_guest}"]})
+
+    if date:
+        if not allow_past and date < timezone.now():
+            raise ValidationError({"date": ["Please choose a date and time that is in the future, thank you."]})
+
+        if not is_open(weekly_schedule(lounge), date, booking_duration(lounge)):
+            raise ValidationError({"date": ["The lounge is closed at that time, please choose another."]})
@@ -1,29 +1,57 @@
+import datetime
+
 from django.contrib import messages
-from django.contrib.auth import authenticate, login, logout
+from django.contrib.auth import login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.forms import AuthenticationForm
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect, get_object_or_404
-from .models import Lounge, Booking
-from .forms import UserForm, BookingForm
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from .availability import book_table, booking_duration, free_slots, is_resubmission, minimum_guests
+from .catalogue import catalogue_version, lounge_catalogue
+from .models import Lounge, Booking, BookingSeries
+from .forms import UserForm, BookingForm, BookingSeriesForm, LoungeSearchForm, WaitlistForm, lounge_for_booking
+from .middleware import prometheus_text
+from .pagination import keyset_page
+from .search import search_lounges
+from .series import delete_series, save_series
+from .tasks import enqueue
+from .throttle import allow_attempt
+from .waitlist import cancel_booking
+
+MAX_AVAILABILITY_DAYS = 31
+TOO_MANY_ATTEMPTS = "Too many attempts, please wait a minute and try again."
 
 def home_page(request):
     if not request.user.is_authenticated:
         return redirect("lounge_booker:login")
     
-    context = {"lounges": Lounge.objects.all()}
+    search_form = LoungeSearchForm(request.GET or None)
+    if search_form.is_valid() and any(search_form.cleaned_data.values()):
+        context = {"lounges": search_lounges(**search_form.cleaned_data)}
+    else:
+        # Only loaded if the list rendered for this version is not cached.
+        context = {"lounges": SimpleLazyObject(lounge_catalogue), "catalogue_version": catalogue_version()}
+    context["search_form"] = search_form
     return render(request, "home.html", context=context)
 
 
 def login_page(request):
     if request.method == "POST":
+        if not allow_attempt(request, request.POST.get("username", "")):
+            messages.error(request, TOO_MANY_ATTEMPTS)
+            return render(request, "login.html", context={"login_form": AuthenticationForm()}, status=429)
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get("username")
-            password = form.cleaned_data.get("password")   
-            user = authenticate(username=username, password=password) 
-            if user is not None:
-                login(request, user)
-                messages.info(request, f"Hello {username}, you are now logged in.")
-                return redirect("lounge_booker:home")
+            # is_valid() has authenticated the user already; doing it again
+            # would hash the password a second time.
+            user = form.get_user()
+            login(request, user)
+            messages.info(request, f"Hello {user.get_username()}, you are now logged in.")
+            return redirect("lounge_booker:home")
         else:
             messages.error(request, "Invalid username or password, please try again.")
     form = AuthenticationForm()
@@ -33,6 +61,9 @@ def login_page(request):
 
 def signup_page(request):
     if request.method == "POST":
+        if not allow_attempt(request):
+            messages.error(request, TOO_MANY_ATTEMPTS)
+            return render(request, "signup.html", context={"register_form": UserForm()}, status=429)
         form = UserForm(request.POST)
         if form.is_valid():
             user = form.save()
@@ -61,7 +92,7 @@ def book_lounge(request, lounge_id):
         return redirect("lounge_booker:login")
 
     try:
-        lounge = Lounge.objects.get(id=lounge_id)
+        lounge = lounge_for_booking().get(id=lounge_id)
     except Lounge.DoesNotExist:
         lounge = None
 
@@ -71,12 +102,30 @@ def book_lounge(request, lounge_id):
     
     if request.method == "POST":
         form = BookingForm(lounge, request.POST)
+        booked = False
          
         if form.is_valid():
             booking = form.save(commit=False)
             booking.user = request.user
             booking.lounge = lounge
-            booking.save()
+            booking.idempotency_key = form.cleaned_data["idempotency_key"] or None
+            try:
+                with transaction.atomic():
+                    if book_table(booking, booking_duration(lounge), form.submitted("table") is None) is booking:
+                        enqueue("booking_confirmation", booking=booking.pk, action="booked")
+                booked = True
+            except ValidationError as error:
+                form.add_error(None, error)
+                form.renew_key()
+        else:
+            # A resubmitted form fails validation against its own first
+            # booking; one sent back with other details gets its errors.
+            booked = is_resubmission(
+                request.user, form.data.get("idempotency_key"),
+                *(form.submitted(name) for name in ("table", "date", "total_guests")),
+            )
+
+        if booked:
             messages.info(request, f"You have succesfully booked with {lounge}. Enjoy!")
             return redirect("lounge_booker:home")
     
@@ -86,24 +135,187 @@ def book_lounge(request, lounge_id):
     return render(request=request, template_name="book_lounge.html", context={"booking_form": form, "lounge": lounge},)
 
 
+def book_series(request, lounge_id):
+    if not request.user.is_authenticated:
+        return redirect("lounge_booker:login")
+
+    try:
+        lounge = lounge_for_booking().get(id=lounge_id)
+    except Lounge.DoesNotExist:
+        messages.error(request, "This lounge is not available, please select another.")
+        return redirect("lounge_booker:home")
+
+    if request.method == "POST":
+        form = BookingSeriesForm(lounge, request.POST)
+        if form.is_valid():
+            series = form.save(commit=False)
+            series.user = request.user
+            series.lounge = lounge
+            try:
+                bookings = save_series(series, form.dates, booking_duration(lounge))
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                messages.info(request, f"You have succesfully booked {len(bookings)} visits to {lounge}. Enjoy!")
+                return redirect("lounge_booker:my-bookings")
+    else:
+        form = BookingSeriesForm(lounge)
+
+    return render(request, "booking_series.html", context={"series_form": form, "lounge": lounge})
+
+
+def update_series(request, series_id):
+    if not request.user.is_authenticated:
+        return redirect("lounge_booker:login")
+
+    series = get_object_or_404(
+        BookingSeries.objects.select_related("lounge__setting").prefetch_related("lounge__tables"),
+        pk=series_id, user=request.user,
+    )
+
+    if request.method == "POST":
+        form = BookingSeriesForm(series.lounge, request.POST, instance=series)
+        if form.is_valid():
+            try:
+                save_series(form.save(commit=False), form.dates, booking_duration(series.lounge))
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                messages.info(request, f"Thank you, you have successfully updated your bookings with {series.lounge.name}")
+                return redirect("lounge_booker:my-bookings")
+    else:
+        form = BookingSeriesForm(series.lounge, instance=series)
+
+    return render(request, "booking_series.html", context={"series_form": form, "lounge": series.lounge})
+
+
+def cancel_series(request, series_id):
+    if not request.user.is_authenticated:
+        return redirect("lounge_booker:login")
+
+    series = get_object_or_404(BookingSeries.objects.select_related("lounge__setting"), pk=series_id, user=request.user)
+
+    if request.method == "POST":
+        delete_series(series)
+        return redirect("lounge_booker:my-bookings")
+
+    return render(request, "delete_series.html", context={"series": series})
+
+
+def join_waitlist(request, lounge_id):
+    if not request.user.is_authenticated:
+        return redirect("lounge_booker:login")
+
+    try:
+        lounge = lounge_for_booking().get(id=lounge_id)
+    except Lounge.DoesNotExist:
+        messages.error(request, "This lounge is not available, please select another.")
+        return redirect("lounge_booker:home")
+
+    if request.method == "POST":
+        form = WaitlistForm(lounge, request.POST)
+        if form.is_valid():
+            entry = form.save(commit=False)
+            entry.user = request.user
+            entry.lounge = lounge
+            entry.save()
+            messages.info(request, f"You are on the waitlist for {lounge}. We will book you a table if one frees up.")
+            return redirect("lounge_booker:home")
+    else:
+        form = WaitlistForm(lounge)
+
+    return render(request, "join_waitlist.html", context={"waitlist_form": form, "lounge": lounge})
+
+
+
+def lounge_availability(request, lounge_id):
+    if not request.user.is_authenticated:
+        return redirect("lounge_booker:login")
+
+    lounge = get_object_or_404(Lounge.objects.select_related("setting"), id=lounge_id)
+    payload, status = availability_payload(lounge, request.GET)
+    return JsonResponse(payload, status=status)
+
+
+def availability_payload(lounge, params):
+    """ The free slots body for lounge_availability and its async twin, plus its status code """
+    try:
+        first_day, last_day, guests = availability_range(params)
+    except ValueError:
+        return {"error": "Please use YYYY-MM-DD dates and a whole number of guests."}, 400
+
+    if last_day < first_day or (last_day - first_day).days >= MAX_AVAILABILITY_DAYS:
+        return {"error": f"Please choose a range of up to {MAX_AVAILABILITY_DAYS} days."}, 400
+
+    min_guest = minimum_guests(lounge)
+    if guests is not None and guests < min_guest:
+        return {"error": f"The minimum guests per booking is: {min_guest}"}, 400
+
+    duration = booking_duration(lounge)
+    slots = [
+        {
+            "table": table.id,
+            "name": table.name,
+            "capacity": table.capacity,
+            "start": slot.isoformat(),
+            "end": (slot + duration).isoformat(),
+        }
+        for table, slot in free_slots(lounge, first_day, last_day, guests)
+    ]
+    return {
+        "lounge": lounge.id,
+        "start": first_day.isoformat(),
+        "end": last_day.isoformat(),
+        "duration": int(duration.total_seconds() // 60),
+        "slots": slots,
+    }, 200
+
+
+def availability_range(params):
+    """ ``(first_day, last_day, guests)`` asked for in ``params``; ValueError if malformed """
+    start = params.get("start")
+    first_day = datetime.date.fromisoformat(start) if start else timezone.localdate()
+    end = params.get("end")
+    last_day = datetime.date.fromisoformat(end) if end else first_day + datetime.timedelta(days=6)
+    guests = int(params["guests"]) if params.get("guests") else None
+    return first_day, last_day, guests
 
 
 def my_bookings(request):
     if not request.user.is_authenticated:
         return redirect("lounge_booker:login")
 
-    context = {"bookings": Booking.objects.filter(user=request.user)} 
-    return render(request, "my_bookings.html", context=context) 
+    upcoming = request.GET.get("when") != "past"
+    bookings = (
+        Booking.objects.filter(user=request.user)
+        .select_related("lounge", "table")
+        .only("date", "series_id", "modified_at", "lounge__name", "lounge__modified_at", "table__name", "table__modified_at")
+    )
+    if upcoming:
+        bookings = bookings.filter(date__gte=timezone.now())
+    else:
+        bookings = bookings.filter(date__lt=timezone.now())
+
+    page, next_cursor = keyset_page(bookings, request.GET.get("cursor"), descending=not upcoming)
+    # Everything a row shows; series_id is in there because detaching a
+    # series uses an UPDATE, which leaves modified_at alone.
+    rows_version = [
+        (booking.pk, booking.modified_at, booking.series_id, booking.lounge.modified_at, booking.table.modified_at)
+        for booking in page
+    ]
+    context = {"bookings": page, "upcoming": upcoming, "next_cursor": next_cursor, "rows_version": rows_version}
+    return render(request, "my_bookings.html", context=context)
 
 
 def delete_booking(request, booking_id):
     if not request.user.is_authenticated:
         return redirect("lounge_booker:login")
 
-    booking = get_object_or_404(Booking, pk=booking_id)
+    booking = get_object_or_404(Booking.objects.select_related("lounge__setting"), pk=booking_id)
 
     if request.method == "POST":
-        booking.delete()
+        # Anyone waiting for this table and time gets it straight away.
+        cancel_booking(booking)
         return redirect("lounge_booker:my-bookings")
 
     return render(request, "delete_booking.html", context={"booking": booking})
@@ -114,19 +326,31 @@ def update_booking(request, booking_id):
         return redirect("lounge_booker:login")
 
     
-    booking = get_object_or_404(Booking, pk=booking_id)
-
-    booking_form = {"booking_form": BookingForm(booking.lounge, instance=booking)}
+    booking = get_object_or_404(
+        Booking.objects.select_related("lounge__setting").prefetch_related("lounge__tables"),
+        pk=booking_id,
+    )
 
     if request.method == "POST":
         form = BookingForm(booking.lounge, request.POST, instance=booking)
 
         if form.is_valid():
-            form.save()
-            messages.info(request, f"Thank you, you have successfully updated your booking with {booking.lounge.name}")
-            return redirect("lounge_booker:my-bookings")
+            try:
+                with transaction.atomic():
+                    book_table(form.save(commit=False), booking_duration(booking.lounge))
+                    enqueue("booking_confirmation", booking=booking.pk, action="updated")
+            except ValidationError as error:
+                form.add_error(None, error)
+            else:
+                messages.info(request, f"Thank you, you have successfully updated your booking with {booking.lounge.name}")
+                return redirect("lounge_booker:my-bookings")
 
-    return render(request, "update_booking.html", context=booking_form)
+    else:
+        form = BookingForm(booking.lounge, instance=booking)
 
+    return render(request, "update_booking.html", context={"booking_form": form})
 
 
+@staff_member_required
+def query_metrics(request):
+    return HttpResponse(prometheus_text(), content_type="text/plain; version=0.0.4")
@@ -0,0 +1,73 @@
+"""Hands a cancelled booking's table to the best party on the waitlist."""
+from django.db import transaction
+from django.utils import timezone
+
+from .availability import booking_duration, is_table_free, minimum_guests
+from .models import Booking, Table, WaitlistEntry
+from .tasks import enqueue
+
+# Waiting parties considered per cancellation; only ones that want a
+# nearby time and fit the table are fetched at all.
+MATCH_CANDIDATES = 20
+
+
+def waiting_parties(lounge, table, start, duration):
+    """Pending entries that could use ``table`` around ``start``, best first.
+
+    Best means the largest party the table seats, then the longest waiting.
+    The partial ``waitlist_pending_idx`` narrows the lookup to this lounge's
+    waiters within one booking length of ``start``, so the ordering only
+    ever sorts that handful, never the whole waitlist. Rows another
+    cancellation has already locked are skipped rather than waited on.
+    """
+    return (
+        WaitlistEntry.objects.select_for_update(skip_locked=True)
+        .filter(
+            lounge=lounge,
+            fulfilled_at__isnull=True,
+            date__gt=max(start - duration, timezone.now()),
+            date__lt=start + duration,
+            total_guests__gte=minimum_guests(lounge),
+            total_guests__lte=table.capacity,
+        )
+        .order_by("-total_guests", "created_at")[:MATCH_CANDIDATES]
+    )
+
+
+def cancel_booking(booking):
+    """Delete ``booking`` and rebook its table for a waiting party.
+
+    Runs in one transaction holding the same table lock as ``book_table``,
+    so the freed slot cannot be taken by anyone else before the waitlist
+    has had it. Returns the new booking, or ``None`` if nobody fitted.
+    """
+    lounge = booking.lounge
+    duration = booking_duration(lounge)
+    with transaction.atomic():
+        table = Table.objects.select_for_update().get(pk=booking.table_id)
+        start = booking.date
+        booking.delete()
+        if start <= timezone.now():
+            return None
+        return refill(lounge, table, start, duration)
+
+
+def refill(lounge, table, start, duration):
+    """Book ``table``, just freed at ``start``, for the best waiting party.
+
+    The caller holds the table's lock and has checked that nothing else
+    holds ``start``. Returns the new booking, or ``None`` if nobody fitted.
+    """
+    for entry in waiting_parties(lounge, table, start, duration):
+        # Other times than the freed one may still clash with a neighbouring booking.
+        if entry.date != start and not is_table_free(table, entry.date, duration):
+            continue
+        replacement = Booking.objects.create(
+            user_id=entry.user_id, lounge=lounge, table=table, date=entry.date, total_guests=entry.total_guests,
+        )
+        entry.booking = replacement
+        entry.fulfilled_at = timezone.now()
+        entry.save(update_fields=["booking", "fulfilled_at", "modified_at"])
+        enqueue("booking_confirmation", booking=replacement.pk, action="been given")
+        return replacement
+    return None
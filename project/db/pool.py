@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """A bounded set of open database connections shared by a process's threads.
+
+    At most ``size`` connections exist at once. ``get`` hands out an idle one
+    when there is one, opens a new one while under the limit, and otherwise
+    waits up to ``timeout`` seconds for another thread to give one back.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._idle = []
+        self._open = 0
+        self._available = threading.Condition()
+
+    def get(self, connect):
+        """Borrow a connection, calling ``connect()`` if a new one is needed."""
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            while not self._idle and self._open >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"No database connection became free within {self.timeout}s "
+                        f"(pool size {self.size})."
+                    )
+                self._available.wait(remaining)
+            if self._idle:
+                # most recently returned first: it is the least likely to have gone stale
+                return self._idle.pop()
+            self._open += 1
+
+        try:
+            return connect()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def put(self, connection):
+        """Return a healthy connection for reuse."""
+        with self._available:
+            self._idle.append(connection)
+            self._available.notify()
+
+    def discard(self, connection):
+        """Close a broken connection and free its place in the pool."""
+        try:
+            connection.close()
+        except Exception:
+            pass
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def close_idle(self):
+        """Close every idle connection, e.g. before the database goes away."""
+        with self._available:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self.discard(connection)
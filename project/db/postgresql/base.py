@@ -0,0 +1,126 @@
+"""PostgreSQL backend with connection health checks and an optional
+process-wide connection pool.
+
+It reads three extra keys from ``DATABASES[alias]["OPTIONS"]``. They are
+stripped before the rest is passed to psycopg2:
+
+``HEALTH_CHECKS``
+    Ping a reused or pooled connection with ``SELECT 1`` before its first
+    query in each request. A connection the server dropped is then replaced
+    instead of failing the request.
+``POOL_SIZE``
+    Keep up to this many connections open for the whole process and lend
+    them to threads as they need one; ``0`` (the default) disables pooling.
+    Needs ``CONN_MAX_AGE`` 0, so each request hands its connection back
+    instead of its thread keeping it while idle.
+``POOL_TIMEOUT``
+    Seconds a thread waits for a free pooled connection before the query
+    fails with ``OperationalError``.
+"""
+import functools
+import threading
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from project.db.pool import ConnectionPool, PoolTimeout
+
+BACKEND_OPTIONS = ("HEALTH_CHECKS", "POOL_SIZE", "POOL_TIMEOUT")
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        if self.settings_dict["OPTIONS"].get("POOL_SIZE") and self.settings_dict["CONN_MAX_AGE"] != 0:
+            raise ImproperlyConfigured(
+                f"Database {self.alias!r} has a POOL_SIZE, so its CONN_MAX_AGE must be 0: "
+                "idle threads would otherwise keep pooled connections from the others."
+            )
+
+    @property
+    def pool(self):
+        options = self.settings_dict["OPTIONS"]
+        if not options.get("POOL_SIZE"):
+            return None
+        # Keyed by NAME too, so the test database gets a pool of its own.
+        key = (self.alias, self.settings_dict["NAME"])
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = ConnectionPool(options["POOL_SIZE"], options.get("POOL_TIMEOUT", 5))
+            return _pools[key]
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for key in BACKEND_OPTIONS:
+            params.pop(key, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        try:
+            connection = pool.get(functools.partial(super().get_new_connection, conn_params))
+        except PoolTimeout as error:
+            raise base.Database.OperationalError(str(error))
+        # Only set by the parent when it opens a connection, not on reuse.
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def connect(self):
+        # Django's connect() reaches ensure_connection() via set_autocommit();
+        # don't ping from there, halfway through setting the connection up.
+        self.health_check_done = True
+        super().connect()
+        if self.pool is None or not self.settings_dict["OPTIONS"].get("HEALTH_CHECKS"):
+            return
+        # A pooled connection may have sat idle until the server dropped it,
+        # so ping it before its first query. Each stale one is discarded; if
+        # every idle connection had gone, the last try is a new one.
+        for _ in range(self.pool.size):
+            if self.is_usable():
+                return
+            self.errors_occurred = True
+            self.close()
+            super().connect()
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+
+        connection = self.connection
+        try:
+            if not connection.closed and connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+            healthy = not connection.closed and not self.errors_occurred
+        except base.Database.Error:
+            healthy = False
+        if healthy:
+            pool.put(connection)
+        else:
+            pool.discard(connection)
+
+    def close_if_unusable_or_obsolete(self):
+        # Django calls this as every request starts and finishes.
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and not self.health_check_done
+            and self.settings_dict["OPTIONS"].get("HEALTH_CHECKS")
+        ):
+            if not self.is_usable():
+                self.errors_occurred = True
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
@@ -0,0 +1,15 @@
+"""Password hashers whose cost is set in settings rather than in code."""
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """Django's PBKDF2-SHA256 hasher run for ``PASSWORD_HASH_ITERATIONS`` rounds.
+
+    Hashes made with any other count still verify, and are redone with the
+    configured one when their user next logs in.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERATIONS
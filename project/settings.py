@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -53,6 +55,7 @@ NOSE_ARGS = [
 
 
 MIDDLEWARE = [
+    "lounge_booker.middleware.QueryStatsMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,11 +65,23 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Fraction of requests whose SQL and template rendering are counted and
+# timed per view and served at /metrics; 0 takes QueryStatsMiddleware out
+# of the stack entirely.
+QUERY_STATS_SAMPLE_RATE = float(os.environ.get("QUERY_STATS_SAMPLE_RATE", "0"))
+
+# Booking confirmations are sent by the run_tasks worker, not the request.
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.console.EmailBackend")
+EMAIL_HOST = os.environ.get("EMAIL_HOST", "localhost")
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", "bookings@loungebooker.local")
+
 ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing renders for the query stats middleware.
+        'BACKEND': 'lounge_booker.middleware.TimedDjangoTemplates',
+        'NAME': 'django',
          "DIRS": [os.path.join(BASE_DIR, "lounge_booker/template/lounge_booker")],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -80,24 +95,144 @@ TEMPLATES = [
     },
 ]
 
+# Templates are parsed again for every render above. The production
+# profile, project/settings_production.py, uses these instead: each is read
+# and compiled once per process and reused for every render after that.
+# Restart the process to pick up template changes.
+PRODUCTION_TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        "APP_DIRS": False,
+        "OPTIONS": {
+            **TEMPLATES[0]["OPTIONS"],
+            "debug": False,
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
+        },
+    },
+]
+
+
 WSGI_APPLICATION = 'project.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
+#
+# CONN_MAX_AGE keeps each worker thread's connection open between requests
+# for that many seconds. Alternatively DATABASE_POOL_SIZE shares a bounded
+# pool of connections between all of a process's threads. Every request
+# must then hand its connection back to the pool when it finishes, so
+# CONN_MAX_AGE defaults to 0 with a pool and the backend refuses any other
+# value.
+
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "0"))
 
 DATABASES = {
     'default': {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
-        "NAME": "lounge_booker_db",
-        "USER": "postgres",
-        "PASSWORD": "admin",
-        "HOST": "localhost",
-        "PORT": "5432",
+        "ENGINE": "project.db.postgresql",
+        "NAME": os.environ.get("DATABASE_NAME", "lounge_booker_db"),
+        "USER": os.environ.get("DATABASE_USER", "postgres"),
+        "PASSWORD": os.environ.get("DATABASE_PASSWORD", "admin"),
+        "HOST": os.environ.get("DATABASE_HOST", "localhost"),
+        "PORT": os.environ.get("DATABASE_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", "0" if DATABASE_POOL_SIZE else "60")),
+        "OPTIONS": {
+            "HEALTH_CHECKS": os.environ.get("DATABASE_HEALTH_CHECKS", "1") == "1",
+            "POOL_SIZE": DATABASE_POOL_SIZE,
+            "POOL_TIMEOUT": float(os.environ.get("DATABASE_POOL_TIMEOUT", "5")),
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# A local-memory cache is private to each process; point CACHE_BACKEND and
+# CACHE_LOCATION at memcached to share one between processes.
+LOCAL_CACHE_BACKEND = "django.core.cache.backends.locmem.LocMemCache"
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", LOCAL_CACHE_BACKEND)
+
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.environ.get("CACHE_LOCATION", "lounge-booker"),
+    },
+    # Rendered fragments from the templates' {% cache %} tags. A shared
+    # cache is split from "default" by KEY_PREFIX, so it needs no location
+    # of its own.
+    "templates": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.environ.get(
+            "TEMPLATE_CACHE_LOCATION",
+            "lounge-booker-templates" if CACHE_BACKEND == LOCAL_CACHE_BACKEND else os.environ.get("CACHE_LOCATION"),
+        ),
+        "KEY_PREFIX": "templates",
+    },
+}
+
+
+# Sessions
+# https://docs.djangoproject.com/en/3.0/topics/http/sessions/
+#
+# cached_db serves sessions from the cache and reads the database only on
+# a miss; a session is written, to both, only when it changes. It needs a
+# cache every process shares: with a local-memory cache, a logout in one
+# process would leave the session cached, and signed in, in the others. So
+# it is the default only when CACHE_BACKEND is set to a shared cache, and
+# "django.contrib.sessions.backends.db" otherwise. Use
+# "django.contrib.sessions.backends.signed_cookies" to keep sessions out of
+# the database altogether. ``manage.py purge_sessions`` removes expired rows.
+
+CACHED_SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.db" if CACHE_BACKEND == LOCAL_CACHE_BACKEND else CACHED_SESSION_ENGINE,
+)
+if SESSION_ENGINE == CACHED_SESSION_ENGINE and CACHE_BACKEND == LOCAL_CACHE_BACKEND:
+    raise ImproperlyConfigured("SESSION_ENGINE=cached_db needs CACHE_BACKEND to be a cache shared between processes.")
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/3.0/topics/auth/passwords/
+#
+# New passwords are hashed with PASSWORD_HASHER. The rest of the list only
+# verifies older hashes, which are redone with PASSWORD_HASHER (and the
+# current PASSWORD_HASH_ITERATIONS) when their user next logs in. The
+# Argon2 and bcrypt hashers need argon2-cffi and bcrypt installed.
+
+PASSWORD_HASHER = os.environ.get("PASSWORD_HASHER", "project.hashers.PBKDF2PasswordHasher")
+PASSWORD_HASH_ITERATIONS = int(os.environ.get("PASSWORD_HASH_ITERATIONS", "216000"))
+PASSWORD_HASHERS = [PASSWORD_HASHER] + [
+    hasher for hasher in (
+        "project.hashers.PBKDF2PasswordHasher",
+        "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+        "django.contrib.auth.hashers.Argon2PasswordHasher",
+        "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    )
+    if hasher != PASSWORD_HASHER
+]
+
+# Login and signup attempts allowed per client address: a burst of
+# LOGIN_BURST, refilled at LOGIN_RATE a minute. Attempts on one username
+# have their own, larger, allowance, so it takes several addresses to lock
+# an account. Counted in each process's memory. Behind reverse proxies REMOTE_ADDR is the proxy's, so set
+# TRUSTED_PROXY_COUNT to how many of them append to X-Forwarded-For and the
+# client's address is read from there. Never set it without such proxies:
+# clients could then pick their own address.
+
+LOGIN_BURST = int(os.environ.get("LOGIN_BURST", "10"))
+LOGIN_RATE = float(os.environ.get("LOGIN_RATE", "5"))
+LOGIN_USERNAME_BURST = int(os.environ.get("LOGIN_USERNAME_BURST", "30"))
+LOGIN_USERNAME_RATE = float(os.environ.get("LOGIN_USERNAME_RATE", "15"))
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "0"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -0,0 +1,22 @@
+"""Settings for production: ``DJANGO_SETTINGS_MODULE=project.settings_production``.
+
+Everything not set here comes from settings.py and the environment
+variables it reads.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import PRODUCTION_TEMPLATES
+
+DEBUG = False
+
+# Never fall back to the development key committed in settings.py.
+SECRET_KEY = os.environ.get("SECRET_KEY")
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set the SECRET_KEY environment variable.")
+
+ALLOWED_HOSTS = [host for host in os.environ.get("ALLOWED_HOSTS", "").split(",") if host]
+
+TEMPLATES = PRODUCTION_TEMPLATES